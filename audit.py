@@ -0,0 +1,164 @@
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import threading
+from datetime import datetime
+
+# Audit trail for the whole system.
+#
+# Callers only put a record on a queue (logging.handlers.QueueHandler); one
+# background thread takes everything that has queued up, writes it as JSON
+# lines and flushes once per batch. Files rotate by size, or by time if
+# AMS_LOG_ROTATE_WHEN is set (e.g. "midnight"), and the queue is drained on exit.
+#
+#   {"time": "...", "event": "update", "message": "...", "sn": "ABC1", "id": 7,
+#    "field": "LOCATION", "old": "HQ", "new": "ANNEX"}
+
+ASSETS_LOG = 'assets.log'
+USERS_LOG = 'activity.log'
+
+MAX_BYTES = int(os.environ.get('AMS_LOG_MAX_BYTES', 10 * 1024 * 1024))
+BACKUP_COUNT = int(os.environ.get('AMS_LOG_BACKUPS', 5))
+ROTATE_WHEN = os.environ.get('AMS_LOG_ROTATE_WHEN')
+
+# Most records written between two flushes
+BATCH_SIZE = 1000
+
+# Record attributes that are copied into the JSON line when set
+FIELDS = ('user', 'sn', 'id', 'field', 'old', 'new', 'query', 'count')
+
+_STOP = object()
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created).isoformat(timespec='milliseconds'),
+            'level': record.levelname,
+            'event': getattr(record, 'event', None),
+            'message': record.getMessage(),
+        }
+        for field in FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                entry[field] = value
+        return json.dumps(entry)
+
+
+class _BatchingMixin:
+    # Write without flushing; the writer thread flushes once per batch
+    def emit(self, record):
+        try:
+            if self.shouldRollover(record):
+                self.doRollover()
+            if self.stream is None:
+                self.stream = self._open()
+            self.stream.write(self.format(record) + self.terminator)
+        except Exception:
+            self.handleError(record)
+
+
+class BatchingRotatingFileHandler(_BatchingMixin, logging.handlers.RotatingFileHandler):
+    pass
+
+
+class BatchingTimedRotatingFileHandler(_BatchingMixin, logging.handlers.TimedRotatingFileHandler):
+    pass
+
+
+def _file_handler(path):
+    if ROTATE_WHEN:
+        handler = BatchingTimedRotatingFileHandler(path, when=ROTATE_WHEN, backupCount=BACKUP_COUNT)
+    else:
+        handler = BatchingRotatingFileHandler(path, maxBytes=MAX_BYTES, backupCount=BACKUP_COUNT)
+    handler.setFormatter(JsonFormatter())
+    return handler
+
+
+class AuditWriter(threading.Thread):
+    def __init__(self, records, handlers):
+        super().__init__(name='audit-writer', daemon=True)
+        self.records = records
+        self.handlers = handlers
+
+    def run(self):
+        stopping = False
+        while not stopping:
+            batch = [self.records.get()]
+            # Take whatever else is already waiting, up to BATCH_SIZE
+            while len(batch) < BATCH_SIZE:
+                try:
+                    batch.append(self.records.get_nowait())
+                except queue.Empty:
+                    break
+
+            for record in batch:
+                if record is _STOP:
+                    stopping = True
+                    continue
+                self.handlers[record.name].handle(record)
+            for handler in self.handlers.values():
+                handler.flush()
+
+        for handler in self.handlers.values():
+            handler.close()
+
+
+_lock = threading.Lock()
+_records = None
+_writer = None
+
+
+def _start():
+    global _records, _writer
+    with _lock:
+        if _writer is not None:
+            return
+        _records = queue.SimpleQueue()
+        handlers = {}
+        for name, path in (('ams.assets', ASSETS_LOG), ('ams.users', USERS_LOG)):
+            logger = logging.getLogger(name)
+            logger.setLevel(logging.INFO)
+            logger.propagate = False
+            logger.addHandler(logging.handlers.QueueHandler(_records))
+            handlers[name] = _file_handler(path)
+        _writer = AuditWriter(_records, handlers)
+        _writer.start()
+        atexit.register(shutdown)
+
+
+def shutdown():
+    # Write out everything still queued and close the files
+    global _records, _writer
+    with _lock:
+        if _writer is None:
+            return
+        _records.put(_STOP)
+        _writer.join()
+        for name in ('ams.assets', 'ams.users'):
+            logger = logging.getLogger(name)
+            for handler in list(logger.handlers):
+                logger.removeHandler(handler)
+        _records = None
+        _writer = None
+
+
+def _log(name, event, message, fields):
+    if _writer is None:
+        _start()
+    extra = {'event': event}
+    extra.update((key, value) for key, value in fields.items() if value is not None)
+    logging.getLogger(name).info(message, extra=extra)
+
+
+def asset_event(event, message, **fields):
+    # fields: sn, id, field, old, new, query, count
+    _log('ams.assets', event, message, fields)
+
+
+def user_event(event, message, **fields):
+    # fields: user
+    _log('ams.users', event, message, fields)
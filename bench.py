@@ -0,0 +1,272 @@
+import argparse
+import builtins
+import contextlib
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from unittest import mock
+
+# Benchmarks for the console operations at several inventory sizes.
+#
+#   python bench.py --sizes 1000 10000 100000 --output bench_results.json
+#   python bench.py --sizes 100000 --compare bench_results.json
+#
+# Every size runs in its own process, in a scratch directory filled by
+# datagen.py, so peak memory is per size and nothing touches the real
+# assets.csv. The AssetManagementSystem methods are driven exactly as the menu
+# calls them, with input() answered from a script and their output discarded
+# (spreadsheet and PDF viewers are not opened). For each operation the run
+# records latency percentiles, throughput and the peak Python allocation of
+# one call; for each size the load time and the process's peak RSS.
+
+SIZES = [1000, 10000, 100000]
+ITERATIONS = 50
+# PDF report and login (one password hash per call)
+HEAVY_ITERATIONS = 3
+USERS = 100
+
+# A p50 this much slower than the baseline is reported as a regression
+REGRESSION_RATIO = 1.2
+
+
+def percentile(sorted_values, fraction):
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+def summarize(latencies):
+    latencies = sorted(latencies)
+    total = sum(latencies)
+    return {
+        'iterations': len(latencies),
+        'mean_ms': round(total / len(latencies) * 1000, 3),
+        'p50_ms': round(percentile(latencies, 0.50) * 1000, 3),
+        'p95_ms': round(percentile(latencies, 0.95) * 1000, 3),
+        'p99_ms': round(percentile(latencies, 0.99) * 1000, 3),
+        'max_ms': round(latencies[-1] * 1000, 3),
+        'ops_per_second': round(len(latencies) / total, 1) if total else None,
+    }
+
+
+def peak_rss_bytes():
+    try:
+        import resource
+    except ImportError:  # Windows
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+@contextlib.contextmanager
+def scripted_input(answers):
+    # Answer input() prompts from answers, in order
+    answers = iter(answers)
+    original = builtins.input
+    builtins.input = lambda prompt='': next(answers)
+    try:
+        yield
+    finally:
+        builtins.input = original
+
+
+def measure(call, answers_for, iterations, quiet):
+    # answers_for(n) gives the input() answers for the n-th call
+    calls = iter(range(iterations + 2))
+
+    def run_once():
+        with scripted_input(answers_for(next(calls))), contextlib.redirect_stdout(quiet):
+            call()
+
+    run_once()  # warm-up: first-use indexes, imports, audit thread
+    latencies = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        run_once()
+        latencies.append(time.perf_counter() - start)
+
+    tracemalloc.start()
+    run_once()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    result = summarize(latencies)
+    result['peak_alloc_bytes'] = peak
+    return result
+
+
+def run_size(size, iterations, heavy_iterations, seed, hash_iterations):
+    # Benchmark one inventory size in a scratch directory; returns the results
+    import datagen
+
+    workdir = tempfile.mkdtemp(prefix=f'ams-bench-{size}-')
+    original_dir = os.getcwd()
+    os.chdir(workdir)
+    # read_assets opens the PDF with os.startfile; replace it for the run on
+    # every platform, so Windows does not open a viewer per iteration
+    no_viewer = mock.patch.object(os, 'startfile', lambda path: None, create=True)
+    no_viewer.start()
+    try:
+        datagen.write_assets('assets.csv', size, seed)
+        datagen.write_users('user_data.csv', USERS, hash_iterations=hash_iterations)
+
+        import main
+        from storage import open_backend
+
+        start = time.perf_counter()
+        backend = open_backend('csv')
+        ams = main.AssetManagementSystem(backend)
+        ams.store.refresh()
+        load_seconds = time.perf_counter() - start
+
+        rng = random.Random(seed)
+        rows = ams.store.rows()
+        # Separate assets for lookups, updates and deletes, so no call sees
+        # another's changes
+        picked = rng.sample(rows, min(len(rows), 3 * (iterations + 2)))
+        third = len(picked) // 3
+        lookups = [dict(row) for row in picked[:third]]
+        updates, deletes = picked[third:2 * third], picked[2 * third:]
+        user_manager = main.UserManager(backend)
+
+        def pick(rows, n):
+            return rows[n % len(rows)]
+
+        operations = [
+            ('create_asset', ams.create_asset, iterations,
+             lambda n: [f"BENCH-{n:08d}", 'LAPTOP', 'DELL LATITUDE 5440', 'HQ', '', 'BENCHMARK ASSET', 'BLACK', 'ACTIVE']),
+            ('search_sn', ams.search_assets, iterations,
+             lambda n: ['SN', pick(lookups, n)['SN']]),
+            ('search_query', ams.search_assets, iterations,
+             lambda n: ["CATEGORY={CATEGORY} AND LOCATION={LOCATION} AND ASSIGNEE={ASSIGNEE}".format(**pick(lookups, n))]),
+            ('update_asset', ams.update_asset, iterations,
+             lambda n: [pick(updates, n)['SN'], 'LOCATION', f"BENCH ROOM {n}"]),
+            ('read_terminal', ams.read_assets, iterations,
+             lambda n: ['3', 'N', 'N', 'Q']),
+            ('read_pdf', ams.read_assets, heavy_iterations,
+             lambda n: ['2', '']),
+            ('delete_asset', ams.delete_asset, iterations,
+             lambda n: [pick(deletes, n)['SN']]),
+        ]
+
+        results = {}
+        with open(os.devnull, 'w') as quiet:
+            for name, call, count, answers_for in operations:
+                results[name] = measure(call, answers_for, count, quiet)
+            results['login'] = measure(lambda: user_manager.login('user000001', datagen.DEFAULT_PASSWORD),
+                                       lambda n: [], heavy_iterations, quiet)
+
+        backend.close()
+        user_manager.executor.shutdown()
+        return {
+            'assets': size,
+            'load_seconds': round(load_seconds, 3),
+            'peak_rss_bytes': peak_rss_bytes(),
+            'operations': results,
+        }
+    finally:
+        no_viewer.stop()
+        os.chdir(original_dir)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+def run_all(args):
+    results = {
+        'time': datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'iterations': args.iterations,
+        'heavy_iterations': args.heavy_iterations,
+        'sizes': {},
+    }
+    for size in args.sizes:
+        print(f"Benchmarking {size} assets...", file=sys.stderr)
+        fd, result_path = tempfile.mkstemp(suffix='.json')
+        os.close(fd)
+        try:
+            subprocess.run([sys.executable, os.path.abspath(__file__), '--size', str(size), '--result', result_path,
+                            '--iterations', str(args.iterations), '--heavy-iterations', str(args.heavy_iterations),
+                            '--seed', str(args.seed)]
+                           + (['--hash-iterations', str(args.hash_iterations)] if args.hash_iterations else []),
+                           check=True)
+            with open(result_path) as result_file:
+                results['sizes'][str(size)] = json.load(result_file)
+        finally:
+            os.remove(result_path)
+    return results
+
+
+def print_summary(results, baseline=None):
+    from tabulate import tabulate
+    table = []
+    regressions = 0
+    for size, result in results['sizes'].items():
+        rss = result['peak_rss_bytes']
+        table.append([size, 'load', result['load_seconds'] * 1000, '', '', '', f"{rss / 2 ** 20:.1f} MB" if rss else ''])
+        for name, stats in result['operations'].items():
+            row = [size, name, stats['p50_ms'], stats['p95_ms'], stats['p99_ms'], stats['ops_per_second'],
+                   f"{stats['peak_alloc_bytes'] / 2 ** 20:.1f} MB"]
+            if baseline is not None:
+                old = baseline.get('sizes', {}).get(size, {}).get('operations', {}).get(name)
+                if old and old['p50_ms']:
+                    ratio = stats['p50_ms'] / old['p50_ms']
+                    flag = " SLOWER" if ratio > REGRESSION_RATIO else ""
+                    regressions += bool(flag)
+                    row.append(f"{ratio:.2f}x{flag}")
+                else:
+                    row.append('')
+            table.append(row)
+
+    headers = ['ASSETS', 'OPERATION', 'P50 MS', 'P95 MS', 'P99 MS', 'OPS/S', 'PEAK MEMORY']
+    if baseline is not None:
+        headers.append('P50 VS BASELINE')
+    print(tabulate(table, headers=headers, floatfmt='.2f'))
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Asset Management System at several inventory sizes.")
+    parser.add_argument('--sizes', type=int, nargs='+', default=SIZES, help="inventory sizes (default: 1000 10000 100000)")
+    parser.add_argument('--iterations', type=int, default=ITERATIONS, help="timed calls per operation")
+    parser.add_argument('--heavy-iterations', type=int, default=HEAVY_ITERATIONS,
+                        help="timed calls for the PDF report and login")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--hash-iterations', type=int, help="PBKDF2 work factor for the benchmark accounts")
+    parser.add_argument('--output', default='bench_results.json', help="where to save the results")
+    parser.add_argument('--compare', metavar='BASELINE', help="earlier results file to compare p50 latencies with")
+    # Internal: benchmark one size in this process
+    parser.add_argument('--size', type=int, help=argparse.SUPPRESS)
+    parser.add_argument('--result', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.size is not None:
+        result = run_size(args.size, args.iterations, args.heavy_iterations, args.seed, args.hash_iterations)
+        with open(args.result, 'w') as result_file:
+            json.dump(result, result_file)
+        return 0
+
+    baseline = None
+    if args.compare:
+        with open(args.compare) as baseline_file:
+            baseline = json.load(baseline_file)
+
+    results = run_all(args)
+    with open(args.output, 'w') as output:
+        json.dump(results, output, indent=2)
+    regressions = print_summary(results, baseline)
+    print(f"\nResults saved to '{args.output}'.")
+    if regressions:
+        print(f"{regressions} operations are more than {REGRESSION_RATIO:.1f}x slower than the baseline.")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,302 @@
+import json
+import os
+import threading
+from datetime import datetime, timezone
+
+import metrics
+from locking import FileLock
+from store import FIELDNAMES, StoreListener
+
+# Columns of a change feed exported as CSV; the asset's columns follow
+CHANGE_COLUMNS = ['SEQ', 'TIME', 'OP', 'FIELD', 'OLD']
+
+# Bytes read from the end of the feed to find the last sequence number
+TAIL_BYTES = 64 * 1024
+
+# A binary search over the feed reads the rest of the range line by line once
+# it is this small
+SCAN_BYTES = 4096
+
+
+def _now():
+    return datetime.now(timezone.utc).isoformat(timespec='microseconds')
+
+
+def parse_time(text):
+    # "2026-10-18", "2026-10-18T09:30" or with an offset -> the feed's UTC form.
+    # Times without an offset are local time.
+    moment = datetime.fromisoformat(text.strip().replace('Z', '+00:00'))
+    if moment.tzinfo is None:
+        moment = moment.astimezone()
+    return moment.astimezone(timezone.utc).isoformat(timespec='microseconds')
+
+
+def _record(line):
+    try:
+        record = json.loads(line)
+    except ValueError:
+        # A torn line from a crash mid-append
+        return None
+    return record if isinstance(record, dict) else None
+
+
+class ChangeFeed(StoreListener):
+    # Every create, update and delete made through an asset store, in order,
+    # as JSON lines in assets.changes.jsonl:
+    #
+    #   {"seq": 41, "time": "2026-10-18T09:30:00.123456+00:00", "op": "update",
+    #    "id": 7, "sn": "ABC1", "field": "LOCATION", "old": "HQ", "asset": {...}}
+    #
+    # "asset" is the whole asset after the change (before it, for a delete), so
+    # a downstream copy can apply each record as an upsert or delete by ID. An
+    # update of several fields gives one record per field.
+    #
+    # Sequence numbers go up by one across every process writing the same
+    # feed: the records of a write are appended in one go under an exclusive
+    # lock on the feed (assets.changes.jsonl.lock), numbered after the last
+    # record in the file. Times never go backwards either, so changes since a
+    # sequence number or a time are found with a binary search over the file
+    # and a sync reads only the new records.
+    #
+    # The records are appended before the store writes the change (see
+    # StoreListener.before_write), and the last seq whose write went through
+    # is kept in assets.changes.jsonl.confirmed once it has. Readers stop at
+    # that seq. Records past it are left by a write that crashed or failed
+    # in between: the next write or reload compares them with the store and
+    # appends records that undo whatever did not happen, so the feed never
+    # misses a change the store has.
+
+    def __init__(self, store, path='assets.changes.jsonl'):
+        self.store = store
+        self.path = path
+        self.confirmed_path = path + '.confirmed'
+        # Reentrant: settling the feed reads the store, which may reload
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(path + '.lock')
+        # (file size, last seq, last time) after our last append, so the tail
+        # is only read again when another process has appended since
+        self._tail = None
+        # (last seq, asset ID, asset as the write leaves it) of the write in
+        # progress, confirmed by on_commit
+        self._written = None
+        store.subscribe(self)
+
+    def on_reload(self):
+        # Called with the store's lock held, so no write is half done
+        # unless it was cut off
+        if self._unconfirmed():
+            with self._lock, self._file_lock.exclusive():
+                self._reconcile()
+
+    def before_write(self, changes):
+        records = []
+        for op, row, field, old_value in changes:
+            record = {'op': op, 'id': int(row['ID']), 'sn': row['SN']}
+            if op == 'update':
+                record.update(field=field, old=old_value)
+            record['asset'] = dict(row)
+            records.append(record)
+        with self._lock, self._file_lock.exclusive():
+            self._reconcile()
+            seq = self._append(records)
+        last = records[-1]
+        self._written = (seq, last['id'], None if last['op'] == 'delete' else last['asset'])
+
+    def on_commit(self):
+        if self._written is None:
+            return
+        seq, asset_id, expected = self._written
+        self._written = None
+        with self._lock:
+            if self.store.get_by_id(asset_id) == expected:
+                self._confirm(seq)
+            else:
+                # Those records were left by a write that raised; this commit
+                # is another one (a compaction)
+                with self._file_lock.exclusive():
+                    self._reconcile()
+
+    def _append(self, records):
+        # Append records under the feed lock; returns the last seq
+        with open(self.path, 'ab') as feed:
+            size = feed.seek(0, os.SEEK_END)
+            if self._tail is not None and self._tail[0] == size:
+                _, seq, last_time = self._tail
+            else:
+                seq, last_time, torn = self._read_tail(size)
+                if torn:
+                    # Keep the next record off the torn line
+                    feed.write(b'\n')
+
+            now = max(_now(), last_time)
+            lines = []
+            for record in records:
+                seq += 1
+                lines.append(json.dumps(dict({'seq': seq, 'time': now}, **record)))
+            data = ('\n'.join(lines) + '\n').encode()
+            feed.write(data)
+            self._tail = (feed.tell(), seq, now)
+        metrics.bytes_written(len(data))
+        return seq
+
+    def _reconcile(self):
+        # Under the feed lock, with the store's lock held: settle the records
+        # past the confirmed seq against the assets as the store has them
+        confirmed = self._read_confirmed()
+        seq = self.last_seq(confirmed_only=False)
+        if confirmed is not None and confirmed >= seq:
+            return
+        if confirmed is None:
+            # A new feed, or one from before confirmations: all of it stands
+            self._confirm(seq)
+            return
+
+        # The last record of each asset says what the write left it as
+        latest = {}
+        for record in self._changes(lambda record: record['seq'] > confirmed):
+            latest[record['id']] = None if record['op'] == 'delete' else record['asset']
+        undo = []
+        for asset_id, expected in latest.items():
+            actual = self.store.get_by_id(asset_id)
+            if actual == expected:
+                continue
+            if actual is None:
+                undo.append({'op': 'delete', 'id': asset_id, 'sn': expected['SN'], 'asset': expected})
+            elif expected is None:
+                undo.append({'op': 'create', 'id': asset_id, 'sn': actual['SN'], 'asset': dict(actual)})
+            else:
+                undo.extend({'op': 'update', 'id': asset_id, 'sn': actual['SN'], 'field': field,
+                             'old': expected.get(field, ''), 'asset': dict(actual)}
+                            for field in FIELDNAMES if actual[field] != expected.get(field, ''))
+        if undo:
+            seq = self._append(undo)
+        self._confirm(seq)
+
+    def _read_confirmed(self):
+        try:
+            with open(self.confirmed_path, 'r') as confirmed:
+                return int(confirmed.read())
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def _confirm(self, seq):
+        tmp_path = f"{self.confirmed_path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as confirmed:
+            confirmed.write(str(seq))
+        os.replace(tmp_path, self.confirmed_path)
+
+    def _unconfirmed(self):
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return False
+        if self._tail is not None and self._tail[0] == size:
+            seq = self._tail[1]
+        else:
+            seq = self._read_tail(size)[0]
+        confirmed = self._read_confirmed()
+        return confirmed is None or confirmed < seq
+
+    def _read_tail(self, size):
+        # (last seq, last time, whether the file ends mid-line)
+        if size == 0:
+            return 0, '', False
+        with open(self.path, 'rb') as feed:
+            feed.seek(max(0, size - TAIL_BYTES))
+            lines = feed.read(size).split(b'\n')
+        torn = lines[-1] != b''
+        for line in reversed(lines):
+            record = _record(line)
+            if record is not None:
+                return record['seq'], record['time'], torn
+        return 0, '', torn
+
+    def last_seq(self, confirmed_only=True):
+        try:
+            size = os.path.getsize(self.path)
+        except FileNotFoundError:
+            return 0
+        seq = self._read_tail(size)[0]
+        confirmed = self._read_confirmed() if confirmed_only else None
+        return seq if confirmed is None else min(seq, confirmed)
+
+    def changes(self, since_seq=None, since_time=None, limit=None):
+        # Records with a seq above since_seq and/or a time at or after
+        # since_time (see parse_time), oldest first
+        if since_seq is not None and since_time is not None:
+            reached = lambda record: record['seq'] > since_seq and record['time'] >= since_time
+        elif since_time is not None:
+            reached = lambda record: record['time'] >= since_time
+        else:
+            since_seq = since_seq or 0
+            reached = lambda record: record['seq'] > since_seq
+        return self._changes(reached, limit, self._read_confirmed())
+
+    def _changes(self, reached, limit=None, last_seq=None):
+        try:
+            feed = open(self.path, 'rb')
+        except FileNotFoundError:
+            return
+        with feed:
+            # Records appended from here on are left for the next sync
+            size = os.fstat(feed.fileno()).st_size
+            start = self._find(feed, size, reached)
+            feed.seek(start)
+            count = 0
+            try:
+                while feed.tell() < size and (limit is None or count < limit):
+                    record = _record(feed.readline())
+                    if record is None or not reached(record):
+                        continue
+                    if last_seq is not None and record['seq'] > last_seq:
+                        # Not confirmed (yet)
+                        break
+                    count += 1
+                    yield record
+            finally:
+                metrics.rows_scanned(count)
+                metrics.bytes_read(feed.tell() - start)
+
+    def _find(self, feed, size, reached):
+        # Offset of a line at or before the first record that satisfies
+        # reached, which holds from some record on to the end of the feed
+        low, high = 0, size
+        while high - low > SCAN_BYTES:
+            middle = (low + high) // 2
+            # To the start of the first line at or after middle
+            feed.seek(middle - 1)
+            feed.readline()
+            start = feed.tell()
+            record = None
+            while record is None and feed.tell() < high:
+                record = _record(feed.readline())
+            if record is None:
+                break
+            if reached(record):
+                high = start
+            else:
+                low = feed.tell()
+        return low
+
+
+def export_changes(records, out, fmt):
+    # Write change records as JSONL or CSV (one column per asset field,
+    # holding the asset as the change left it); returns (count, last seq)
+    count = 0
+    last_seq = None
+    if fmt == 'csv':
+        import csv
+        writer = csv.writer(out, lineterminator='\n')
+        writer.writerow(CHANGE_COLUMNS + FIELDNAMES)
+        for record in records:
+            asset = record['asset']
+            writer.writerow([record['seq'], record['time'], record['op'], record.get('field', ''),
+                             record.get('old', '')] + [asset.get(field, '') for field in FIELDNAMES])
+            count += 1
+            last_seq = record['seq']
+    else:
+        for record in records:
+            out.write(json.dumps(record) + '\n')
+            count += 1
+            last_seq = record['seq']
+    return count, last_seq
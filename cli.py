@@ -0,0 +1,361 @@
+import argparse
+import sys
+
+from store import FIELDNAMES, ConflictError
+
+# Non-interactive entry point: one command per run, no banner, no menus.
+#
+#   python cli.py create --sn ABC123 --category laptop --location hq
+#   python cli.py --format json search "CATEGORY=LAPTOP AND LOCATION=HQ"
+#   python cli.py find "dell latitude john" --limit 10
+#   python cli.py update ABC123 --set STATUS=RETIRED
+#   python cli.py delete --query "STATUS=RETIRED"
+#   python cli.py --format csv list --page 2 --page-size 50
+#   python cli.py export --output hq.pdf --query "LOCATION=HQ"
+#   python cli.py --format csv summary CATEGORY LOCATION
+#   python cli.py --profile search.pstats search "DESCRIPTION=DELL*"
+#   python cli.py --format csv changes --since 1200 --output delta.csv
+#
+# The global options (--format, --profile, --metrics) go before the command.
+# Every command loads the storage modules (the store, summary, change feed
+# and full-text index, with the query parser they use); tabulate, the
+# importer and the PDF writer are imported by the commands that use them, so
+# a cron job pays for nothing it does not run.
+
+
+class CommandError(Exception):
+    pass
+
+
+def log_activity(message, event=None, **fields):
+    # Same assets.log records as the console writes
+    import audit
+    audit.asset_event(event, message, **fields)
+
+
+def output_rows(rows, fmt, out=None, fieldnames=FIELDNAMES):
+    # out defaults to the sys.stdout of the call, so it can be redirected
+    out = out or sys.stdout
+    if fmt == 'json':
+        import json
+        json.dump([dict(row, ID=int(row['ID'])) for row in rows], out, indent=2)
+        out.write('\n')
+    elif fmt == 'jsonl':
+        import json
+        for row in rows:
+            out.write(json.dumps(dict(row, ID=int(row['ID']))) + '\n')
+    elif fmt == 'csv':
+        import csv
+        writer = csv.DictWriter(out, fieldnames=fieldnames, lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(rows)
+    else:
+        if not rows:
+            out.write("No assets found.\n")
+            return
+        from tabulate import tabulate
+        out.write(tabulate([[row[field] for field in fieldnames] for row in rows],
+                           headers=fieldnames, tablefmt="fancy_grid") + '\n')
+
+
+def output_message(args, message, **fields):
+    if args.format in ('json', 'jsonl'):
+        import json
+        print(json.dumps(dict(fields, message=message)))
+    else:
+        print(message)
+
+
+def parse_assignments(assignments):
+    changes = {}
+    for assignment in assignments:
+        field, sep, value = assignment.partition('=')
+        field = field.strip().upper()
+        if not sep or field not in FIELDNAMES or field == 'ID':
+            raise CommandError(f"Invalid assignment '{assignment}', expected FIELD=VALUE")
+        changes[field] = value.strip().upper()
+    return changes
+
+
+def select_serial_numbers(args, backend):
+    if args.query:
+        return [row['SN'] for row in backend.query_engine().search(args.query)]
+    return [sn.strip().upper() for sn in args.sn if sn.strip()]
+
+
+def cmd_create(args, backend):
+    from importer import normalize_asset
+    store = backend.assets
+    asset = normalize_asset({field: getattr(args, field.lower()) for field in FIELDNAMES[1:]})
+    if asset['SN'] == "":
+        raise CommandError("A serial number (--sn) is required")
+    if not store.is_serial_number_unique(asset['SN']):
+        raise CommandError(f"Serial number '{asset['SN']}' already exists")
+
+    row = store.add(asset)
+    log_activity(f"Asset '{row['SN']}' (ID: {row['ID']}) added successfully.",
+                 event='create', sn=row['SN'], id=int(row['ID']))
+    if args.format == 'table':
+        print(f"Asset '{row['SN']}' added successfully!")
+    else:
+        output_rows([row], args.format)
+
+
+def cmd_search(args, backend):
+    rows = backend.query_engine().search(args.query)
+    if args.limit:
+        rows = rows[:args.limit]
+    output_rows(rows, args.format)
+
+
+def cmd_find(args, backend):
+    from fulltext import FULLTEXT_LIMIT
+    results = backend.fulltext.search(args.text, args.limit or FULLTEXT_LIMIT)
+    output_rows([dict(row, SCORE=score) for row, score in results], args.format, fieldnames=FIELDNAMES + ['SCORE'])
+
+
+def cmd_list(args, backend):
+    import itertools
+    rows = backend.assets.iter_rows()
+    if args.sort:
+        column = args.sort.upper().lstrip('-')
+        if column not in FIELDNAMES:
+            raise CommandError(f"Unknown column '{column}'")
+        key = (lambda row: int(row['ID'])) if column == 'ID' else (lambda row: row[column])
+        rows = sorted(rows, key=key, reverse=args.sort.startswith('-'))
+    start = (args.page - 1) * args.page_size
+    output_rows(list(itertools.islice(rows, start, start + args.page_size)), args.format)
+
+
+def cmd_update(args, backend):
+    store = backend.assets
+    changes = parse_assignments(args.set)
+    serial_numbers = select_serial_numbers(args, backend)
+
+    if 'SN' in changes:
+        # A new serial number only makes sense for a single asset; it is
+        # written together with the other fields, in one change
+        if len(serial_numbers) != 1:
+            raise CommandError("SN can only be changed for one asset at a time")
+        result = store.update_fields(serial_numbers[0], changes)
+        if result is None:
+            raise CommandError(f"Asset '{serial_numbers[0]}' not found")
+        updated = [result]
+    else:
+        updated = store.update_many(serial_numbers, changes) if changes else []
+    for row, old_values in updated:
+        for field, old_value in old_values.items():
+            sn = old_values.get('SN', row['SN'])
+            log_activity(f"Asset '{sn}' (ID: {row['ID']}) - {field}: {old_value} - updated to {changes[field]}.",
+                         event='update', sn=sn, id=int(row['ID']), field=field, old=old_value, new=changes[field])
+
+    count = len(updated) if changes else len(serial_numbers)
+    output_message(args, f"{count} assets updated successfully!", updated=count)
+    if count == 0:
+        return 1
+
+
+def cmd_delete(args, backend):
+    deleted = backend.assets.delete_many(select_serial_numbers(args, backend))
+    for row in deleted:
+        log_activity(f"Asset '{row['SN']}' (ID: {row['ID']}) deleted successfully.",
+                     event='delete', sn=row['SN'], id=int(row['ID']))
+    output_message(args, f"{len(deleted)} assets deleted successfully!", deleted=len(deleted))
+    if not deleted:
+        return 1
+
+
+def cmd_import(args, backend):
+    from importer import import_assets
+
+    def log_added(rows):
+        for row in rows:
+            log_activity(f"Asset '{row['SN']}' (ID: {row['ID']}) added successfully.",
+                         event='create', sn=row['SN'], id=int(row['ID']))
+
+    added, rejected = import_assets(backend.assets, args.file, on_added=log_added)
+    log_activity(f"Imported {added} assets from '{args.file}', {len(rejected)} rejected.", event='import', count=added)
+    if args.format in ('json', 'jsonl'):
+        import json
+        print(json.dumps({'added': added,
+                          'rejected': [{'line': line, 'SN': sn, 'reason': reason} for line, sn, reason in rejected]}))
+    else:
+        print(f"{added} assets imported successfully!")
+        for line, sn, reason in rejected:
+            print(f"Line {line}: {sn} {reason}", file=sys.stderr)
+
+
+def cmd_export(args, backend):
+    rows = backend.query_engine().search(args.query) if args.query else backend.assets.iter_rows()
+    fmt = args.output_format or args.output.rsplit('.', 1)[-1].lower()
+    if fmt == 'pdf':
+        from report import build_report
+        pages = build_report(rows, args.output)
+        output_message(args, f"Wrote {pages} pages to '{args.output}'.", pages=pages)
+        return
+    if fmt not in ('csv', 'json', 'jsonl'):
+        raise CommandError(f"Unknown export format '{fmt}' (expected csv, json, jsonl or pdf)")
+    rows = list(rows)
+    with open(args.output, 'w', newline='') as out:
+        output_rows(rows, fmt, out)
+    output_message(args, f"Wrote {len(rows)} assets to '{args.output}'.", assets=len(rows))
+
+
+def cmd_summary(args, backend):
+    from summary import group_records, parse_fields
+    fields = parse_fields(args.fields)
+    groups = backend.summary.group_by(fields)
+    records = group_records(groups, fields)
+    if args.format == 'json':
+        import json
+        print(json.dumps({'by': fields, 'total': sum(count for _, count in groups), 'groups': records}, indent=2))
+    elif args.format == 'jsonl':
+        import json
+        for record in records:
+            print(json.dumps(record))
+    elif args.format == 'csv':
+        import csv
+        writer = csv.DictWriter(sys.stdout, fieldnames=fields + ['COUNT'], lineterminator='\n')
+        writer.writeheader()
+        writer.writerows(records)
+    elif not groups:
+        print("No assets found.")
+    else:
+        from tabulate import tabulate
+        print(tabulate([list(values) + [count] for values, count in groups],
+                       headers=fields + ['COUNT'], tablefmt="fancy_grid"))
+    log_activity(f"Summarized assets by {', '.join(fields)}.", event='summary',
+                 query=', '.join(fields), count=len(groups))
+
+
+def cmd_changes(args, backend):
+    from changefeed import export_changes, parse_time
+    try:
+        since_time = parse_time(args.since_time) if args.since_time else None
+    except ValueError:
+        raise CommandError(f"Invalid time '{args.since_time}', expected e.g. 2026-10-18T09:30")
+    records = backend.changes.changes(args.since, since_time, args.limit or None)
+
+    if args.format in ('table', 'json'):
+        records = list(records)
+        if args.format == 'json':
+            import json
+            print(json.dumps(records, indent=2))
+        elif not records:
+            print("No changes found.")
+        else:
+            from tabulate import tabulate
+            print(tabulate([[record['seq'], record['time'], record['op'], record['id'], record['sn'],
+                             record.get('field', ''), record.get('old', ''),
+                             record['asset'].get(record['field'], '') if 'field' in record else '']
+                            for record in records],
+                           headers=['SEQ', 'TIME', 'OP', 'ID', 'SN', 'FIELD', 'OLD', 'NEW'], tablefmt="fancy_grid"))
+        count, last_seq = len(records), records[-1]['seq'] if records else None
+    elif args.output:
+        with open(args.output, 'w', newline='') as out:
+            count, last_seq = export_changes(records, out, args.format)
+    else:
+        count, last_seq = export_changes(records, sys.stdout, args.format)
+
+    # On stderr, so the changes themselves can be piped
+    if last_seq is None:
+        last_seq = args.since or 0
+    print(f"{count} changes, up to seq {last_seq}.", file=sys.stderr)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog='ams', description="GridCode Asset Management System (non-interactive).")
+    parser.add_argument('--format', choices=['table', 'json', 'jsonl', 'csv'], default='table',
+                        help="output format (default: table)")
+    parser.add_argument('--backend', choices=['csv', 'sqlite'], help="storage backend (default: $AMS_BACKEND or csv)")
+    parser.add_argument('--metrics', metavar='FILE', help="write Prometheus metrics to FILE (default: $AMS_METRICS_FILE)")
+    parser.add_argument('--profile', metavar='FILE', help="write a cProfile dump of the command to FILE")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    create = subparsers.add_parser('create', help="add one asset")
+    for field in FIELDNAMES[1:]:
+        create.add_argument(f'--{field.lower()}', default='')
+    create.set_defaults(func=cmd_create)
+
+    search = subparsers.add_parser('search', help="find assets, e.g. \"CATEGORY=LAPTOP AND LOCATION=HQ\"")
+    search.add_argument('query')
+    search.add_argument('--limit', type=int, default=0)
+    search.set_defaults(func=cmd_search)
+
+    find = subparsers.add_parser('find', help="best matches for some words in TYPE, ASSIGNEE and DESCRIPTION")
+    find.add_argument('text')
+    find.add_argument('--limit', type=int, default=0, help="number of results (default: 20)")
+    find.set_defaults(func=cmd_find)
+
+    update = subparsers.add_parser('update', help="change fields of one or more assets")
+    update.add_argument('sn', nargs='*', help="serial numbers of the assets")
+    update.add_argument('--query', help="update every asset matching this query instead")
+    update.add_argument('--set', action='append', required=True, metavar='FIELD=VALUE')
+    update.set_defaults(func=cmd_update)
+
+    delete = subparsers.add_parser('delete', help="delete one or more assets")
+    delete.add_argument('sn', nargs='*', help="serial numbers of the assets")
+    delete.add_argument('--query', help="delete every asset matching this query instead")
+    delete.set_defaults(func=cmd_delete)
+
+    list_ = subparsers.add_parser('list', help="list assets a page at a time")
+    list_.add_argument('--page', type=int, default=1)
+    list_.add_argument('--page-size', type=int, default=50)
+    list_.add_argument('--sort', help="column to sort by; --sort=-COLUMN for descending")
+    list_.set_defaults(func=cmd_list)
+
+    import_ = subparsers.add_parser('import', help="bulk-load assets from a CSV or JSONL file")
+    import_.add_argument('file')
+    import_.set_defaults(func=cmd_import)
+
+    export = subparsers.add_parser('export', help="write assets to a CSV, JSON, JSONL or PDF file")
+    export.add_argument('--output', required=True)
+    export.add_argument('--query', help="export only the assets matching this query")
+    export.add_argument('--as', dest='output_format', choices=['csv', 'json', 'jsonl', 'pdf'],
+                        help="file format (default: from the output file's extension)")
+    export.set_defaults(func=cmd_export)
+
+    changes = subparsers.add_parser('changes', help="changes since a sequence number or time, for downstream syncs")
+    changes.add_argument('--since', type=int, metavar='SEQ', help="only changes after this sequence number")
+    changes.add_argument('--since-time', metavar='TIME', help="only changes at or after this time, e.g. 2026-10-18T09:30")
+    changes.add_argument('--limit', type=int, default=0)
+    changes.add_argument('--output', help="write the jsonl or csv export to this file instead of stdout")
+    changes.set_defaults(func=cmd_changes)
+
+    summary = subparsers.add_parser('summary', help="count assets by CATEGORY, TYPE, LOCATION, ASSIGNEE and/or STATUS")
+    summary.add_argument('fields', nargs='+', metavar='COLUMN')
+    summary.set_defaults(func=cmd_summary)
+
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args = parser.parse_args(argv)
+
+    if args.command in ('update', 'delete') and not args.sn and not args.query:
+        parser.error(f"{args.command} needs serial numbers or --query")
+
+    import contextlib
+    import metrics
+    from storage import open_backend
+    from query import QueryError
+    if args.metrics:
+        metrics.configure(args.metrics)
+    profile = metrics.profiled(args.profile) if args.profile else contextlib.nullcontext()
+    backend = open_backend(args.backend)
+    try:
+        with profile, metrics.operation(f"cli {args.command}"):
+            return args.func(args, backend) or 0
+    except (CommandError, ConflictError, QueryError) as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    except PermissionError:
+        print("Cannot access file.\nPlease close(terminate) your spreadsheet reader and try again!", file=sys.stderr)
+        return 1
+    finally:
+        backend.close()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
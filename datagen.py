@@ -0,0 +1,145 @@
+import argparse
+import csv
+import os
+import random
+import sys
+
+from store import FIELDNAMES
+
+# Synthetic inventories for benchmarks and demos.
+#
+#   python datagen.py --assets 100000 --users 50 --out bench_data
+#
+# writes bench_data/assets.csv and bench_data/user_data.csv. Categories,
+# locations and statuses are skewed the way real inventories are (a few
+# categories and sites hold most of the assets), serial numbers are unique,
+# and the same seed always gives the same data.
+
+# Category -> models; categories earlier in the list are more common
+CATEGORIES = [
+    ('LAPTOP', ['DELL LATITUDE 5440', 'HP ELITEBOOK 840', 'LENOVO THINKPAD T14', 'MACBOOK PRO 14']),
+    ('MONITOR', ['DELL P2422H', 'HP E24 G5', 'LG 27UL500', 'SAMSUNG S24R350']),
+    ('DESKTOP', ['DELL OPTIPLEX 7010', 'HP PRODESK 400', 'LENOVO THINKCENTRE M70']),
+    ('PHONE', ['IPHONE 13', 'SAMSUNG GALAXY A54', 'CISCO IP PHONE 8841']),
+    ('DOCKING STATION', ['DELL WD19S', 'HP USB-C DOCK G5', 'LENOVO THINKPAD DOCK']),
+    ('PRINTER', ['HP LASERJET M404', 'CANON IMAGECLASS MF445', 'EPSON L3250']),
+    ('TABLET', ['IPAD 10TH GEN', 'SAMSUNG GALAXY TAB S9']),
+    ('UPS', ['APC BACK-UPS 1500', 'EATON 5E 1100']),
+    ('ROUTER', ['CISCO ISR 1100', 'MIKROTIK HAP AC2', 'TP-LINK ARCHER AX55']),
+    ('PROJECTOR', ['EPSON EB-X49', 'BENQ MX560']),
+    ('SERVER', ['DELL POWEREDGE R650', 'HPE PROLIANT DL380']),
+    ('SCANNER', ['FUJITSU FI-7160', 'CANON DR-C225']),
+]
+
+LOCATIONS = ['HQ', 'ANNEX', 'WAREHOUSE', 'ACCRA BRANCH', 'KUMASI BRANCH', 'TAKORADI BRANCH', 'TAMALE BRANCH',
+             'CAPE COAST BRANCH', 'HO BRANCH', 'DATA CENTRE', 'REMOTE', 'TRAINING ROOM', 'SUNYANI BRANCH',
+             'KOFORIDUA BRANCH', 'TEMA BRANCH', 'BOLGATANGA BRANCH']
+
+STATUSES = [('ACTIVE', 70), ('SPARE', 12), ('IN REPAIR', 8), ('RETIRED', 7), ('LOST', 3)]
+
+COLORS = [('BLACK', 45), ('SILVER', 25), ('GREY', 15), ('WHITE', 10), ('BLUE', 3), ('RED', 2)]
+
+FIRST_NAMES = ['KWAME', 'AMA', 'KOFI', 'AKOSUA', 'YAW', 'ABENA', 'KWESI', 'EFUA', 'KOJO', 'ADWOA', 'KWAKU',
+               'AFIA', 'JOHN', 'MARY', 'DANIEL', 'GRACE', 'SAMUEL', 'ESTHER', 'DAVID', 'RUTH']
+LAST_NAMES = ['MENSAH', 'OWUSU', 'BOATENG', 'ASANTE', 'OSEI', 'ADJEI', 'APPIAH', 'QUAYE', 'ANSAH', 'DARKO',
+              'ADDO', 'TETTEH', 'AMOAH', 'BONSU', 'OFORI', 'NKRUMAH', 'SARPONG', 'ACHEAMPONG', 'LARTEY', 'ARYEE']
+
+DESCRIPTIONS = ['{model}', '{model}, PURCHASED {year}', '{model}, WARRANTY TO {year}',
+                '{model} - ASSET TAG ISSUED', '{model}, REFURBISHED']
+
+# Share of assets nobody is assigned to
+UNASSIGNED_SHARE = 0.25
+
+# Every synthetic account gets this password
+DEFAULT_PASSWORD = 'benchmark'
+
+# Rows generated per batch of random draws
+BATCH_SIZE = 10000
+
+
+def zipf_weights(count, exponent=1.1):
+    # Rank 1 is the most common, each later rank less so
+    return [1 / (rank ** exponent) for rank in range(1, count + 1)]
+
+
+def serial_number(index, category):
+    # Multiplying by an odd constant modulo 2**32 never maps two indexes to the
+    # same value, so SNs are unique while looking random
+    return f"{category[:3]}-{(index * 2654435761) % 2 ** 32:08X}"
+
+
+def generate_assets(count, seed=0, first_id=1):
+    # Yields count asset rows with IDs first_id, first_id + 1, ...
+    rng = random.Random(seed)
+    category_weights = zipf_weights(len(CATEGORIES))
+    location_weights = zipf_weights(len(LOCATIONS))
+    statuses, status_weights = zip(*STATUSES)
+    colors, color_weights = zip(*COLORS)
+
+    # Roughly three assets per person, drawn from the name combinations
+    people = [f"{first} {last}" for first in FIRST_NAMES for last in LAST_NAMES]
+    rng.shuffle(people)
+    people = people[:max(1, count // 3)]
+
+    for start in range(0, count, BATCH_SIZE):
+        size = min(BATCH_SIZE, count - start)
+        categories = rng.choices(CATEGORIES, category_weights, k=size)
+        locations = rng.choices(LOCATIONS, location_weights, k=size)
+        status_column = rng.choices(statuses, status_weights, k=size)
+        color_column = rng.choices(colors, color_weights, k=size)
+
+        for offset in range(size):
+            index = start + offset
+            category, models = categories[offset]
+            model = rng.choice(models)
+            assignee = "NOT ASSIGNED" if rng.random() < UNASSIGNED_SHARE else rng.choice(people)
+            description = rng.choice(DESCRIPTIONS).format(model=model, year=rng.randint(2018, 2026))
+            yield {'ID': first_id + index, 'SN': serial_number(first_id + index, category), 'CATEGORY': category,
+                   'TYPE': model, 'LOCATION': locations[offset], 'ASSIGNEE': assignee,
+                   'DESCRIPTION': description, 'COLOR': color_column[offset], 'STATUS': status_column[offset]}
+
+
+def write_assets(path, count, seed=0):
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+        writer.writeheader()
+        writer.writerows(generate_assets(count, seed))
+    return count
+
+
+def write_users(path, count, password=DEFAULT_PASSWORD, hash_iterations=None):
+    # Usernames user000001, user000002, ... all with the same password. The
+    # hash is computed once and shared, so a million accounts take seconds.
+    from main import HASH_ITERATIONS, UserManager
+    from storage import CsvBackend
+
+    user_manager = UserManager(CsvBackend(users_path=path), hash_iterations=hash_iterations or HASH_ITERATIONS)
+    hashed_password = user_manager.hash_password(password)
+    user_manager.executor.shutdown()
+
+    with open(path, 'w', newline='') as csvfile:
+        writer = csv.writer(csvfile)
+        writer.writerow(['username', 'password'])
+        writer.writerows((f"user{index:06d}", hashed_password) for index in range(1, count + 1))
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic asset inventory and user accounts.")
+    parser.add_argument('--assets', type=int, default=10000, help="number of assets (default: 10000)")
+    parser.add_argument('--users', type=int, default=10, help="number of user accounts (default: 10)")
+    parser.add_argument('--out', default='.', help="directory to write assets.csv and user_data.csv to")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--hash-iterations', type=int, help="PBKDF2 work factor for the shared password hash")
+    args = parser.parse_args(argv)
+
+    os.makedirs(args.out, exist_ok=True)
+    write_assets(os.path.join(args.out, 'assets.csv'), args.assets, args.seed)
+    if args.users:
+        write_users(os.path.join(args.out, 'user_data.csv'), args.users, hash_iterations=args.hash_iterations)
+    print(f"Wrote {args.assets} assets and {args.users} users (password '{DEFAULT_PASSWORD}') to '{args.out}'.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,435 @@
+import heapq
+import json
+import math
+import os
+import re
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import accumulate, compress
+
+import metrics
+from store import StoreListener
+
+# Free-text columns the full-text search looks in
+TEXT_FIELDS = ['TYPE', 'ASSIGNEE', 'DESCRIPTION']
+
+# Results shown unless the caller asks for another number
+FULLTEXT_LIMIT = 20
+
+# Dropped from a search unless nothing else is left
+STOP_WORDS = {'A', 'AN', 'AND', 'AT', 'BY', 'FOR', 'FROM', 'IN', 'IS', 'OF', 'ON', 'OR', 'THE', 'TO', 'WITH'}
+
+# How much a word counts when it is the search word, starts with it, contains
+# it, or is only spelled like it (scaled by the trigram similarity)
+EXACT, PREFIX, SUBSTRING, SIMILAR = 1.0, 0.8, 0.6, 0.5
+# Least trigram similarity (shared / all trigrams of both words) for a word to
+# count as a misspelling, and the shortest search word that is checked for them
+MIN_SIMILARITY = 0.3
+MIN_SIMILAR_LENGTH = 4
+# Most words one search word expands to
+MAX_EXPANSIONS = 50
+
+# BM25 term-frequency saturation
+K1 = 1.2
+
+# Rewrite the snapshot once this many values were indexed since it was read
+SAVE_AFTER_VALUES = 1000
+
+_WORD = re.compile(r'[^\W_]+')
+
+
+def tokenize(text):
+    return _WORD.findall(text.upper())
+
+
+def search_terms(text):
+    # The distinct words of a search, without stop words. A search of only
+    # stop words has no terms and finds nothing: "THE" would otherwise match,
+    # as a substring, every asset assigned to ESTHER.
+    terms = list(dict.fromkeys(tokenize(text)))
+    return [term for term in terms if term not in STOP_WORDS]
+
+
+def _jsonable(version):
+    # The store's version as it reads back from JSON (tuples become lists)
+    return json.loads(json.dumps(version))
+
+
+def _trigrams(token):
+    return {token[i:i + 3] for i in range(len(token) - 2)}
+
+
+class FullTextIndex(StoreListener):
+    # Ranked word search over TYPE, ASSIGNEE and DESCRIPTION.
+    #
+    # The store keeps one copy of every distinct value of those columns (see
+    # store._Column), and so does this index: it maps each word to the
+    # (column, value) pairs it occurs in, with how often, and each pair to the
+    # IDs of the assets holding it. A search scores those pairs with BM25
+    # (rarer words weigh more, document frequencies taken from the number of
+    # assets per value) and adds the scores up per asset, so its cost follows
+    # the number of matches, not the number of assets. Search words also match
+    # words that start with them, contain them (through a trigram index of
+    # the vocabulary) or are spelled almost like them, at a lower weight.
+    # Assets matching more of the search words rank higher.
+    #
+    # New values are indexed as assets are created and updated, and the IDs
+    # follow every create, update and delete. The index is saved to
+    # assets.fulltext (two JSON lines: the store version it reflects, then the
+    # values and words; then the postings as packed arrays) and read back at
+    # startup. The word postings never go stale, as they only cache how values
+    # split into words; the asset IDs are used only if the store is still at
+    # the saved version, and otherwise found again with one pass over each
+    # column and saved with the new version.
+
+    def __init__(self, store, path='assets.fulltext'):
+        self.store = store
+        self.path = path
+        self._loaded = False
+        # (column number, value) per indexed value, and its position there
+        self._docs = []
+        self._doc_numbers = {}
+        # Words, their numbers, the words in order (for prefixes, sorted when
+        # a search needs them) and by trigram
+        self._words = []
+        self._word_numbers = {}
+        self._sorted_words = None
+        self._by_trigram = {}
+        # Postings read from the snapshot: those of word w are at
+        # _offsets[w]:_offsets[w + 1] in _posting_docs and _posting_counts
+        self._offsets = array('I', [0])
+        self._posting_docs = array('I')
+        self._posting_counts = array('B')
+        # Postings added since: word number -> {value number: occurrences}
+        self._added = {}
+        self._added_values = 0
+        # IDs of the assets holding value v: read from the snapshot, at
+        # _id_offsets[v]:_id_offsets[v + 1] in _id_postings, unless v has a set
+        # in _ids because it changed since. _ids is None until the next search.
+        self._id_offsets = array('I', [0])
+        self._id_postings = array('I')
+        self._ids = None
+        store.subscribe(self)
+
+    # --- keeping up with the store ---
+
+    def on_reload(self):
+        # Another process may have changed anything; find the assets of each
+        # value again on the next search
+        self._ids = None
+
+    def on_add(self, row):
+        if self._ids is not None:
+            asset_id = int(row['ID'])
+            for column, field in enumerate(TEXT_FIELDS):
+                self._asset_ids(self._index(column, row[field])).add(asset_id)
+
+    def on_update(self, row, field, old_value):
+        if self._ids is not None and field in TEXT_FIELDS:
+            column = TEXT_FIELDS.index(field)
+            asset_id = int(row['ID'])
+            self._asset_ids(self._doc_numbers[column, old_value]).discard(asset_id)
+            self._asset_ids(self._index(column, row[field])).add(asset_id)
+
+    def on_delete(self, row):
+        if self._ids is not None:
+            asset_id = int(row['ID'])
+            for column, field in enumerate(TEXT_FIELDS):
+                self._asset_ids(self._doc_numbers[column, row[field]]).discard(asset_id)
+
+    def on_commit(self):
+        if self._ids is not None and self._added_values >= SAVE_AFTER_VALUES:
+            self._save(self.store.version())
+
+    def _refresh(self):
+        self.store.refresh()
+        if self._ids is not None:
+            return
+        with metrics.phase('index_text'):
+            version = self.store.version()
+            if self._read(version):
+                return
+            # Retried if another process changed the assets in between
+            while True:
+                indexes = [self.store.column_index(field) for field in TEXT_FIELDS]
+                if self.store.version() == version:
+                    break
+                version = self.store.version()
+            ids = {}
+            for column, index in enumerate(indexes):
+                for value, asset_ids in index.items():
+                    ids[self._index(column, value)] = asset_ids
+            self._id_offsets, self._id_postings = array('I', [0]), array('I')
+            self._ids = ids
+            self._save(version)
+
+    def _index(self, column, value):
+        # The value's number, indexing it first if it is new
+        doc = self._doc_numbers.get((column, value))
+        if doc is not None:
+            return doc
+        doc = len(self._docs)
+        self._docs.append((column, value))
+        self._doc_numbers[column, value] = doc
+        for word, count in Counter(tokenize(value)).items():
+            self._added.setdefault(self._word_number(word), {})[doc] = min(count, 255)
+        self._added_values += 1
+        return doc
+
+    def _asset_ids(self, doc):
+        # The set of IDs holding a value, to change
+        ids = self._ids.get(doc)
+        if ids is None:
+            ids = self._ids[doc] = set(self._live_ids(doc))
+        return ids
+
+    def _live_ids(self, doc):
+        ids = self._ids.get(doc)
+        if ids is not None:
+            return ids
+        if doc + 1 < len(self._id_offsets):
+            return self._id_postings[self._id_offsets[doc]:self._id_offsets[doc + 1]]
+        return ()
+
+    def _live_count(self, doc):
+        ids = self._ids.get(doc)
+        if ids is not None:
+            return len(ids)
+        if doc + 1 < len(self._id_offsets):
+            return self._id_offsets[doc + 1] - self._id_offsets[doc]
+        return 0
+
+    def _word_number(self, word):
+        number = self._word_numbers.get(word)
+        if number is None:
+            number = len(self._words)
+            self._words.append(word)
+            self._word_numbers[word] = number
+            self._sorted_words = None
+            self._add_trigrams(word, number)
+        return number
+
+    def _add_trigrams(self, word, number):
+        # Words with digits (serial numbers, models, years) are only matched
+        # whole or by prefix
+        if word.isalpha():
+            for trigram in _trigrams(word):
+                self._by_trigram.setdefault(trigram, set()).add(number)
+
+    def _postings(self, word_number):
+        # [(value number, occurrences), ...] of one word
+        postings = []
+        if word_number + 1 < len(self._offsets):
+            start, end = self._offsets[word_number], self._offsets[word_number + 1]
+            postings.extend(zip(self._posting_docs[start:end], self._posting_counts[start:end]))
+        postings.extend(self._added.get(word_number, {}).items())
+        return postings
+
+    # --- persistence ---
+
+    def _read(self, version):
+        # Use the snapshot: all of it if it was saved at version (the assets as
+        # loaded), else only its words, and only the first time. Returns
+        # whether the asset IDs came with it.
+        try:
+            with open(self.path, 'rb') as index_file:
+                first = json.loads(index_file.readline())
+                if first.get('fields') != TEXT_FIELDS:
+                    return False
+                current = first.get('version') == _jsonable(version)
+                if self._loaded and not current:
+                    return False
+                header = json.loads(index_file.readline())
+                offsets = array('I')
+                offsets.fromfile(index_file, len(header['words']) + 1)
+                posting_docs = array('I')
+                posting_docs.fromfile(index_file, offsets[-1])
+                posting_counts = array('B')
+                posting_counts.fromfile(index_file, offsets[-1])
+                id_offsets = array('I')
+                id_offsets.fromfile(index_file, len(header['docs']) + 1)
+                id_postings = array('I')
+                id_postings.fromfile(index_file, id_offsets[-1])
+                metrics.bytes_read(index_file.tell())
+        except (FileNotFoundError, ValueError, EOFError, KeyError):
+            # Missing or damaged: everything is indexed from the store
+            return False
+        finally:
+            self._loaded = True
+
+        self._docs = [tuple(doc) for doc in header['docs']]
+        self._doc_numbers = {doc: number for number, doc in enumerate(self._docs)}
+        self._words = header['words']
+        self._word_numbers = {word: number for number, word in enumerate(self._words)}
+        self._sorted_words = None
+        self._by_trigram = {}
+        for number, word in enumerate(self._words):
+            self._add_trigrams(word, number)
+        self._offsets, self._posting_docs, self._posting_counts = offsets, posting_docs, posting_counts
+        self._added = {}
+        self._added_values = 0
+        if current:
+            self._id_offsets, self._id_postings = id_offsets, id_postings
+            self._ids = {}
+        return current
+
+    def _save(self, version):
+        # Write the index without the values no asset has any more, then use
+        # the packed copy in memory too. version is the store's, which the
+        # asset IDs reflect.
+        alive = [self._live_count(doc) > 0 for doc in range(len(self._docs))]
+        live = list(compress(self._docs, alive))
+        # New number of every value still in use
+        renumber = list(accumulate(alive, initial=-1))[1:]
+
+        words = []
+        offsets = array('I', [0])
+        posting_docs = array('I')
+        posting_counts = array('B')
+        for word_number, word in enumerate(self._words):
+            # Postings are in value order: the snapshot's, then the ones added since
+            docs, counts = [], []
+            if word_number + 1 < len(self._offsets):
+                start, end = self._offsets[word_number], self._offsets[word_number + 1]
+                docs.extend(self._posting_docs[start:end])
+                counts.extend(self._posting_counts[start:end])
+            added = self._added.get(word_number)
+            if added:
+                docs.extend(added)
+                counts.extend(added.values())
+            kept = list(map(alive.__getitem__, docs))
+            docs = list(map(renumber.__getitem__, compress(docs, kept)))
+            if docs:
+                words.append(word)
+                posting_docs.extend(docs)
+                posting_counts.extend(compress(counts, kept))
+                offsets.append(len(posting_docs))
+
+        id_offsets = array('I', [0])
+        id_postings = array('I')
+        for doc in compress(range(len(self._docs)), alive):
+            id_postings.extend(self._live_ids(doc))
+            id_offsets.append(len(id_postings))
+
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as index_file:
+                index_file.write(json.dumps({'fields': TEXT_FIELDS, 'version': version}).encode() + b'\n')
+                index_file.write(json.dumps({'docs': live, 'words': words}).encode() + b'\n')
+                offsets.tofile(index_file)
+                posting_docs.tofile(index_file)
+                posting_counts.tofile(index_file)
+                id_offsets.tofile(index_file)
+                id_postings.tofile(index_file)
+                metrics.bytes_written(index_file.tell())
+            os.replace(tmp_path, self.path)
+        except PermissionError:
+            # Only a cache; the next process indexes what it is missing
+            pass
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+        self._docs = live
+        self._doc_numbers = {doc: number for number, doc in enumerate(live)}
+        if len(words) < len(self._words):
+            # Some words are gone, so the rest are numbered anew
+            self._words = words
+            self._word_numbers = {word: number for number, word in enumerate(words)}
+            self._sorted_words = None
+            self._by_trigram = {}
+            for number, word in enumerate(words):
+                self._add_trigrams(word, number)
+        self._offsets, self._posting_docs, self._posting_counts = offsets, posting_docs, posting_counts
+        self._added = {}
+        self._added_values = 0
+        self._id_offsets, self._id_postings = id_offsets, id_postings
+        self._ids = {}
+
+    # --- searching ---
+
+    def _expand(self, term):
+        # {word number: weight} for the words a search word matches
+        matches = {}
+        number = self._word_numbers.get(term)
+        if number is not None:
+            matches[number] = EXACT
+
+        if self._sorted_words is None:
+            self._sorted_words = sorted(self._words)
+        position = bisect_left(self._sorted_words, term)
+        for word in self._sorted_words[position:position + MAX_EXPANSIONS]:
+            if not word.startswith(term):
+                break
+            matches.setdefault(self._word_numbers[word], PREFIX)
+
+        term_trigrams = _trigrams(term)
+        if term_trigrams and term.isalpha():
+            candidates = Counter()
+            for trigram in term_trigrams:
+                candidates.update(self._by_trigram.get(trigram, ()))
+            for number, shared in candidates.most_common():
+                if len(matches) >= MAX_EXPANSIONS:
+                    break
+                if number in matches:
+                    continue
+                word = self._words[number]
+                if shared == len(term_trigrams) and term in word:
+                    matches[number] = SUBSTRING
+                    continue
+                if len(term) < MIN_SIMILAR_LENGTH or shared < MIN_SIMILARITY * len(term_trigrams):
+                    # most_common() goes from most to fewest shared trigrams,
+                    # so no word further on can be similar enough
+                    break
+                similarity = shared / (len(term_trigrams) + len(_trigrams(word)) - shared)
+                if similarity >= MIN_SIMILARITY:
+                    matches[number] = SIMILAR * similarity
+        return matches
+
+    def search(self, text, limit=FULLTEXT_LIMIT):
+        # [(row, score), ...] for the assets best matching the words of text,
+        # best first
+        terms = search_terms(text)
+        if not terms:
+            return []
+        self._refresh()
+
+        total = len(self.store)
+        # value number -> [score, bit mask of the terms it matches]
+        matched = {}
+        for bit, term in enumerate(terms):
+            # Best match per value, then one idf for the term over every
+            # value matching it, so a near miss never outweighs the word itself
+            term_scores = {}
+            for word_number, weight in self._expand(term).items():
+                for doc, count in self._postings(word_number):
+                    score = weight * count * (K1 + 1) / (count + K1)
+                    if score > term_scores.get(doc, 0):
+                        term_scores[doc] = score
+            # A word in both the TYPE and the DESCRIPTION counts an asset twice
+            frequency = min(sum(map(self._live_count, term_scores)), total)
+            if not frequency:
+                continue
+            idf = math.log(1 + (total - frequency + 0.5) / (frequency + 0.5))
+            for doc, score in term_scores.items():
+                score *= idf
+                entry = matched.setdefault(doc, [0.0, 0])
+                entry[0] += score
+                entry[1] |= 1 << bit
+
+        # From values to the assets holding them
+        scores = {}
+        masks = {}
+        for doc, (score, mask) in matched.items():
+            for asset_id in self._live_ids(doc):
+                scores[asset_id] = scores.get(asset_id, 0.0) + score
+                masks[asset_id] = masks.get(asset_id, 0) | mask
+
+        # An asset matching half the terms keeps half its score
+        ranked = heapq.nlargest(limit, ((score * bin(masks[asset_id]).count('1') / len(terms), -asset_id)
+                                        for asset_id, score in scores.items()))
+        # Paired by ID: get_many_by_id skips assets deleted since the lookup
+        ranked = {-negative_id: score for score, negative_id in ranked}
+        rows = self.store.get_many_by_id(list(ranked))
+        return [(row, round(ranked[int(row['ID'])], 3)) for row in rows]
@@ -0,0 +1,115 @@
+import csv
+import json
+import os
+
+import metrics
+from store import FIELDNAMES, ConflictError
+
+# Rows read, checked and written per batch
+CHUNK_SIZE = 5000
+
+
+def normalize_asset(record):
+    # Same clean-up create_asset applies to what the user types
+    asset = {}
+    for field in FIELDNAMES[1:]:
+        value = record.get(field)
+        asset[field] = '' if value is None else str(value).strip().upper()
+    if asset['ASSIGNEE'] == "":
+        asset['ASSIGNEE'] = "NOT ASSIGNED"
+    return asset
+
+
+def _read_csv(path):
+    with open(path, 'r', newline='') as csvfile:
+        reader = csv.DictReader(csvfile)
+        # Accept headers in any case, e.g. "sn" or "Location"
+        reader.fieldnames = [name.strip().upper() for name in reader.fieldnames or []]
+        for row in reader:
+            yield reader.line_num, row, None
+
+
+def _read_jsonl(path):
+    with open(path, 'r') as jsonfile:
+        for line_num, line in enumerate(jsonfile, start=1):
+            if not line.strip():
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                yield line_num, None, "invalid JSON"
+                continue
+            if not isinstance(record, dict):
+                yield line_num, None, "not a JSON object"
+                continue
+            yield line_num, {str(key).strip().upper(): value for key, value in record.items()}, None
+
+
+def read_records(path):
+    # Yields (line number, record, error) without loading the whole file
+    extension = os.path.splitext(path)[1].lower()
+    if extension in ('.jsonl', '.ndjson', '.json'):
+        return _read_jsonl(path)
+    return _read_csv(path)
+
+
+def import_assets(store, path, chunk_size=CHUNK_SIZE, on_added=None):
+    # Stream assets from a CSV or JSONL file into the store.
+    # Returns (number of assets added, list of (line number, SN, reason) rejects)
+    added = 0
+    rejected = []
+    chunk = []
+
+    def flush(chunk):
+        accepted = []
+        chunk_rejected = []
+        batch_serials = set()
+        existing = store.existing_serials(asset['SN'] for _, asset in chunk)
+
+        for line_num, asset in chunk:
+            sn = asset['SN']
+            if sn in existing:
+                chunk_rejected.append((line_num, sn, "serial number already exists"))
+            elif sn in batch_serials:
+                chunk_rejected.append((line_num, sn, "duplicate serial number in file"))
+            else:
+                batch_serials.add(sn)
+                accepted.append(asset)
+
+        rows = []
+        if accepted:
+            # One buffered write per chunk; the store hands out a contiguous
+            # block of IDs while it holds the write lock
+            try:
+                rows = store.add_many(accepted)
+            except ConflictError:
+                # Another process added one of these serial numbers after they
+                # were checked; check the chunk again
+                return flush(chunk)
+
+        rejected.extend(chunk_rejected)
+        if rows and on_added is not None:
+            on_added(rows)
+        return len(rows)
+
+    for line_num, record, error in read_records(path):
+        if error is not None:
+            rejected.append((line_num, '', error))
+            continue
+
+        asset = normalize_asset(record)
+        if asset['SN'] == "":
+            rejected.append((line_num, '', "missing serial number"))
+            continue
+
+        chunk.append((line_num, asset))
+        if len(chunk) >= chunk_size:
+            added += flush(chunk)
+            chunk = []
+
+    if chunk:
+        added += flush(chunk)
+    metrics.bytes_read(os.path.getsize(path))
+
+    rejected.sort(key=lambda reject: reject[0])
+    return added, rejected
@@ -0,0 +1,126 @@
+import argparse
+import asyncio
+import json
+import random
+import sys
+import time
+
+# Load test for server.py. Opens --clients keep-alive connections to a running
+# server and has each send requests back to back until --requests have been
+# made in total, then prints throughput and latency percentiles.
+#
+#   python server.py &
+#   python loadtest.py --username admin --password secret --clients 200 --requests 20000
+#
+# The mix is mostly reads (lookups by SN, paginated lists, searches) with a
+# share of updates, each setting a field to the value it already has so the
+# inventory is left as it was.
+
+SEARCHES = ["STATUS=ACTIVE", "CATEGORY=LAPTOP AND LOCATION=HQ", "LOCATION=H*", "STATUS IN (ACTIVE, SPARE)"]
+
+
+async def request(reader, writer, method, path, token=None, payload=None):
+    body = json.dumps(payload).encode() if payload is not None else b''
+    head = f"{method} {path} HTTP/1.1\r\nHost: localhost\r\nContent-Length: {len(body)}\r\n"
+    if token:
+        head += f"Authorization: Bearer {token}\r\n"
+    writer.write(head.encode() + b"\r\n" + body)
+    await writer.drain()
+
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if line in (b'\r\n', b''):
+            break
+        name, _, value = line.decode('latin-1').partition(':')
+        if name.strip().lower() == 'content-length':
+            length = int(value)
+    return status, json.loads(await reader.readexactly(length)) if length else None
+
+
+async def client(host, port, token, serials, update_share, budget, latencies, statuses):
+    reader, writer = await asyncio.open_connection(host, port)
+    try:
+        while budget[0] > 0:
+            budget[0] -= 1
+            roll = random.random()
+            sn = random.choice(serials)
+            if roll < update_share:
+                # Read-modify-write, as a client editing an asset would
+                method, path, payload = 'GET', f"/assets/{sn}", None
+                status, asset = await request(reader, writer, method, path, token)
+                if status == 200:
+                    method, payload = 'PATCH', {'STATUS': asset['STATUS'], 'expected': {'STATUS': asset['STATUS']}}
+            elif roll < 0.5:
+                method, path, payload = 'GET', f"/assets/{sn}", None
+            elif roll < 0.75:
+                method, path, payload = 'GET', f"/assets?page={random.randint(1, 20)}&page_size=50", None
+            else:
+                method, path, payload = 'GET', f"/assets?q={random.choice(SEARCHES).replace(' ', '%20')}", None
+
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, method, path, token, payload)
+            latencies.append(time.perf_counter() - start)
+            statuses[status] = statuses.get(status, 0) + 1
+    finally:
+        writer.close()
+
+
+def percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+
+async def run(args):
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    status, session = await request(reader, writer, 'POST', '/login',
+                                    payload={'username': args.username, 'password': args.password})
+    if status != 200:
+        writer.close()
+        raise SystemExit(f"Login failed: {session}")
+    token = session['token']
+
+    status, listing = await request(reader, writer, 'GET', "/assets?page_size=500", token)
+    writer.close()
+    serials = [asset['SN'] for asset in listing['assets']] or ['MISSING']
+
+    latencies = []
+    statuses = {}
+    budget = [args.requests]
+    start = time.perf_counter()
+    await asyncio.gather(*(client(args.host, args.port, token, serials, args.update_share, budget, latencies, statuses)
+                           for _ in range(args.clients)))
+    elapsed = time.perf_counter() - start
+
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'clients': args.clients,
+        'seconds': round(elapsed, 3),
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'latency_ms': {name: round(percentile(latencies, fraction) * 1000, 2)
+                       for name, fraction in (('p50', 0.50), ('p95', 0.95), ('p99', 0.99), ('max', 1.0))},
+        'statuses': statuses,
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test a running server.py.")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--username', required=True)
+    parser.add_argument('--password', required=True)
+    parser.add_argument('--clients', type=int, default=100, help="concurrent connections (default: 100)")
+    parser.add_argument('--requests', type=int, default=10000, help="requests in total (default: 10000)")
+    parser.add_argument('--update-share', type=float, default=0.1,
+                        help="fraction of requests that are updates (default: 0.1)")
+    args = parser.parse_args(argv)
+
+    print(json.dumps(asyncio.run(run(args)), indent=2))
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
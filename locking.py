@@ -0,0 +1,78 @@
+import contextlib
+import os
+import time
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None
+    import msvcrt
+
+
+class FileLock:
+    # Advisory lock shared by every process working on the same data file.
+    # Readers take it shared and do not block each other; writers take it
+    # exclusive. The lock lives in its own file (e.g. assets.csv.lock) so the
+    # data file itself can be replaced atomically while the lock is held.
+    #
+    # Nested acquisitions in the same process are free: the outermost one
+    # decides the mode. Callers must serialize their threads themselves
+    # (AssetStore does so with its own RLock).
+    #
+    # Windows has no shared byte-range locks in msvcrt, so there every lock is
+    # exclusive.
+
+    def __init__(self, path):
+        self.path = path
+        self._fd = None
+        self._depth = 0
+
+    @contextlib.contextmanager
+    def shared(self):
+        with self._acquire(exclusive=False):
+            yield
+
+    @contextlib.contextmanager
+    def exclusive(self):
+        with self._acquire(exclusive=True):
+            yield
+
+    @contextlib.contextmanager
+    def _acquire(self, exclusive):
+        if self._depth == 0:
+            self._lock(exclusive)
+        self._depth += 1
+        try:
+            yield
+        finally:
+            self._depth -= 1
+            if self._depth == 0:
+                self._unlock()
+
+    def _lock(self, exclusive):
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT, 0o666)
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            else:
+                while True:
+                    try:
+                        msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+                        break
+                    except OSError:
+                        time.sleep(0.01)
+        except BaseException:
+            os.close(self._fd)
+            self._fd = None
+            raise
+
+    def _unlock(self):
+        try:
+            if fcntl is not None:
+                fcntl.flock(self._fd, fcntl.LOCK_UN)
+            else:
+                os.lseek(self._fd, 0, os.SEEK_SET)
+                msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+        finally:
+            os.close(self._fd)
+            self._fd = None
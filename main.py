@@ -1,20 +1,45 @@
-import csv
-import os
 import sys
-import logging
+
+if __name__ == "__main__":
+    # --metrics FILE and --profile FILE apply to the console session; with any
+    # other arguments, run one non-interactive command and exit (see cli.py).
+    # This happens before the console's own imports, so a command starts as
+    # fast as it does from cli.py.
+    import argparse
+    parser = argparse.ArgumentParser(description="GridCode Asset Management System console.")
+    parser.add_argument('--metrics', metavar='FILE', help="write Prometheus metrics to FILE")
+    parser.add_argument('--profile', metavar='FILE', help="write a cProfile dump of the session to FILE")
+    options, command = parser.parse_known_args()
+    if command:
+        from cli import main as cli_main
+        sys.exit(cli_main())
+
+import contextlib
+import os
 import hashlib
+import hmac
 import time
-from tabulate import tabulate
-from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 from colorama import init, Fore, Style
-from csv2pdf import convert
-import pywriter as pw
+import audit
+import metrics
+from store import FIELDNAMES, ConflictError
+from storage import default_backend
+from importer import import_assets
+from query import QueryError
+from pager import Pager
+from report import build_report
+from metrics import phase, timed, user_input
+from summary import SUMMARY_FIELDS, parse_fields
 
 init(autoreset=True)
 
 class AssetManagementSystem:
 
-    def __init__(self):
+    def __init__(self, backend=None):
+        # Storage for assets and users (CSV files by default, see storage.py)
+        self.backend = backend or default_backend()
+
         # Check if the file exists
         self.file_exists = os.path.isfile('assets.csv')
 
@@ -29,38 +54,30 @@ class AssetManagementSystem:
         self.COLOR = 'COLOR'
         self.STATUS = 'STATUS'
 
-        # Configure logging with custom format
-        logging.basicConfig(filename='assets.log', level=logging.INFO,
-                            format='%(asctime)s - %(levelname)s: %(message)s',
-                            datefmt='%A, %Y-%m-%d %I:%M:%S %p') 
+        # Asset storage, e.g. the in-memory copy of assets.csv kept for the session
+        self.store = self.backend.assets
+        # Multi-column queries with per-column indexes
+        self.query_engine = self.backend.query_engine()
+
 
-    def log_activity(self, message):
-        logging.info(message)
+    def log_activity(self, message, event=None, **fields):
+        # Structured line in assets.log, written by the audit thread (see audit.py)
+        audit.asset_event(event, message, **fields)
 
     def get_last_asset_id(self):
-        try:
-            with open('assets.csv', 'r', newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-                rows = list(reader)
-                if rows:
-                    return int(rows[-1]['ID'])
-                else:
-                    return 0
-        except FileNotFoundError:
-            return 0
+        return self.store.last_id()
 
+    @timed
     def create_asset(self):
         print(f"{Fore.GREEN}Creating Asset{Style.RESET_ALL}")
         last_id = self.get_last_asset_id()
         new_id = last_id + 1
 
-        ID = new_id
-
         print("NOTE, all entries will be converted to upper case automatically\n")
 
         if new_id > 1:
             while True:
-                sn = input("Enter asset serial  number(SN): ")
+                sn = user_input("Enter asset serial  number(SN): ")
                 sn = sn.strip().upper()
 
                 if self.is_serial_number_unique(sn):
@@ -68,62 +85,89 @@ class AssetManagementSystem:
                 else:
                     print(f"Serial number '{sn}' already exists. Please enter a unique serial number.\n")
         else:
-            sn = input("Enter asset serial  number(SN): ")
+            sn = user_input("Enter asset serial  number(SN): ")
             sn = sn.strip().upper()
 
-        asset_category = input("Enter asset category: ")
+        asset_category = user_input("Enter asset category: ")
         asset_category = asset_category.strip().upper()
 
-        asset_type = input("Enter asset type: ")
+        asset_type = user_input("Enter asset type: ")
         asset_type = asset_type.strip().upper()
 
-        location = input("Enter asset location: ")
+        location = user_input("Enter asset location: ")
         location = location.strip().upper()
 
-        assignee = input("Enter the name of the person you want to assign this asset: ")
+        assignee = user_input("Enter the name of the person you want to assign this asset: ")
         assignee = assignee.strip().upper()
         if assignee == "":
             assignee = "NOT ASSIGNED"
 
 
-        description = input("Enter a short description about the asset: ")
+        description = user_input("Enter a short description about the asset: ")
         description = description.strip().upper()
 
-        color = input("Enter the color of the asset: ")
+        color = user_input("Enter the color of the asset: ")
         color = color.strip().upper()
 
-        status = input("Enter asset status: ")
+        status = user_input("Enter asset status: ")
         status = status.strip().upper()
 
         try:
-            with open('assets.csv', 'a', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=[self.ID, self.SN, self.CATEGORY, self.TYPE,
-                                                             self.LOCATION, self.ASSIGNEE ,self.DESCRIPTION, self.COLOR, self.STATUS])
+            # Write the new asset; the store assigns the ID at write time so
+            # two operators creating assets at once never get the same one
+            row = self.store.add({self.SN: sn, self.CATEGORY: asset_category, self.TYPE: asset_type,
+                                  self.LOCATION: location, self.ASSIGNEE: assignee, self.DESCRIPTION: description, self.COLOR: color, self.STATUS: status})
 
-                # Check if the file is empty, and write the header only if it is
-                if os.stat('assets.csv').st_size == 0:
-                    writer.writeheader()
+            # Log the activity
+            log_message = f"Asset '{sn}' (ID: {row[self.ID]}) added successfully."
+            self.log_activity(log_message, event='create', sn=sn, id=int(row[self.ID]))
 
-                # Write the new asset
-                writer.writerow({self.ID: ID, self.SN: sn, self.CATEGORY: asset_category, self.TYPE: asset_type,
-                                 self.LOCATION: location, self.ASSIGNEE: assignee, self.DESCRIPTION: description, self.COLOR: color, self.STATUS: status})
+            print(f"Asset '{sn}' added successfully!\n")
+        except ConflictError:
+            print(f"Serial number '{sn}' was added by someone else in the meantime. Nothing saved.\n")
+        except PermissionError:
+            print("Cannot access file.\nPlease close(terminate) your spreadsheet reader and try again!")
 
-                # Log the activity
-                log_message = f"Asset '{sn}' (ID: {ID}) added successfully."
-                self.log_activity(log_message)
+    @timed
+    def import_assets(self):
+        print(f"{Fore.GREEN}Importing Assets{Style.RESET_ALL}")
+        print("NOTE, the file must be a CSV with a header row or JSONL (one JSON object per line)")
+        print("with the columns SN / CATEGORY / TYPE / LOCATION / ASSIGNEE / DESCRIPTION / COLOR / STATUS.")
+        print("Entries are converted to upper case and IDs are assigned automatically.\n")
 
-            print(f"Asset '{sn}' added successfully!\n")
+        import_path = user_input("Enter the path of the file to import: ")
+        import_path = import_path.strip().strip('"')
+
+        def log_added(rows):
+            for row in rows:
+                log_message = f"Asset '{row[self.SN]}' (ID: {row[self.ID]}) added successfully."
+                self.log_activity(log_message, event='create', sn=row[self.SN], id=int(row[self.ID]))
+
+        try:
+            added, rejected = import_assets(self.store, import_path, on_added=log_added)
+        except FileNotFoundError:
+            print(f"File '{import_path}' not found.\n")
+            return
         except PermissionError:
             print("Cannot access file.\nPlease close(terminate) your spreadsheet reader and try again!")
+            return
+
+        log_message = f"Imported {added} assets from '{import_path}', {len(rejected)} rejected."
+        self.log_activity(log_message, event='import', count=added)
+
+        print(f"{added} assets imported successfully!")
+        if rejected:
+            print(f"{Fore.RED}{len(rejected)} rows rejected:{Style.RESET_ALL}")
+            from tabulate import tabulate
+            with phase('render_table'):
+                table = tabulate(rejected, headers=["LINE", self.SN, "REASON"], tablefmt="fancy_grid")
+            print(table)
+        print()
 
     def is_serial_number_unique(self, serial_number):
-        with open('assets.csv', 'r', newline='') as csvfile:
-            reader = csv.DictReader(csvfile)
-            for row in reader:
-                if row[self.SN] == serial_number:
-                    return False
-        return True
+        return self.store.is_serial_number_unique(serial_number)
 
+    @timed
     def read_assets(self):
         print(f"{Fore.GREEN}Reading Assets{Style.RESET_ALL}")
         # List options
@@ -131,177 +175,334 @@ class AssetManagementSystem:
         print("2) PDF")
         print("3) Default view(terminal)")
 
-        read_choice = input("Enter the choice of reading: ")
+        read_choice = user_input("Enter the choice of reading: ")
         read_choice = read_choice.strip().upper()
-        file_path = 'assets.csv'
 
         if read_choice == "1":
             #Logging Activity
             log_message = "Reading assets in spreadsheet."
-            self.log_activity(log_message)
+            self.log_activity(log_message, event='read')
+            # Get a CSV file with every pending edit in it
+            try:
+                spreadsheet_path = self.store.export_csv()
+            except PermissionError:
+                print("Cannot access file.\nPlease close(terminate) your spreadsheet reader and try again!")
+                return
             # Open in spreadsheet form
-            os.startfile("assets.csv")
+            os.startfile(spreadsheet_path)
             # sys.exit()
 
         elif read_choice == "2":
+            report_query = user_input("Enter a search query to filter the report (leave blank for all assets): ")
+            report_query = report_query.strip().upper()
+
+            try:
+                rows = self.query_engine.search(report_query) if report_query else self.store.iter_rows()
+            except QueryError:
+                print("Entry can't be found or you mispelt an entry!")
+                return
+
             #Logging Activity
-            log_message = "Reading assets in PDF."
-            self.log_activity(log_message)
+            log_message = f"Reading assets in PDF ({report_query})." if report_query else "Reading assets in PDF."
+            self.log_activity(log_message, event='read', query=report_query or None)
 
             try:
-                convert("assets.csv", "assets.pdf", orientation="L")
-            except Exception as e:
+                with phase('render_pdf'):
+                    build_report(rows, "assets.pdf")
+            except PermissionError as e:
                 print(f"Error {e}\nPlease terminate other instance of assest.pdf")
-                
+                return
+
             # Open in PDF format
             os.startfile("assets.pdf")
             # sys.exit()
 
         elif read_choice == "3":
-            try:
-                with open(file_path, 'r') as csv_file:
-                    csv_reader = csv.reader(csv_file)
-        
-                    # Assuming the first row contains headers
-                    headers = next(csv_reader)
-        
-                    # Read data
-                    data = [row for row in csv_reader]
-        
-                    # Print tabulated data
-                    print(tabulate(data, headers=headers, tablefmt="fancy_grid"))
-
-
-                    # Log the activity
-                    log_message = "Read assets from the system."
-                    self.log_activity(log_message)
-                    print("\n")
-            except FileNotFoundError:
-                print("No assets found.\n")
+            # Page through the assets; rows are read only as far as the page shown
+            total = len(self.store) if self.store.loaded else None
+            pager = Pager(self.store.iter_rows(), total=total)
+
+            # Log the activity
+            log_message = "Read assets from the system."
+            self.log_activity(log_message, event='read')
+
+            pager.browse()
+            print("\n")
 
         else:
             print("Invalid choice")
 
+    @timed
     def search_assets(self):
         print(f"{Fore.GREEN}Searching Assets{Style.RESET_ALL}")
-        search_column = input("Enter the column to search in (ID / SN / CATEGORY / TYPE / LOCATION / ASSIGNEE / DESCRIPTION /COLOR / STATUS): ")
+        print("Search one column, or type a full query such as CATEGORY=LAPTOP AND LOCATION=HQ AND STATUS IN (ACTIVE, SPARE)")
+        print("A value ending in * matches as a prefix, e.g. DELL*")
+        print("Or type any words, e.g. DELL LATITUDE JOHN, to find the best matches by TYPE, ASSIGNEE and DESCRIPTION\n")
+        search_column = user_input("Enter the column to search in (ID / SN / CATEGORY / TYPE / LOCATION / ASSIGNEE / DESCRIPTION /COLOR / STATUS), a query or words: ")
         search_column = search_column.strip().upper()
+        scores = None
 
-        search_value = input(f"Enter the value to search for in {search_column}: ")
-        search_value = search_value.strip().upper()
+        if search_column in FIELDNAMES:
+            search_value = user_input(f"Enter the value to search for in {search_column}: ")
+            search_value = search_value.strip().upper()
 
-        found_assets = []
+            if search_value.endswith('*'):
+                query = [(search_column, 'prefix', search_value[:-1])]
+            else:
+                query = [(search_column, 'eq', search_value)]
+            search_text = f"{search_column} = {search_value}"
+        else:
+            query = search_column
+            search_text = search_column
 
         try:
-            with open('assets.csv', 'r', newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-
-                for row in reader:
-                    if row[search_column] == search_value:
-                        found_assets.append(row)
-
-                if found_assets:
-                    headers = [self.ID, self.SN, self.CATEGORY, self.TYPE, self.LOCATION, self.ASSIGNEE, self.DESCRIPTION, self.COLOR, self.STATUS]
-                    print("\nFound Assets:")
-                    data = [
-                        [found_asset[self.ID], found_asset[self.SN], found_asset[self.CATEGORY], found_asset[self.TYPE],
-                         found_asset[self.LOCATION], found_asset[self.ASSIGNEE], found_asset[self.DESCRIPTION],
-                         found_asset[self.COLOR], found_asset[self.STATUS]]
-                        for found_asset in found_assets
-                    ]
-                    print(tabulate(data, headers=headers, tablefmt="fancy_grid"))
-                    #Logging Activity
-                    log_message = f"Found assets with {search_column} = {search_value}"
-                    self.log_activity(log_message)
-                else:
-                    print(f"No assets found with {search_column} = {search_value}.\n")
-
-        except FileNotFoundError:
+            found_assets = self.query_engine.search(query)
+        except QueryError:
+            if '=' in search_column:
+                print("Entry can't be found or you mispelt an entry!")
+                return
+            # Not a query: plain words, ranked by how well they match
+            results = self.backend.fulltext.search(search_column)
+            found_assets = [row for row, _ in results]
+            scores = [score for _, score in results]
+
+        if found_assets:
+            headers = [self.ID, self.SN, self.CATEGORY, self.TYPE, self.LOCATION, self.ASSIGNEE, self.DESCRIPTION, self.COLOR, self.STATUS]
+            print("\nFound Assets:" if scores is None else f"\nBest matches (top {len(found_assets)}):")
+            data = [
+                [found_asset[self.ID], found_asset[self.SN], found_asset[self.CATEGORY], found_asset[self.TYPE],
+                 found_asset[self.LOCATION], found_asset[self.ASSIGNEE], found_asset[self.DESCRIPTION],
+                 found_asset[self.COLOR], found_asset[self.STATUS]]
+                for found_asset in found_assets
+            ]
+            if scores is not None:
+                headers.append('SCORE')
+                for row, score in zip(data, scores):
+                    row.append(score)
+            from tabulate import tabulate
+            with phase('render_table'):
+                table = tabulate(data, headers=headers, tablefmt="fancy_grid")
+            print(table)
+            #Logging Activity
+            log_message = f"Found assets with {search_text}"
+            self.log_activity(log_message, event='search', query=search_text, count=len(found_assets))
+        elif len(self.store) == 0:
             print("No assets found.\n")
-        except KeyError:
-            print("Entry can't be found or you mispelt an entry!")
-            main()
-        
+        else:
+            print(f"No assets found with {search_text}.\n")
 
+    @timed
     def update_asset(self):
         print(f"{Fore.GREEN}Updating Assets{Style.RESET_ALL}")
-        sn = input("Enter the serial number of the asset you want to update: ")
+        sn = user_input("Enter the serial number of the asset you want to update: ")
         sn = sn.strip().upper()
 
-        field_to_update = input(
+        field_to_update = user_input(
             "Enter the field to update (SN / CATEGORY / TYPE / LOCATION / ASSIGNEE / DESCRIPTION /COLOR / STATUS): ")
         field_to_update = field_to_update.strip().upper()
 
-        new_value = input(f"Enter the new value for {field_to_update}: ")
-        new_value = new_value.strip().upper()
+        if field_to_update not in FIELDNAMES or field_to_update == self.ID:
+            print("Entry can't be found or you mispelt an entry!")
+            return
 
-        rows = []
-        updated = False
+        row = self.store.get(sn)
+        if row is None:
+            print(f"Asset '{sn}' not found.\n")
+            return
 
-        try:
-            with open('assets.csv', 'r', newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
+        # The value the new one replaces; if someone else changes it before we
+        # write, the update is refused rather than silently overwriting theirs
+        current_value = row[field_to_update]
+        print(f"Current {field_to_update}: {current_value}")
 
-                for row in reader:
-                    if row[self.SN] == sn:
-                        # Log the old values before updating
-                        log_message_old = f"Asset '{sn}' (ID: {row[self.ID]}) - {field_to_update}: {row[field_to_update]} - updated to {new_value}."
-                        self.log_activity(log_message_old)
+        new_value = user_input(f"Enter the new value for {field_to_update}: ")
+        new_value = new_value.strip().upper()
 
-                        row[field_to_update] = new_value
-                        updated = True
-                    rows.append(row)
+        if field_to_update == self.SN and new_value != sn and not self.is_serial_number_unique(new_value):
+            print(f"Serial number '{new_value}' already exists. Please enter a unique serial number.\n")
+            return
 
-            if updated:
-                with open('assets.csv', 'w', newline='') as csvfile:
-                    writer = csv.DictWriter(csvfile, fieldnames=[self.ID, self.SN, self.CATEGORY, self.TYPE,
-                                                                 self.LOCATION, self.ASSIGNEE ,self.DESCRIPTION, self.COLOR, self.STATUS])
-                    writer.writeheader()
-                    writer.writerows(rows)
+        try:
+            old_value = self.store.update(sn, field_to_update, new_value, expected=current_value)
+        except ConflictError as e:
+            print(f"{e}. Nothing saved, please try again.\n")
+            return
+        except PermissionError:
+            print("Cannot access file.\nPlease close(terminate) your spreadsheet reader and try again!")
+            return
 
+        if old_value is None:
+            print(f"Asset '{sn}' was deleted in the meantime.\n")
+            return
 
-                print(f"Asset '{sn}' updated to {new_value} successfully!\n")
-            else:
-                print(f"Asset '{sn}' not found.\n")
+        # Log the old values after a successful update
+        log_message_old = f"Asset '{sn}' (ID: {row[self.ID]}) - {field_to_update}: {old_value} - updated to {new_value}."
+        self.log_activity(log_message_old, event='update', sn=sn, id=int(row[self.ID]),
+                          field=field_to_update, old=old_value, new=new_value)
 
-        except FileNotFoundError:
-            print("No assets found.\n")
+        print(f"Asset '{sn}' updated to {new_value} successfully!\n")
 
+    @timed
     def delete_asset(self):
         print(f"{Fore.GREEN}Deleting Assets{Style.RESET_ALL}")
-        sn = input("Enter the serial number of the asset you want to delete: ")
+        sn = user_input("Enter the serial number of the asset you want to delete: ")
         sn = sn.strip().upper()
 
-        rows = []
-        deleted = False
+        try:
+            row = self.store.delete(sn)
+        except PermissionError:
+            print("Cannot access file.\nPlease close(terminate) your spreadsheet reader and try again!")
+            return
+
+        if row is not None:
+            # Log the asset information after deleting
+            log_message = f"Asset '{sn}' (ID: {row[self.ID]}) deleted successfully."
+            self.log_activity(log_message, event='delete', sn=sn, id=int(row[self.ID]))
+
+            print(f"Asset '{sn}' deleted successfully!\n")
+        else:
+            print(f"Asset '{sn}' not found.\n")
+
+    def select_assets(self):
+        # Ask which assets a batch operation applies to; returns a list of SNs or None
+        print("\n1) Serial numbers (typed in)")
+        print("2) Serial numbers from a file (one per line)")
+        print("3) Search query, e.g. LOCATION=HQ AND STATUS=ACTIVE")
+        select_choice = user_input("Select the assets by: ")
+        select_choice = select_choice.strip()
+
+        if select_choice == "1":
+            serial_numbers = user_input("Enter the serial numbers, separated by commas: ")
+            serial_numbers = [sn.strip().upper() for sn in serial_numbers.split(",")]
+        elif select_choice == "2":
+            sn_path = user_input("Enter the path of the file: ")
+            sn_path = sn_path.strip().strip('"')
+            try:
+                with open(sn_path, 'r') as sn_file:
+                    serial_numbers = [sn.strip().upper() for line in sn_file for sn in line.split(",")]
+            except FileNotFoundError:
+                print(f"File '{sn_path}' not found.\n")
+                return None
+        elif select_choice == "3":
+            select_query = user_input("Enter the search query: ")
+            try:
+                return [row[self.SN] for row in self.query_engine.search(select_query)]
+            except QueryError:
+                print("Entry can't be found or you mispelt an entry!")
+                return None
+        else:
+            print("Invalid choice")
+            return None
+
+        return [sn for sn in serial_numbers if sn]
+
+    @timed
+    def batch_update_assets(self):
+        print(f"{Fore.GREEN}Batch Updating Assets{Style.RESET_ALL}")
+        serial_numbers = self.select_assets()
+        if not serial_numbers:
+            print("No assets selected.\n")
+            return
+
+        changes = {}
+        while True:
+            field_to_update = user_input(
+                "Enter the field to update (CATEGORY / TYPE / LOCATION / ASSIGNEE / DESCRIPTION /COLOR / STATUS), leave blank to finish: ")
+            field_to_update = field_to_update.strip().upper()
+            if field_to_update == "":
+                break
+            if field_to_update not in FIELDNAMES or field_to_update in (self.ID, self.SN):
+                print("Entry can't be found or you mispelt an entry!")
+                continue
+
+            new_value = user_input(f"Enter the new value for {field_to_update}: ")
+            changes[field_to_update] = new_value.strip().upper()
+
+        if not changes:
+            print("Nothing to update.\n")
+            return
 
         try:
-            with open('assets.csv', 'r', newline='') as csvfile:
-                reader = csv.DictReader(csvfile)
-
-                for row in reader:
-                    if row[self.SN] == sn:
-                        # Log the asset information before deleting
-                        log_message = f"Asset '{sn}' (ID: {row[self.ID]}) deleted successfully."
-                        self.log_activity(log_message)
-
-                        deleted = True
-                    else:
-                        rows.append(row)
-
-            if deleted:
-                with open('assets.csv', 'w', newline='') as csvfile:
-                    writer = csv.DictWriter(csvfile, fieldnames=[self.ID, self.SN, self.CATEGORY, self.TYPE,
-                                                                 self.LOCATION, self.ASSIGNEE ,self.DESCRIPTION, self.COLOR, self.STATUS])
-                    writer.writeheader()
-                    writer.writerows(rows)
-
-                print(f"Asset '{sn}' deleted successfully!\n")
-            else:
-                print(f"Asset '{sn}' not found.\n")
+            updated = self.store.update_many(serial_numbers, changes)
+        except PermissionError:
+            print("Cannot access file.\nPlease close(terminate) your spreadsheet reader and try again!")
+            return
+
+        # Log the old values of every asset after the single write
+        for row, old_values in updated:
+            for field, old_value in old_values.items():
+                log_message = f"Asset '{row[self.SN]}' (ID: {row[self.ID]}) - {field}: {old_value} - updated to {changes[field]}."
+                self.log_activity(log_message, event='update', sn=row[self.SN], id=int(row[self.ID]),
+                                  field=field, old=old_value, new=changes[field])
+
+        not_found = len(set(serial_numbers)) - len(updated)
+        print(f"{len(updated)} assets updated successfully!")
+        if not_found:
+            print(f"{not_found} serial numbers not found.")
+        print()
+
+    @timed
+    def batch_delete_assets(self):
+        print(f"{Fore.GREEN}Batch Deleting Assets{Style.RESET_ALL}")
+        serial_numbers = self.select_assets()
+        if not serial_numbers:
+            print("No assets selected.\n")
+            return
+
+        confirm = user_input(f"Are you sure you want to delete {len(set(serial_numbers))} assets? [Y/N]: ")
+        if confirm.strip().upper() != "Y":
+            print("Nothing deleted.\n")
+            return
 
-        except FileNotFoundError:
+        try:
+            deleted = self.store.delete_many(serial_numbers)
+        except PermissionError:
+            print("Cannot access file.\nPlease close(terminate) your spreadsheet reader and try again!")
+            return
+
+        # Log every deleted asset after the single write
+        for row in deleted:
+            log_message = f"Asset '{row[self.SN]}' (ID: {row[self.ID]}) deleted successfully."
+            self.log_activity(log_message, event='delete', sn=row[self.SN], id=int(row[self.ID]))
+
+        not_found = len(set(serial_numbers)) - len(deleted)
+        print(f"{len(deleted)} assets deleted successfully!")
+        if not_found:
+            print(f"{not_found} serial numbers not found.")
+        print()
+
+    @timed
+    def summarize_assets(self):
+        print(f"{Fore.GREEN}Inventory Summary{Style.RESET_ALL}")
+        fields = user_input(f"Enter the columns to count by, separated by commas ({' / '.join(SUMMARY_FIELDS)}): ")
+
+        try:
+            fields = parse_fields(fields)
+            if not fields:
+                print("Entry can't be found or you mispelt an entry!")
+                return
+            groups = self.backend.summary.group_by(fields)
+        except QueryError as e:
+            print(f"{e}\n")
+            return
+        except PermissionError:
+            print("Cannot access file.\nPlease close(terminate) your spreadsheet reader and try again!")
+            return
+
+        if not groups:
             print("No assets found.\n")
+            return
+        from tabulate import tabulate
+        data = [list(values) + [count] for values, count in groups]
+        total = sum(count for _, count in groups)
+        with phase('render_table'):
+            table = tabulate(data, headers=fields + ['COUNT'], tablefmt="fancy_grid")
+        print(table)
+        print(f"{len(groups)} groups, {total} assets in total.\n")
+
+        # Log the activity
+        log_message = f"Summarized assets by {', '.join(fields)}."
+        self.log_activity(log_message, event='summary', query=', '.join(fields), count=len(groups))
 
 init(autoreset=True)  # Initialize colorama
 
@@ -314,50 +515,91 @@ def print_yellow(text, rate=0.001):
         sys.stdout.flush()
         time.sleep(rate)
 
-class UserManager:
-    def __init__(self):
-        self.log_file = 'activity.log'
-
-    def log_activity(self, message):
-        timestamp = datetime.now().strftime("%A, %Y-%m-%d %I:%M:%S %p")
-        with open(self.log_file, 'a') as log_file:
-            log_file.write(f"{timestamp} {message}\n")
+# Work factor for new password hashes; raise it as hardware gets faster
+HASH_ITERATIONS = int(os.environ.get('AMS_HASH_ITERATIONS', 200000))
 
+class UserManager:
+    def __init__(self, backend=None, hash_iterations=HASH_ITERATIONS):
+        self.log_file = audit.USERS_LOG
+        # Where usernames and password hashes are kept (see storage.py)
+        self.users = (backend or default_backend()).users
+        self.hash_iterations = hash_iterations
+        # Hashing runs here so the console can keep printing while it works
+        self.executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='password-hash')
+
+    def log_activity(self, message, event=None, **fields):
+        # Structured line in activity.log, written by the audit thread (see audit.py)
+        audit.user_event(event, message, **fields)
+
+    @timed
     def login(self, username, password):
-        if os.path.exists('user_data.csv'):
-            with open('user_data.csv', 'r', newline='') as csvfile:
-                csvreader = csv.DictReader(csvfile)
-                for row in csvreader:
-                    if row['username'] == username and self.verify_password(row['password'], password):
-                        log_message = f"'{username}' has logged in."
-                        self.log_activity(log_message)
-                        return True
+        stored_password = self.users.get(username)
+        if stored_password is None:
+            # Hash anyway, so a wrong username takes as long as a wrong
+            # password and the response time does not tell which accounts exist
+            self.verify_password(self.dummy_hash(), password)
+            return False
+        if self.verify_password(stored_password, password):
+            log_message = f"'{username}' has logged in."
+            self.log_activity(log_message, event='login', user=username)
+            return True
         return False
 
-    def create_account(self, username, password):
-        fieldnames = ['username', 'password']
+    def dummy_hash(self):
+        # A hash in the current format that no password matches
+        return f"pbkdf2_sha256${self.hash_iterations}${'00' * 16}${'00' * 32}"
 
-        if not os.path.exists('user_data.csv'):
-            with open('user_data.csv', 'w', newline='') as csvfile:
-                writer = csv.DictWriter(csvfile, fieldnames=fieldnames, quoting=csv.QUOTE_MINIMAL)
-                writer.writeheader()
+    @timed
+    def create_account(self, username, password):
+        # Usernames must be unique
+        if self.users.get(username) is not None:
+            return False
 
         hashed_password = self.hash_password(password)
 
-        with open('user_data.csv', 'a', newline='') as csvfile:
-            writer = csv.DictWriter(csvfile, fieldnames=fieldnames, quoting=csv.QUOTE_MINIMAL)
-            writer.writerow({'username': username, 'password': hashed_password})
+        if self.users.add(username, hashed_password):
             log_message = f"Account created for user '{username}'."
-            self.log_activity(log_message)
+            self.log_activity(log_message, event='create_account', user=username)
             return True
+        return False
+
+    def login_async(self, username, password):
+        return self.executor.submit(self.login, username, password)
 
-    def hash_password(self, password):
-        # Use a secure hashing algorithm (e.g., SHA-256) for password hashing
-        return hashlib.sha256(password.encode()).hexdigest()
+    def create_account_async(self, username, password):
+        return self.executor.submit(self.create_account, username, password)
+
+    def hash_password(self, password, salt=None, iterations=None):
+        # Salted PBKDF2-SHA256, stored as pbkdf2_sha256$iterations$salt$hash
+        salt = salt or os.urandom(16).hex()
+        iterations = iterations or self.hash_iterations
+        with phase('hash_password'):
+            digest = hashlib.pbkdf2_hmac('sha256', password.encode(), bytes.fromhex(salt), iterations)
+        return f"pbkdf2_sha256${iterations}${salt}${digest.hex()}"
 
     def verify_password(self, stored_password, entered_password):
         # Compare hashed passwords during login verification
-        return stored_password == self.hash_password(entered_password)
+        if stored_password.startswith("pbkdf2_sha256$"):
+            _, iterations, salt, _ = stored_password.split("$")
+            entered_hash = self.hash_password(entered_password, salt=salt, iterations=int(iterations))
+        else:
+            # Accounts created before PBKDF2 store a plain SHA-256 hex digest
+            entered_hash = hashlib.sha256(entered_password.encode()).hexdigest()
+        return hmac.compare_digest(stored_password, entered_hash)
+
+def wait_with_dots(future, message):
+    # Keep the console alive while a password is hashed in the background
+    sys.stdout.write(message)
+    sys.stdout.flush()
+    while True:
+        try:
+            result = future.result(timeout=0.2)
+        except TimeoutError:
+            sys.stdout.write(".")
+            sys.stdout.flush()
+            continue
+        print()
+        return result
 
 def display_menu():
     print("\n" + "=" * 30)
@@ -370,11 +612,10 @@ def display_menu():
 def login(user_manager):
     print("\n" + "=" * 30)
     print(f"{Fore.YELLOW}Login{Style.RESET_ALL}")
-    username = input("Enter your username: ")
-    password = input("Enter your password: ")
+    username = user_input("Enter your username: ")
+    password = user_input("Enter your password: ")
 
-    # Dummy authentication (replace with your authentication logic)
-    if user_manager.login(username, password):
+    if wait_with_dots(user_manager.login_async(username, password), "Checking credentials"):
         print(f"{Fore.GREEN}Login successful!{Style.RESET_ALL}")
         return True
     else:
@@ -384,16 +625,14 @@ def login(user_manager):
 def create_user(user_manager):
     print("\n" + "=" * 30)
     print(f"{Fore.YELLOW}Create User{Style.RESET_ALL}")
-    new_username = input("Enter a new username: ")
-    new_password = input("Enter a new password: ")
+    new_username = user_input("Enter a new username: ")
+    new_password = user_input("Enter a new password: ")
 
-    # Dummy storage (replace with your user creation logic)
-    # Here, we are storing the username and a hash of the password.
-    # In a real application, use a secure storage mechanism.
-    if user_manager.create_account(new_username, new_password):
+    # Here, we are storing the username and a salted PBKDF2 hash of the password.
+    if wait_with_dots(user_manager.create_account_async(new_username, new_password), "Creating account"):
         print(f"{Fore.GREEN}User created successfully!{Style.RESET_ALL}")
     else:
-        print(f"{Fore.RED}Failed to create user.{Style.RESET_ALL}")
+        print(f"{Fore.RED}Failed to create user. The username may already be taken.{Style.RESET_ALL}")
 
 
 # Main function
@@ -409,9 +648,13 @@ def main():
         print("3. Update Asset")
         print("4. Delete Asset")
         print("5. Search Asset")
-        print("6) Exit")
+        print("6. Import Assets")
+        print("7. Batch Update Assets")
+        print("8. Batch Delete Assets")
+        print("9. Inventory Summary")
+        print("10) Exit")
 
-        choice = input("Enter your choice (1-6): ")
+        choice = user_input("Enter your choice (1-10): ")
         choice = choice.strip()
 
         if choice == '1':
@@ -425,9 +668,22 @@ def main():
         elif choice == '5':
             asset_system.search_assets()
         elif choice == '6':
-
-            confirm = input("Are you sure you want to exit this application? [Y/N]: ")
+            asset_system.import_assets()
+        elif choice == '7':
+            asset_system.batch_update_assets()
+        elif choice == '8':
+            asset_system.batch_delete_assets()
+        elif choice == '9':
+            asset_system.summarize_assets()
+        elif choice == '10':
+
+            confirm = user_input("Are you sure you want to exit this application? [Y/N]: ")
             if confirm.strip().upper() == "Y":
+                # Leave a current assets.csv behind for spreadsheets and other tools
+                try:
+                    asset_system.store.compact()
+                except PermissionError:
+                    pass
                 print(f"{Fore.CYAN}Exiting the Asset Management System. Goodbye!{Style.RESET_ALL}\n")
                 print(f"{Fore.YELLOW}AMS, powered by GridCode.{Style.RESET_ALL}")
                 sys.exit()
@@ -437,11 +693,15 @@ def main():
                 print(f"{Fore.RED}Invalid response, {confirm}{Style.RESET_ALL}\n")
                 main()
         else:
-            print(f"{Fore.RED}Invalid choice. Please enter a number between 1 and 6.{Style.RESET_ALL}\n")
+            print(f"{Fore.RED}Invalid choice. Please enter a number between 1 and 10.{Style.RESET_ALL}\n")
 
 
 if __name__ == "__main__":
-    
+
+    # options were parsed at the top, before the imports
+    if options.metrics:
+        metrics.configure(options.metrics)
+
     text_to_print=r""""
   ,----..           ,-.----.              ,---,            ,---,              ,----..             /   /   \              ,---,                ,---,. 
  /   /   \          \    /  \          ,`--.' |          .'  .' `\           /   /   \           /   .     :           .'  .' `\            ,'  .' | 
@@ -457,23 +717,26 @@ if __name__ == "__main__":
  \   \ .'           |   |.'            '---'           |   ,.'               \   \ .'              `---`             |   ,.'              |   | ,'   
   `---`             `---'                              '---'                  `---`                                  '---'                `----'     
 """
-    print_yellow(text_to_print, rate=0.001)
-
-
-    user_manager = UserManager()
-
-    while True:
-        display_menu()
-        choice = input("Enter your choice (1-3): ")
-
-        if choice == "1":
-            if login(user_manager):
-                # Continue to display menu after successful login
-                main()
-        elif choice == "2":
-            create_user(user_manager)
-        elif choice == "3":
-            print(f"{Fore.CYAN}Exiting. Goodbye!{Style.RESET_ALL}")
-            break
-        else:
-            print(f"{Fore.RED}Invalid choice. Please enter a valid option.{Style.RESET_ALL}")
+    # The typewriter banner is only for people watching a terminal
+    if sys.stdout.isatty():
+        print_yellow(text_to_print, rate=0.001)
+
+
+    with metrics.profiled(options.profile) if options.profile else contextlib.nullcontext():
+        user_manager = UserManager()
+
+        while True:
+            display_menu()
+            choice = user_input("Enter your choice (1-3): ")
+
+            if choice == "1":
+                if login(user_manager):
+                    # Continue to display menu after successful login
+                    main()
+            elif choice == "2":
+                create_user(user_manager)
+            elif choice == "3":
+                print(f"{Fore.CYAN}Exiting. Goodbye!{Style.RESET_ALL}")
+                break
+            else:
+                print(f"{Fore.RED}Invalid choice. Please enter a valid option.{Style.RESET_ALL}")
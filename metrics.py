@@ -0,0 +1,230 @@
+import atexit
+import builtins
+import contextlib
+import contextvars
+import functools
+import os
+import sys
+import threading
+import time
+from bisect import bisect_left
+
+# Timings and I/O counters for the whole system, kept in memory and written
+# out in the Prometheus text format for node_exporter's textfile collector.
+#
+#   ams_operation_seconds{operation="search_assets"}   histogram of latencies
+#   ams_phase_seconds{phase="read_csv"}               histogram of the steps inside
+#   ams_operation_errors_total{operation=...}          operations that raised
+#   ams_rows_scanned_total{operation=...}              rows parsed, checked or counted
+#   ams_bytes_read_total{operation=...}                bytes of data files read
+#   ams_bytes_written_total{operation=...}             bytes of data files written
+#
+# An operation is a console action (create_asset, login, ...), a CLI command
+# or an HTTP request. Rows and bytes are charged to the operation running in
+# the same thread or asyncio task, or to "background" (e.g. the journal
+# compactor). Time spent waiting at an input() prompt is not counted as
+# latency. Recording costs a microsecond or two; nothing is written unless a
+# metrics file is configured (--metrics or AMS_METRICS_FILE).
+
+METRICS_ENV = 'AMS_METRICS_FILE'
+
+# Histogram bucket upper bounds, in seconds
+BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+
+# The file is rewritten after an operation at most this often, and at exit
+WRITE_INTERVAL = 10
+
+# Lines of the text summary written next to a --profile dump
+PROFILE_LINES = 40
+
+HELP = {
+    'ams_operation_seconds': ('histogram', "Time spent in each operation, not counting prompts."),
+    'ams_phase_seconds': ('histogram', "Time spent in each step of an operation."),
+    'ams_operation_errors_total': ('counter', "Operations that ended with an error."),
+    'ams_rows_scanned_total': ('counter', "Asset rows parsed, checked or counted."),
+    'ams_bytes_read_total': ('counter', "Bytes of data files read."),
+    'ams_bytes_written_total': ('counter', "Bytes of data files written."),
+}
+
+
+class Histogram:
+    __slots__ = ('buckets', 'sum', 'count')
+
+    def __init__(self):
+        # One count per bucket plus one for anything slower than the last
+        self.buckets = [0] * (len(BUCKETS) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds):
+        self.buckets[bisect_left(BUCKETS, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+
+_lock = threading.Lock()
+# metric name -> {label value: Histogram or number}
+_metrics = {name: {} for name in HELP}
+# [operation name, seconds spent at prompts] of the running operation
+_current = contextvars.ContextVar('ams_operation', default=None)
+_path = os.environ.get(METRICS_ENV)
+_last_write = 0.0
+_exit_registered = False
+
+
+def _observe(name, label, seconds):
+    with _lock:
+        histogram = _metrics[name].get(label)
+        if histogram is None:
+            histogram = _metrics[name][label] = Histogram()
+        histogram.observe(seconds)
+
+
+def _count(name, amount):
+    state = _current.get()
+    label = state[0] if state is not None else 'background'
+    with _lock:
+        values = _metrics[name]
+        values[label] = values.get(label, 0) + amount
+
+
+def rows_scanned(count):
+    _count('ams_rows_scanned_total', count)
+
+
+def bytes_read(count):
+    _count('ams_bytes_read_total', count)
+
+
+def bytes_written(count):
+    _count('ams_bytes_written_total', count)
+
+
+@contextlib.contextmanager
+def operation(name):
+    state = [name, 0.0]
+    token = _current.set(state)
+    start = time.perf_counter()
+    try:
+        yield
+    except Exception:
+        _count('ams_operation_errors_total', 1)
+        raise
+    finally:
+        _current.reset(token)
+        _observe('ams_operation_seconds', name, time.perf_counter() - start - state[1])
+        if _path is not None and time.monotonic() - _last_write >= WRITE_INTERVAL:
+            write()
+
+
+def timed(method):
+    # Decorator: time every call as an operation named after the method
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with operation(method.__name__):
+            return method(*args, **kwargs)
+    return wrapper
+
+
+@contextlib.contextmanager
+def phase(name):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        _observe('ams_phase_seconds', name, time.perf_counter() - start)
+
+
+def user_input(prompt=''):
+    # input(), with the wait left out of the running operation's latency
+    start = time.perf_counter()
+    try:
+        return builtins.input(prompt)
+    finally:
+        state = _current.get()
+        if state is not None:
+            state[1] += time.perf_counter() - start
+
+
+def _label(value):
+    return value.replace('\\', r'\\').replace('"', r'\"').replace('\n', r'\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def render():
+    # Every metric in the Prometheus text exposition format
+    label_names = {'ams_phase_seconds': 'phase'}
+    lines = []
+    with _lock:
+        for name, (kind, help_text) in HELP.items():
+            values = _metrics[name]
+            if not values:
+                continue
+            label_name = label_names.get(name, 'operation')
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+            for label, value in sorted(values.items()):
+                label = f'{label_name}="{_label(label)}"'
+                if kind == 'counter':
+                    lines.append(f"{name}{{{label}}} {value}")
+                    continue
+                cumulative = 0
+                for bound, count in zip(BUCKETS + ('+Inf',), value.buckets):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label},le="{bound}"}} {cumulative}')
+                lines.append(f"{name}_sum{{{label}}} {_number(value.sum)}")
+                lines.append(f"{name}_count{{{label}}} {value.count}")
+    return '\n'.join(lines) + '\n'
+
+
+def configure(path):
+    # Write the metrics to path after operations and at exit
+    global _path, _exit_registered
+    _path = path
+    if path is not None and not _exit_registered:
+        atexit.register(write)
+        _exit_registered = True
+
+
+def write(path=None):
+    # Replace the metrics file in one rename, so a scrape never sees half of it
+    global _last_write
+    path = path or _path
+    if path is None:
+        return
+    _last_write = time.monotonic()
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    try:
+        with open(tmp_path, 'w') as metrics_file:
+            metrics_file.write(render())
+        os.replace(tmp_path, path)
+    except OSError as e:
+        print(f"Cannot write metrics to '{path}': {e}", file=sys.stderr)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+@contextlib.contextmanager
+def profiled(path):
+    # cProfile everything run in this thread; path gets the pstats dump and
+    # path + '.txt' the slowest functions by cumulative time
+    import cProfile
+    import pstats
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield profiler
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        with open(path + '.txt', 'w') as report:
+            pstats.Stats(profiler, stream=report).sort_stats('cumulative').print_stats(PROFILE_LINES)
+        print(f"Profile written to '{path}' (summary in '{path}.txt').", file=sys.stderr)
+
+
+if _path is not None:
+    configure(_path)
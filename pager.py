@@ -0,0 +1,139 @@
+import itertools
+
+import metrics
+from store import FIELDNAMES
+
+PAGE_SIZE = 20
+
+# Column widths come from the headers and the first rows read, capped so one
+# long description cannot push the table off the screen
+WIDTH_SAMPLE_ROWS = 200
+MAX_COLUMN_WIDTH = 30
+
+
+def _fit(value, width):
+    if len(value) > width:
+        return value[:width - 1] + '…'
+    return value
+
+
+def _sort_key(column):
+    if column == 'ID':
+        return lambda row: int(row['ID'])
+    return lambda row: row[column]
+
+
+class Pager:
+    # Pages through rows without reading them all up front.
+    # Rows are pulled from the source only as far as the requested page and
+    # kept so earlier pages can be shown again. Sorting has to see every row,
+    # so it reads the rest of the source first.
+
+    def __init__(self, rows, headers=FIELDNAMES, page_size=PAGE_SIZE, total=None):
+        self.headers = list(headers)
+        self.page_size = page_size
+        self.total = total
+        self._source = iter(rows)
+        self._rows = []
+        self._exhausted = False
+        self.widths = None
+
+    def _fill(self, count):
+        if self._exhausted or len(self._rows) >= count:
+            return
+        self._rows.extend(itertools.islice(self._source, count - len(self._rows)))
+        if len(self._rows) < count:
+            self._exhausted = True
+            self.total = len(self._rows)
+
+    def _compute_widths(self):
+        self._fill(max(WIDTH_SAMPLE_ROWS, self.page_size))
+        widths = [len(header) for header in self.headers]
+        for row in self._rows[:WIDTH_SAMPLE_ROWS]:
+            for i, header in enumerate(self.headers):
+                widths[i] = max(widths[i], len(row[header]))
+        self.widths = [min(width, MAX_COLUMN_WIDTH) for width in widths]
+
+    def page_count(self):
+        # None while the end of the source has not been reached
+        if self.total is None:
+            return None
+        return max(1, -(-self.total // self.page_size))
+
+    def page(self, number):
+        # Rows on page number (0-based), clamped to the last page
+        number = max(0, number)
+        self._fill((number + 1) * self.page_size + 1)
+        last = self.page_count()
+        if last is not None and number >= last:
+            number = last - 1
+        start = number * self.page_size
+        return number, self._rows[start:start + self.page_size]
+
+    def sort(self, column, reverse=False):
+        self._rows.extend(self._source)
+        self._exhausted = True
+        self.total = len(self._rows)
+        self._rows.sort(key=_sort_key(column), reverse=reverse)
+
+    def render(self, rows):
+        if self.widths is None:
+            self._compute_widths()
+
+        def line(left, fill, middle, right):
+            return left + middle.join(fill * (width + 2) for width in self.widths) + right
+
+        def cells(values):
+            return '│' + '│'.join(f" {_fit(value, width):<{width}} " for value, width in zip(values, self.widths)) + '│'
+
+        out = [line('╒', '═', '╤', '╕'), cells(self.headers), line('╞', '═', '╪', '╡')]
+        out.extend(cells([row[header] for header in self.headers]) for row in rows)
+        out.append(line('╘', '═', '╧', '╛'))
+        return '\n'.join(out)
+
+    def browse(self):
+        # Interactive loop: next / previous / go to page / sort / quit
+        number = 0
+        while True:
+            number, rows = self.page(number)
+            if not rows:
+                print("No assets found.\n")
+                return
+
+            with metrics.phase('render_table'):
+                table = self.render(rows)
+            print(table)
+            pages = self.page_count()
+            of_pages = f" of {pages}" if pages is not None else ""
+            print(f"Page {number + 1}{of_pages}")
+
+            command = metrics.user_input("[N]ext / [P]revious / [G]o to page / [S]ort / [Q]uit: ")
+            command = command.strip().upper()
+
+            if command in ("", "N"):
+                if pages is not None and number + 1 >= pages:
+                    print("This is the last page.")
+                else:
+                    number += 1
+            elif command == "P":
+                number = max(0, number - 1)
+            elif command.startswith("G"):
+                target = command[1:].strip() or metrics.user_input("Enter the page number: ").strip()
+                if target.isdigit() and int(target) > 0:
+                    number = int(target) - 1
+                else:
+                    print("Invalid page number.")
+            elif command.startswith("S"):
+                column = command[1:].strip() or metrics.user_input(
+                    "Enter the column to sort by (prefix with - for descending): ").strip().upper()
+                reverse = column.startswith("-")
+                column = column.lstrip("-")
+                if column in self.headers:
+                    self.sort(column, reverse=reverse)
+                    number = 0
+                else:
+                    print("Entry can't be found or you mispelt an entry!")
+            elif command == "Q":
+                return
+            else:
+                print("Invalid choice")
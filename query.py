@@ -0,0 +1,220 @@
+import heapq
+import re
+
+import metrics
+from store import FIELDNAMES, StoreListener
+
+# Low-cardinality columns that get an inverted index (value -> set of IDs)
+INDEXED_COLUMNS = ['CATEGORY', 'TYPE', 'LOCATION', 'ASSIGNEE', 'COLOR', 'STATUS']
+
+# One clause of a query, followed by AND or the end of the text:
+#   COLUMN=VALUE   COLUMN="VALUE WITH AND IN IT"   COLUMN=PREFIX*   COLUMN IN (A, B, C)
+_CLAUSE = re.compile(r'''
+    \s*(?P<column>\w+)\s*
+    (?:
+        =\s*(?P<quoted>"[^"]*"|'[^']*')
+      | =\s*?(?P<value>.*?)
+      | \s+IN\s*\((?P<items>[^)]*)\)
+    )
+    \s*(?:\s+AND\s+|$)
+''', re.VERBOSE)
+
+
+class QueryError(ValueError):
+    pass
+
+
+def _unquote(value):
+    value = value.strip()
+    if len(value) >= 2 and value[0] == value[-1] and value[0] in '"\'':
+        return value[1:-1]
+    return value
+
+
+def parse_query(text):
+    # Parse "CATEGORY=LAPTOP AND LOCATION=HQ AND STATUS IN (ACTIVE, SPARE)"
+    # into a list of (column, op, value) predicates. op is "eq", "prefix" or "in".
+    text = text.strip().upper()
+    if not text:
+        raise QueryError("Empty query")
+
+    if re.search(r'(?:^|\s)AND$', text):
+        raise QueryError("The query ends with AND; add another condition after it")
+
+    predicates = []
+    pos = 0
+    while pos < len(text):
+        match = _CLAUSE.match(text, pos)
+        if match is None or match.end() == pos:
+            raise QueryError(f"Cannot understand the query near '{text[pos:]}'")
+        pos = match.end()
+
+        column = match.group('column')
+        if column not in FIELDNAMES:
+            raise QueryError(f"Unknown column '{column}'")
+
+        if match.group('items') is not None:
+            if not match.group('items').strip():
+                raise QueryError(f"Empty list after {column} IN")
+            values = {_unquote(item) for item in match.group('items').split(',')}
+            predicates.append((column, 'in', values))
+        elif match.group('quoted') is not None:
+            predicates.append((column, 'eq', _unquote(match.group('quoted'))))
+        else:
+            value = match.group('value').strip()
+            # Only AND joins conditions; quote the value if it really contains OR
+            if re.search(r'\sOR\s', value):
+                raise QueryError(f"OR is not supported (near '{column}={value}'); "
+                                 f"use {column} IN (...) or quote the value")
+            if value.endswith('*'):
+                predicates.append((column, 'prefix', value[:-1]))
+            else:
+                predicates.append((column, 'eq', value))
+
+    return predicates
+
+
+def _matches(row, predicate):
+    column, op, value = predicate
+    if op == 'eq':
+        return row[column] == value
+    if op == 'prefix':
+        return row[column].startswith(value)
+    return row[column] in value
+
+
+def _value_test(predicate):
+    # The predicate as a test on one column value
+    column, op, value = predicate
+    if op == 'eq':
+        return value.__eq__
+    if op == 'prefix':
+        return lambda candidate: candidate.startswith(value)
+    return value.__contains__
+
+
+class QueryEngine(StoreListener):
+    # Runs conjunctive queries against an AssetStore.
+    # Inverted indexes for the INDEXED_COLUMNS are built the first time a query
+    # touches that column and then kept in step with the store's changes. SN and
+    # ID predicates use the store's own indexes. The planner intersects the most
+    # selective posting lists first and checks anything else row by row; a
+    # query with no indexed predicate at all has the store scan its encoded
+    # column for the first one.
+
+    def __init__(self, store):
+        self.store = store
+        self._indexes = {}
+        store.subscribe(self)
+
+    def on_reload(self):
+        self._indexes = {}
+
+    def on_add(self, row):
+        for column, index in self._indexes.items():
+            index.setdefault(row[column], set()).add(int(row['ID']))
+
+    def on_update(self, row, field, old_value):
+        index = self._indexes.get(field)
+        if index is not None:
+            self._discard(index, old_value, int(row['ID']))
+            index.setdefault(row[field], set()).add(int(row['ID']))
+
+    def on_delete(self, row):
+        for column, index in self._indexes.items():
+            self._discard(index, row[column], int(row['ID']))
+
+    def _discard(self, index, value, asset_id):
+        postings = index.get(value)
+        if postings is not None:
+            postings.discard(asset_id)
+            if not postings:
+                del index[value]
+
+    def index(self, column):
+        index = self._indexes.get(column)
+        if index is None:
+            index = self.store.column_index(column)
+            self._indexes[column] = index
+        return index
+
+    def _postings(self, predicate):
+        # Candidate IDs for a predicate, or None if it has to be checked row by row
+        column, op, value = predicate
+        values = [value] if op == 'eq' else value
+
+        if column == 'ID' and op != 'prefix':
+            return {int(v) for v in values if v.isdigit() and self.store.get_by_id(v) is not None}
+        if column == 'SN' and op != 'prefix':
+            return {int(row['ID']) for row in map(self.store.get, values) if row is not None}
+        if column not in INDEXED_COLUMNS:
+            return None
+
+        index = self.index(column)
+        if op == 'eq':
+            return index.get(value, set())
+        if op == 'prefix':
+            values = [key for key in index if key.startswith(value)]
+        postings = [index[v] for v in values if v in index]
+        if len(postings) == 1:
+            return postings[0]
+        return set().union(*postings)
+
+    def search(self, query):
+        # Rows matching every predicate, in ID order. query is a query string
+        # or a list of predicates from parse_query.
+        predicates = parse_query(query) if isinstance(query, str) else list(query)
+        self.store.refresh()
+
+        ids, residual = self._plan(predicates)
+        if ids is not None:
+            rows = self.store.get_many_by_id(sorted(ids))
+        else:
+            rows = self.store.rows()
+
+        if residual:
+            metrics.rows_scanned(len(rows))
+            rows = [row for row in rows if all(_matches(row, predicate) for predicate in residual)]
+        return rows
+
+    def search_page(self, query, offset, limit):
+        # (number of matches, rows offset..offset+limit of search(query)).
+        # When the indexes answer the whole query only the page's rows are
+        # looked up, and only the IDs up to the end of the page are ordered.
+        predicates = parse_query(query) if isinstance(query, str) else list(query)
+        self.store.refresh()
+
+        ids, residual = self._plan(predicates)
+        if ids is None:
+            # No predicates: every asset
+            return len(self.store), self.store.page(offset, limit)
+        if residual:
+            rows = self.search(predicates)
+            return len(rows), rows[offset:offset + limit]
+        page_ids = heapq.nsmallest(offset + limit, ids)[offset:]
+        return len(ids), self.store.get_many_by_id(page_ids)
+
+    def _plan(self, predicates):
+        # (candidate IDs or None for every row, predicates left to check row by row)
+        candidates = []
+        residual = []
+        for predicate in predicates:
+            postings = self._postings(predicate)
+            if postings is None:
+                residual.append(predicate)
+            else:
+                candidates.append(postings)
+
+        if candidates:
+            # Most selective first, so every intersection only shrinks a small
+            # set. The result may be an index's own posting set: read it only.
+            candidates.sort(key=len)
+            ids = candidates[0]
+            for postings in candidates[1:]:
+                if not ids:
+                    break
+                ids = ids & postings
+            return ids, residual
+        if residual:
+            return self.store.match_ids(residual[0][0], _value_test(residual[0])), residual[1:]
+        return None, residual
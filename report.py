@@ -0,0 +1,168 @@
+import itertools
+import os
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+import metrics
+from store import FIELDNAMES
+
+# Landscape A4 in points, Courier so every character has the same width
+PAGE_WIDTH = 842
+PAGE_HEIGHT = 595
+MARGIN = 36
+FONT_SIZE = 8
+LINE_HEIGHT = 11
+CHAR_WIDTH = FONT_SIZE * 0.6
+
+# Characters per column; longer values are cut short
+COLUMN_WIDTHS = {'ID': 7, 'SN': 16, 'CATEGORY': 14, 'TYPE': 14, 'LOCATION': 14,
+                 'ASSIGNEE': 18, 'DESCRIPTION': 34, 'COLOR': 10, 'STATUS': 12}
+
+ROWS_PER_PAGE = (PAGE_HEIGHT - 2 * MARGIN - 3 * LINE_HEIGHT) // LINE_HEIGHT
+# Pages handed to a worker process at a time
+PAGES_PER_CHUNK = 50
+CHUNK_ROWS = ROWS_PER_PAGE * PAGES_PER_CHUNK
+
+
+def _escape(text):
+    text = text.encode('latin-1', 'replace').decode('latin-1')
+    return text.replace('\\', '\\\\').replace('(', '\\(').replace(')', '\\)')
+
+
+def _format_line(values):
+    cells = []
+    for field, value in zip(FIELDNAMES, values):
+        width = COLUMN_WIDTHS[field]
+        if len(value) > width:
+            value = value[:width - 1] + '~'
+        cells.append(value.ljust(width))
+    return ' '.join(cells)
+
+
+def _text(x, y, font, text):
+    return f"BT /{font} {FONT_SIZE} Tf {x:.1f} {y:.1f} Td ({_escape(text)}) Tj ET\n"
+
+
+def render_pages(rows, first_page, title):
+    # Content streams (compressed) for consecutive pages of rows.
+    # Runs in a worker process, so it only takes and returns plain data.
+    header = _format_line(FIELDNAMES)
+    rule = '-' * len(header)
+    pages = []
+    # An empty report still gets one page with the title and headers
+    for offset in range(0, max(len(rows), 1), ROWS_PER_PAGE):
+        page_number = first_page + offset // ROWS_PER_PAGE
+        y = PAGE_HEIGHT - MARGIN
+        parts = [_text(MARGIN, y, 'F2', title)]
+        y -= LINE_HEIGHT * 1.5
+        parts.append(_text(MARGIN, y, 'F2', header))
+        y -= LINE_HEIGHT * 0.7
+        parts.append(_text(MARGIN, y, 'F1', rule))
+        for values in rows[offset:offset + ROWS_PER_PAGE]:
+            y -= LINE_HEIGHT
+            parts.append(_text(MARGIN, y, 'F1', _format_line(values)))
+        footer = f"Page {page_number}"
+        parts.append(_text(PAGE_WIDTH - MARGIN - len(footer) * CHAR_WIDTH, MARGIN / 2, 'F1', footer))
+        pages.append(zlib.compress(''.join(parts).encode('latin-1')))
+    return pages
+
+
+class _PdfWriter:
+    # Writes a PDF object by object so pages can be streamed to disk.
+    # Object 1 is the catalog, 2 the page tree (written last, once every
+    # page is known) and 3/4 the two fonts.
+
+    def __init__(self, fileobj):
+        self.file = fileobj
+        self.offsets = {}
+        self.page_ids = []
+        self.next_id = 5
+        self.file.write(b"%PDF-1.4\n%\xe2\xe3\xcf\xd3\n")
+        self._object(1, b"<< /Type /Catalog /Pages 2 0 R >>")
+        self._object(3, b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier /Encoding /WinAnsiEncoding >>")
+        self._object(4, b"<< /Type /Font /Subtype /Type1 /BaseFont /Courier-Bold /Encoding /WinAnsiEncoding >>")
+
+    def _object(self, obj_id, body):
+        self.offsets[obj_id] = self.file.tell()
+        self.file.write(b"%d 0 obj\n" % obj_id)
+        self.file.write(body)
+        self.file.write(b"\nendobj\n")
+
+    def add_page(self, content):
+        content_id, page_id = self.next_id, self.next_id + 1
+        self.next_id += 2
+        self._object(content_id, b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(content)
+                     + content + b"\nendstream")
+        self._object(page_id, b"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 %d %d] "
+                              b"/Resources << /Font << /F1 3 0 R /F2 4 0 R >> >> /Contents %d 0 R >>"
+                     % (PAGE_WIDTH, PAGE_HEIGHT, content_id))
+        self.page_ids.append(page_id)
+
+    def close(self):
+        kids = b" ".join(b"%d 0 R" % page_id for page_id in self.page_ids)
+        self._object(2, b"<< /Type /Pages /Kids [%s] /Count %d >>" % (kids, len(self.page_ids)))
+
+        xref = self.file.tell()
+        self.file.write(b"xref\n0 %d\n0000000000 65535 f \n" % self.next_id)
+        for obj_id in range(1, self.next_id):
+            self.file.write(b"%010d 00000 n \n" % self.offsets[obj_id])
+        self.file.write(b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (self.next_id, xref))
+
+
+def _chunks(rows):
+    # Lists of row values, PAGES_PER_CHUNK pages at a time
+    rows = iter(rows)
+    while True:
+        chunk = [tuple(row[field] for field in FIELDNAMES)
+                 for row in itertools.islice(rows, CHUNK_ROWS)]
+        if not chunk:
+            return
+        yield chunk
+
+
+def build_report(rows, path='assets.pdf', title=None, workers=None):
+    # Stream rows into a landscape PDF report and return the number of pages.
+    # Chunks of pages are rendered in parallel by a process pool; only a few
+    # chunks are in flight at once, so memory stays bounded however many rows
+    # there are. The file is written next to path and renamed into place.
+    if title is None:
+        title = f"GridCode Asset Report - {datetime.now().strftime('%A, %Y-%m-%d %I:%M %p')}"
+    workers = workers or os.cpu_count() or 1
+
+    tmp_path = path + '.tmp'
+    chunks = _chunks(rows)
+    first = next(chunks, [])
+    try:
+        with open(tmp_path, 'wb') as pdf_file:
+            writer = _PdfWriter(pdf_file)
+
+            if len(first) < CHUNK_ROWS or workers == 1:
+                # Small reports are not worth starting worker processes for
+                page_number = 1
+                for chunk in itertools.chain([first], chunks):
+                    for content in render_pages(chunk, page_number, title):
+                        writer.add_page(content)
+                    page_number += PAGES_PER_CHUNK
+            else:
+                with ProcessPoolExecutor(max_workers=workers) as pool:
+                    pending = []
+                    page_number = 1
+                    for chunk in itertools.chain([first], chunks):
+                        pending.append(pool.submit(render_pages, chunk, page_number, title))
+                        page_number += PAGES_PER_CHUNK
+                        # Keep at most two chunks per worker in flight, written in order
+                        while len(pending) >= workers * 2:
+                            for content in pending.pop(0).result():
+                                writer.add_page(content)
+                    for future in pending:
+                        for content in future.result():
+                            writer.add_page(content)
+
+            writer.close()
+            metrics.bytes_written(pdf_file.tell())
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+    return len(writer.page_ids)
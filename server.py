@@ -0,0 +1,391 @@
+import asyncio
+import contextlib
+import contextvars
+import json
+import os
+import secrets
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import parse_qs, unquote, urlsplit
+
+import audit
+import metrics
+from store import FIELDNAMES, ConflictError
+from storage import default_backend
+from query import QueryError
+
+# Local HTTP/JSON service over the same assets and accounts as the console.
+#
+#   POST   /login              {"username": ..., "password": ...} -> {"token": ...}
+#   POST   /logout
+#   GET    /assets             ?page=1&page_size=50&sort=-LOCATION&q=STATUS=ACTIVE
+#   POST   /assets             {"SN": ..., "CATEGORY": ..., ...}
+#   GET    /assets/<sn>
+#   PATCH  /assets/<sn>        {"LOCATION": "ANNEX", "expected": {"LOCATION": "HQ"}}
+#   DELETE /assets/<sn>
+#   GET    /summary            ?by=CATEGORY,LOCATION
+#   GET    /changes            ?since=1200&limit=500
+#   GET    /search             ?text=dell+latitude+john&limit=20
+#
+# Everything but /login needs "Authorization: Bearer <token>". One process
+# keeps the store and its indexes warm for every client. Store calls run on
+# one thread of their own, strictly one at a time: while a journal compaction
+# holds the store for a full rewrite of the CSV, only requests that need the
+# store wait, and the event loop keeps accepting connections and logging
+# users in. Password hashing runs on the UserManager's own threads.
+# Connections are kept alive between requests.
+
+HOST = os.environ.get('AMS_HOST', '127.0.0.1')
+PORT = int(os.environ.get('AMS_PORT', 8080))
+
+# Idle sessions expire after this many seconds
+SESSION_SECONDS = 8 * 60 * 60
+MAX_BODY_BYTES = 1024 * 1024
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+ROUTES = {'/login', '/logout', '/assets', '/assets/<sn>', '/summary', '/changes', '/search'}
+
+REASONS = {200: 'OK', 201: 'Created', 400: 'Bad Request', 401: 'Unauthorized', 404: 'Not Found',
+           405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large', 500: 'Internal Server Error'}
+
+
+class HttpError(Exception):
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _as_json(row):
+    return dict(row, ID=int(row['ID']))
+
+
+def _int_param(params, name, default):
+    try:
+        return int(params.get(name, [default])[0])
+    except ValueError:
+        raise HttpError(400, f"{name} must be a number")
+
+
+class AssetServer:
+
+    def __init__(self, backend=None, user_manager=None):
+        self.backend = backend or default_backend()
+        self.store = self.backend.assets
+        self.query_engine = self.backend.query_engine()
+        if user_manager is None:
+            from main import UserManager
+            user_manager = UserManager(self.backend)
+        self.user_manager = user_manager
+        # token -> [username, expiry time]
+        self.sessions = {}
+        self.store_thread = ThreadPoolExecutor(max_workers=1, thread_name_prefix='store')
+
+    def log_activity(self, message, event=None, **fields):
+        audit.asset_event(event, message, **fields)
+
+    async def run_store(self, function, *args):
+        # function(*args) on the store thread, in the request's context so its
+        # metrics are charged to the request's operation
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.store_thread, context.run, function, *args)
+
+    # --- HTTP plumbing ---
+
+    async def handle_connection(self, reader, writer):
+        try:
+            while True:
+                try:
+                    request = await self.read_request(reader)
+                except HttpError as e:
+                    self.write_response(writer, e.status, {'error': e.message}, keep_alive=False)
+                    await writer.drain()
+                    break
+                if request is None:
+                    break
+
+                method, target, headers, body = request
+                status, payload = await self.dispatch(method, target, headers, body)
+                keep_alive = headers.get('connection', '').lower() != 'close'
+                self.write_response(writer, status, payload, keep_alive)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def read_request(self, reader):
+        # (method, target, headers, body), or None once the client hangs up
+        request_line = await reader.readline()
+        if not request_line.strip():
+            return None
+        try:
+            method, target, _ = request_line.decode('latin-1').split()
+        except ValueError:
+            raise HttpError(400, "Malformed request line")
+
+        headers = {}
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n', b''):
+                break
+            name, _, value = line.decode('latin-1').partition(':')
+            headers[name.strip().lower()] = value.strip()
+
+        try:
+            length = int(headers.get('content-length') or 0)
+        except ValueError:
+            raise HttpError(400, "Malformed Content-Length")
+        if length > MAX_BODY_BYTES:
+            raise HttpError(413, "Request body too large")
+        body = await reader.readexactly(length) if length else b''
+        return method.upper(), target, headers, body
+
+    def write_response(self, writer, status, payload, keep_alive=True):
+        body = json.dumps(payload).encode()
+        head = (f"HTTP/1.1 {status} {REASONS.get(status, '')}\r\n"
+                f"Content-Type: application/json\r\n"
+                f"Content-Length: {len(body)}\r\n"
+                f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+        writer.write(head.encode('latin-1') + body)
+
+    async def dispatch(self, method, target, headers, body):
+        url = urlsplit(target)
+        path = url.path.rstrip('/') or '/'
+        params = parse_qs(url.query)
+        # One latency histogram per route, not per asset
+        route = '/assets/<sn>' if path.startswith('/assets/') else path
+        if route not in ROUTES:
+            route = 'other'
+        with metrics.operation(f"{method} {route}"):
+            return await self.handle(method, path, params, headers, body, target)
+
+    async def handle(self, method, path, params, headers, body, target):
+        try:
+            try:
+                data = json.loads(body) if body else {}
+            except ValueError:
+                raise HttpError(400, "Request body is not valid JSON")
+            if not isinstance(data, dict):
+                raise HttpError(400, "Request body must be a JSON object")
+
+            if path == '/login':
+                self.require_method(method, 'POST')
+                return 200, await self.login(data)
+
+            username = self.authenticate(headers)
+            if path == '/logout':
+                self.require_method(method, 'POST')
+                self.sessions.pop(headers['authorization'].split()[-1], None)
+                return 200, {'message': "Logged out."}
+            if path == '/assets':
+                if method == 'GET':
+                    return 200, await self.run_store(self.list_assets, params)
+                self.require_method(method, 'POST')
+                return 201, await self.run_store(self.create_asset, data, username)
+            if path.startswith('/assets/'):
+                sn = unquote(path[len('/assets/'):]).strip().upper()
+                if method == 'GET':
+                    return 200, await self.run_store(self.get_asset, sn)
+                if method == 'PATCH':
+                    return 200, await self.run_store(self.update_asset, sn, data, username)
+                self.require_method(method, 'DELETE')
+                return 200, await self.run_store(self.delete_asset, sn, username)
+            if path == '/summary':
+                self.require_method(method, 'GET')
+                return 200, await self.run_store(self.summarize, params)
+            if path == '/changes':
+                self.require_method(method, 'GET')
+                return 200, await self.run_store(self.list_changes, params)
+            if path == '/search':
+                self.require_method(method, 'GET')
+                return 200, await self.run_store(self.search_text, params)
+            raise HttpError(404, f"No such resource '{path}'")
+        except HttpError as e:
+            return e.status, {'error': e.message}
+        except QueryError as e:
+            return 400, {'error': str(e)}
+        except ConflictError as e:
+            return 409, {'error': str(e)}
+        except PermissionError:
+            return 500, {'error': "Cannot access file. Please close(terminate) your spreadsheet reader and try again!"}
+        except Exception as e:
+            # Keep serving the other clients
+            print(f"Error handling {method} {target}: {e!r}", file=sys.stderr)
+            return 500, {'error': "Internal error"}
+
+    def require_method(self, method, allowed):
+        if method != allowed:
+            raise HttpError(405, f"Use {allowed}")
+
+    # --- sessions ---
+
+    async def login(self, data):
+        username = str(data.get('username', ''))
+        password = str(data.get('password', ''))
+        if not await asyncio.wrap_future(self.user_manager.login_async(username, password)):
+            raise HttpError(401, "Invalid username or password")
+        token = secrets.token_urlsafe(32)
+        self.sessions[token] = [username, time.monotonic() + SESSION_SECONDS]
+        return {'token': token, 'expires_in': SESSION_SECONDS}
+
+    def authenticate(self, headers):
+        # Username for the request's bearer token; each request extends the session
+        scheme, _, token = headers.get('authorization', '').partition(' ')
+        session = self.sessions.get(token.strip()) if scheme.lower() == 'bearer' else None
+        now = time.monotonic()
+        if session is None or session[1] < now:
+            self.sessions.pop(token.strip(), None)
+            raise HttpError(401, "Log in first")
+        session[1] = now + SESSION_SECONDS
+        return session[0]
+
+    # --- asset operations ---
+
+    def list_assets(self, params):
+        page = max(1, _int_param(params, 'page', 1))
+        page_size = min(MAX_PAGE_SIZE, max(1, _int_param(params, 'page_size', DEFAULT_PAGE_SIZE)))
+        # No predicates matches every asset
+        predicates = params.get('q', [''])[0] or []
+        sort = params.get('sort', [''])[0].upper()
+        start = (page - 1) * page_size
+
+        column = sort.lstrip('-')
+        if not column:
+            total, rows = self.query_engine.search_page(predicates, start, page_size)
+        elif column in FIELDNAMES:
+            rows = self.query_engine.search(predicates)
+            key = (lambda row: int(row['ID'])) if column == 'ID' else (lambda row: row[column])
+            rows = sorted(rows, key=key, reverse=sort.startswith('-'))
+            total, rows = len(rows), rows[start:start + page_size]
+        else:
+            raise HttpError(400, f"Unknown column '{column}'")
+        return {'page': page, 'page_size': page_size, 'total': total, 'assets': [_as_json(row) for row in rows]}
+
+    def get_asset(self, sn):
+        row = self.store.get(sn)
+        if row is None:
+            raise HttpError(404, f"Asset '{sn}' not found")
+        return _as_json(row)
+
+    def create_asset(self, data, username):
+        from importer import normalize_asset
+        asset = normalize_asset({str(key).upper(): value for key, value in data.items()})
+        if asset['SN'] == "":
+            raise HttpError(400, "SN is required")
+
+        row = self.store.add(asset)
+        self.log_activity(f"Asset '{row['SN']}' (ID: {row['ID']}) added successfully.",
+                          event='create', user=username, sn=row['SN'], id=int(row['ID']))
+        return _as_json(row)
+
+    def update_asset(self, sn, data, username):
+        # All fields are written together; with "expected" nothing is written
+        # unless every field listed there still holds the value the client
+        # saw, otherwise 409 Conflict
+        expected = data.pop('expected', None) or {}
+        if not isinstance(expected, dict):
+            raise HttpError(400, "expected must be a JSON object")
+        for values in (data, expected):
+            for field, value in values.items():
+                # null would otherwise be stored as "NONE"
+                if not isinstance(value, str):
+                    raise HttpError(400, f"{field} must be a string")
+        changes = {field.upper(): value.strip().upper() for field, value in data.items()}
+        expected = {field.upper(): value.strip().upper() for field, value in expected.items()}
+        if not changes:
+            raise HttpError(400, "Nothing to update")
+        for field in list(changes) + list(expected):
+            if field not in FIELDNAMES or field == 'ID':
+                raise HttpError(400, f"Unknown field '{field}'")
+        if changes.get('SN') == "":
+            raise HttpError(400, "SN cannot be empty")
+
+        updated = self.store.update_fields(sn, changes, expected=expected)
+        if updated is None:
+            raise HttpError(404, f"Asset '{sn}' not found")
+        row, old_values = updated
+        for field, old_value in old_values.items():
+            self.log_activity(f"Asset '{sn}' (ID: {row['ID']}) - {field}: {old_value} - updated to {changes[field]}.",
+                              event='update', user=username, sn=sn, id=int(row['ID']),
+                              field=field, old=old_value, new=changes[field])
+        return _as_json(row)
+
+    def delete_asset(self, sn, username):
+        row = self.store.delete(sn)
+        if row is None:
+            raise HttpError(404, f"Asset '{sn}' not found")
+        self.log_activity(f"Asset '{sn}' (ID: {row['ID']}) deleted successfully.",
+                          event='delete', user=username, sn=sn, id=int(row['ID']))
+        return {'deleted': _as_json(row)}
+
+    def summarize(self, params):
+        from summary import group_records, parse_fields
+        fields = parse_fields(params.get('by', [''])[0])
+        if not fields:
+            raise HttpError(400, "by is required, e.g. by=CATEGORY,LOCATION")
+        groups = self.backend.summary.group_by(fields)
+        return {'by': fields, 'total': sum(count for _, count in groups), 'groups': group_records(groups, fields)}
+
+    def list_changes(self, params):
+        # A page of the change feed; a sync asks again with since=last_seq
+        # until more is false
+        since = max(0, _int_param(params, 'since', 0))
+        limit = min(MAX_PAGE_SIZE, max(1, _int_param(params, 'limit', MAX_PAGE_SIZE)))
+        records = list(self.backend.changes.changes(since, limit=limit + 1))
+        more = len(records) > limit
+        records = records[:limit]
+        return {'changes': records, 'last_seq': records[-1]['seq'] if records else since, 'more': more}
+
+    def search_text(self, params):
+        # Best matches for some words, each asset with its relevance SCORE
+        from fulltext import FULLTEXT_LIMIT
+        text = params.get('text', [''])[0]
+        if not text.strip():
+            raise HttpError(400, "text is required, e.g. text=dell latitude")
+        limit = min(MAX_PAGE_SIZE, max(1, _int_param(params, 'limit', FULLTEXT_LIMIT)))
+        results = self.backend.fulltext.search(text, limit)
+        return {'text': text, 'assets': [dict(_as_json(row), SCORE=score) for row, score in results]}
+
+    async def serve(self, host=HOST, port=PORT):
+        # Load the assets before the first client is waiting on them
+        self.store.refresh()
+        server = await asyncio.start_server(self.handle_connection, host, port, backlog=1024)
+        print(f"Serving the Asset Management System on http://{host}:{port}")
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self.user_manager.executor.shutdown()
+        self.store_thread.shutdown()
+        self.backend.close()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="HTTP/JSON service for the Asset Management System.")
+    parser.add_argument('--host', default=HOST, help=f"address to listen on (default: {HOST})")
+    parser.add_argument('--port', type=int, default=PORT, help=f"port to listen on (default: {PORT})")
+    parser.add_argument('--metrics', metavar='FILE', help="write Prometheus metrics to FILE (default: $AMS_METRICS_FILE)")
+    parser.add_argument('--profile', metavar='FILE', help="write a cProfile dump of the event loop to FILE on exit")
+    args = parser.parse_args(argv)
+    if args.metrics:
+        metrics.configure(args.metrics)
+
+    server = AssetServer()
+    try:
+        with metrics.profiled(args.profile) if args.profile else contextlib.nullcontext():
+            asyncio.run(server.serve(args.host, args.port))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,545 @@
+import contextlib
+import csv
+import json
+import os
+import sqlite3
+
+from fulltext import FULLTEXT_LIMIT, TEXT_FIELDS, search_terms
+from query import INDEXED_COLUMNS, parse_query
+from store import FIELDNAMES, ConflictError
+from summary import SUMMARY_FIELDS, parse_fields
+
+
+def connect(path='assets.db'):
+    # Autocommit connection; writes use explicit transactions (see _transaction)
+    conn = sqlite3.connect(path, isolation_level=None, check_same_thread=False)
+    conn.row_factory = sqlite3.Row
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+
+    columns = ", ".join(f"{field} TEXT NOT NULL DEFAULT ''" for field in FIELDNAMES[2:])
+    conn.execute(f"CREATE TABLE IF NOT EXISTS assets (ID INTEGER PRIMARY KEY, SN TEXT NOT NULL UNIQUE, {columns})")
+    for column in INDEXED_COLUMNS + ['DESCRIPTION']:
+        conn.execute(f"CREATE INDEX IF NOT EXISTS idx_assets_{column.lower()} ON assets ({column})")
+    conn.execute("CREATE TABLE IF NOT EXISTS users (username TEXT PRIMARY KEY, password TEXT NOT NULL)")
+    _create_summary(conn)
+    _create_changes(conn)
+    _create_fulltext(conn)
+    return conn
+
+
+def _create_summary(conn):
+    # asset_summary holds the number of assets per combination of the
+    # SUMMARY_FIELDS, kept up to date by triggers in the same transaction as
+    # every insert, update and delete, whichever process makes it
+    columns = ', '.join(SUMMARY_FIELDS)
+    new = ', '.join(f"NEW.{field}" for field in SUMMARY_FIELDS)
+    old_key = ' AND '.join(f"{field} = OLD.{field}" for field in SUMMARY_FIELDS)
+    add_new = (f"INSERT INTO asset_summary ({columns}, ASSETS) VALUES ({new}, 1) "
+               f"ON CONFLICT ({columns}) DO UPDATE SET ASSETS = ASSETS + 1;")
+    remove_old = (f"UPDATE asset_summary SET ASSETS = ASSETS - 1 WHERE {old_key}; "
+                  f"DELETE FROM asset_summary WHERE {old_key} AND ASSETS = 0;")
+
+    with _transaction(conn):
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'asset_summary'").fetchone()
+        if exists:
+            return
+        conn.execute(f"CREATE TABLE asset_summary ({', '.join(f'{field} TEXT NOT NULL' for field in SUMMARY_FIELDS)}, "
+                     f"ASSETS INTEGER NOT NULL, PRIMARY KEY ({columns}))")
+        conn.execute(f"INSERT INTO asset_summary SELECT {columns}, COUNT(*) FROM assets GROUP BY {columns}")
+        conn.execute(f"CREATE TRIGGER asset_summary_insert AFTER INSERT ON assets BEGIN {add_new} END")
+        conn.execute(f"CREATE TRIGGER asset_summary_delete AFTER DELETE ON assets BEGIN {remove_old} END")
+        conn.execute(f"CREATE TRIGGER asset_summary_update AFTER UPDATE OF {columns} ON assets "
+                     f"BEGIN {remove_old} {add_new} END")
+
+
+def _create_changes(conn):
+    # asset_changes is the change feed of the SQLite backend: one row per
+    # created, updated (per field) or deleted asset, written by triggers in the
+    # same transaction as the change. The write lock orders the transactions,
+    # so SEQ follows the order the changes were committed in, whichever
+    # process made them. TIME is in the same UTC form as the CSV backend's feed
+    # and never goes backwards.
+    now = ("MAX(strftime('%Y-%m-%dT%H:%M:%f', 'now') || '000+00:00', "
+           "COALESCE((SELECT TIME FROM asset_changes ORDER BY SEQ DESC LIMIT 1), ''))")
+
+    def asset(prefix):
+        return "json_object(" + ', '.join(
+            f"'{field}', CAST({prefix}.{field} AS TEXT)" if field == 'ID' else f"'{field}', {prefix}.{field}"
+            for field in FIELDNAMES) + ")"
+
+    with _transaction(conn):
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'asset_changes'").fetchone()
+        if exists:
+            return
+        conn.execute("CREATE TABLE asset_changes (SEQ INTEGER PRIMARY KEY, TIME TEXT NOT NULL, OP TEXT NOT NULL, "
+                     "ID INTEGER NOT NULL, SN TEXT NOT NULL, FIELD TEXT, OLD TEXT, ASSET TEXT NOT NULL)")
+        conn.execute("CREATE INDEX idx_asset_changes_time ON asset_changes (TIME)")
+        conn.execute(f"CREATE TRIGGER asset_changes_insert AFTER INSERT ON assets BEGIN "
+                     f"INSERT INTO asset_changes (TIME, OP, ID, SN, ASSET) "
+                     f"VALUES ({now}, 'create', NEW.ID, NEW.SN, {asset('NEW')}); END")
+        conn.execute(f"CREATE TRIGGER asset_changes_delete AFTER DELETE ON assets BEGIN "
+                     f"INSERT INTO asset_changes (TIME, OP, ID, SN, ASSET) "
+                     f"VALUES ({now}, 'delete', OLD.ID, OLD.SN, {asset('OLD')}); END")
+        for field in FIELDNAMES[1:]:
+            conn.execute(f"CREATE TRIGGER asset_changes_update_{field.lower()} AFTER UPDATE OF {field} ON assets "
+                         f"WHEN OLD.{field} IS NOT NEW.{field} BEGIN "
+                         f"INSERT INTO asset_changes (TIME, OP, ID, SN, FIELD, OLD, ASSET) "
+                         f"VALUES ({now}, 'update', NEW.ID, NEW.SN, '{field}', OLD.{field}, {asset('NEW')}); END")
+
+
+def _create_fulltext(conn):
+    # asset_text is an FTS5 index of the TEXT_FIELDS (trigram tokens, so any
+    # part of a word of three letters or more matches), kept up to date by
+    # triggers like asset_summary. Without FTS5 in this SQLite build,
+    # SqliteFullText scans the columns instead.
+    columns = ', '.join(TEXT_FIELDS)
+    new = ', '.join(f"NEW.{field}" for field in TEXT_FIELDS)
+    old = ', '.join(f"OLD.{field}" for field in TEXT_FIELDS)
+    add_new = f"INSERT INTO asset_text (rowid, {columns}) VALUES (NEW.ID, {new});"
+    remove_old = f"INSERT INTO asset_text (asset_text, rowid, {columns}) VALUES ('delete', OLD.ID, {old});"
+
+    with _transaction(conn):
+        exists = conn.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'asset_text'").fetchone()
+        if exists:
+            return
+        try:
+            conn.execute(f"CREATE VIRTUAL TABLE asset_text USING fts5({columns}, content='assets', "
+                         f"content_rowid='ID', tokenize='trigram')")
+        except sqlite3.OperationalError:
+            return
+        conn.execute("INSERT INTO asset_text (asset_text) VALUES ('rebuild')")
+        conn.execute(f"CREATE TRIGGER asset_text_insert AFTER INSERT ON assets BEGIN {add_new} END")
+        conn.execute(f"CREATE TRIGGER asset_text_delete AFTER DELETE ON assets BEGIN {remove_old} END")
+        conn.execute(f"CREATE TRIGGER asset_text_update AFTER UPDATE OF {columns} ON assets "
+                     f"BEGIN {remove_old} {add_new} END")
+
+
+@contextlib.contextmanager
+def _transaction(conn):
+    # BEGIN IMMEDIATE takes the write lock up front, so the read-check-write
+    # inside the block cannot interleave with another process's write. Inside
+    # a transaction already open on conn the block joins it, and the outer one
+    # commits or rolls back everything.
+    if conn.in_transaction:
+        yield conn
+        return
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
+
+
+def _as_row(record):
+    row = dict(zip(FIELDNAMES, record))
+    row['ID'] = str(row['ID'])
+    return row
+
+
+def _check_field(field):
+    # Column names cannot be bound as parameters, so only known ones get in
+    if field not in FIELDNAMES:
+        raise KeyError(field)
+
+
+class SqliteAssetStore:
+    # Same interface as store.AssetStore, kept in an SQLite table with a UNIQUE
+    # index on SN and indexes on the searchable columns. Nothing is cached in
+    # memory; every call is an indexed lookup and every write a transaction.
+
+    _SELECT = f"SELECT {', '.join(FIELDNAMES)} FROM assets"
+
+    def __init__(self, conn):
+        self.conn = conn
+        self.path = None
+        self.loaded = True
+        self._listeners = []
+        self._data_version = self._current_data_version()
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def transaction(self):
+        # Writes made inside the block commit together, or not at all
+        return _transaction(self.conn)
+
+    def _current_data_version(self):
+        return self.conn.execute("PRAGMA data_version").fetchone()[0]
+
+    def refresh(self):
+        # data_version changes when another connection commits
+        data_version = self._current_data_version()
+        if data_version == self._data_version:
+            return False
+        self._data_version = data_version
+        for listener in self._listeners:
+            listener.on_reload()
+        return True
+
+    def __len__(self):
+        return self.conn.execute("SELECT COUNT(*) FROM assets").fetchone()[0]
+
+    def select(self, where='', params=(), limit=None, offset=0):
+        # Rows matching an SQL condition, in ID order
+        sql = self._SELECT + (f" WHERE {where}" if where else "") + " ORDER BY ID"
+        if limit is not None:
+            sql += f" LIMIT {int(limit)} OFFSET {int(offset)}"
+        return [_as_row(record) for record in self.conn.execute(sql, params)]
+
+    def rows(self):
+        return self.select()
+
+    def iter_rows(self):
+        for record in self.conn.execute(self._SELECT + " ORDER BY ID"):
+            yield _as_row(record)
+
+    def get(self, sn):
+        rows = self.select("SN = ?", (sn,))
+        return rows[0] if rows else None
+
+    def get_by_id(self, asset_id):
+        rows = self.select("ID = ?", (int(asset_id),))
+        return rows[0] if rows else None
+
+    def get_many_by_id(self, asset_ids):
+        asset_ids = list(asset_ids)
+        by_id = {}
+        for start in range(0, len(asset_ids), 500):
+            batch = asset_ids[start:start + 500]
+            for row in self.select(f"ID IN ({', '.join('?' * len(batch))})", batch):
+                by_id[int(row['ID'])] = row
+        return [by_id[asset_id] for asset_id in asset_ids if asset_id in by_id]
+
+    def is_serial_number_unique(self, sn):
+        return self.conn.execute("SELECT 1 FROM assets WHERE SN = ?", (sn,)).fetchone() is None
+
+    def last_id(self):
+        return self.conn.execute("SELECT COALESCE(MAX(ID), 0) FROM assets").fetchone()[0]
+
+    def next_id(self):
+        return self.last_id() + 1
+
+    def existing_serials(self, serial_numbers):
+        serial_numbers = list(serial_numbers)
+        existing = set()
+        for start in range(0, len(serial_numbers), 500):
+            batch = serial_numbers[start:start + 500]
+            sql = f"SELECT SN FROM assets WHERE SN IN ({', '.join('?' * len(batch))})"
+            existing.update(record[0] for record in self.conn.execute(sql, batch))
+        return existing
+
+    def add(self, row):
+        return self.add_many([row])[0]
+
+    def add_many(self, rows):
+        # Rows without an ID get the next free ones inside the transaction
+        rows = [{field: str(row.get(field, '')) for field in FIELDNAMES} for row in rows]
+        sql = f"INSERT INTO assets ({', '.join(FIELDNAMES)}) VALUES ({', '.join('?' * len(FIELDNAMES))})"
+        try:
+            with _transaction(self.conn):
+                next_id = self.next_id()
+                for row in rows:
+                    if row['ID'] in ('', 'None'):
+                        row['ID'] = str(next_id)
+                        next_id += 1
+                self.conn.executemany(sql, ([int(row['ID'])] + [row[field] for field in FIELDNAMES[1:]]
+                                            for row in rows))
+        except sqlite3.IntegrityError as e:
+            raise ConflictError(f"Serial number or ID already exists ({e})")
+        self._data_version = self._current_data_version()
+        for listener in self._listeners:
+            for row in rows:
+                listener.on_add(row)
+            listener.on_commit()
+        return rows
+
+    def update(self, sn, field, value, expected=None):
+        # Returns the old value, or None if there is no asset with that SN.
+        # With expected, raises ConflictError unless the field still holds it.
+        if field == 'ID':
+            raise ValueError("ID cannot be changed")
+        _check_field(field)
+        try:
+            with _transaction(self.conn):
+                row = self.get(sn)
+                if row is None:
+                    return None
+                if expected is not None and row[field] != expected:
+                    raise ConflictError(f"Asset '{sn}' {field} was changed to '{row[field]}' in the meantime")
+                self.conn.execute(f"UPDATE assets SET {field} = ? WHERE ID = ?", (value, int(row['ID'])))
+        except sqlite3.IntegrityError:
+            raise ConflictError(f"Serial number '{value}' already exists")
+        self._data_version = self._current_data_version()
+
+        old_value = row[field]
+        row[field] = value
+        for listener in self._listeners:
+            listener.on_update(row, field, old_value)
+            listener.on_commit()
+        return old_value
+
+    def update_fields(self, sn, changes, expected=None):
+        # Same as AssetStore.update_fields, in one transaction
+        if 'ID' in changes:
+            raise ValueError("ID cannot be changed")
+        for field in list(changes) + list(expected or {}):
+            _check_field(field)
+
+        assignments = ", ".join(f"{field} = ?" for field in changes)
+        try:
+            with _transaction(self.conn):
+                row = self.get(sn)
+                if row is None:
+                    return None
+                for field, value in (expected or {}).items():
+                    if row[field] != value:
+                        raise ConflictError(f"Asset '{sn}' {field} was changed to '{row[field]}' in the meantime")
+                self.conn.execute(f"UPDATE assets SET {assignments} WHERE ID = ?",
+                                  list(changes.values()) + [int(row['ID'])])
+        except sqlite3.IntegrityError:
+            raise ConflictError(f"Serial number '{changes.get('SN')}' already exists")
+        self._data_version = self._current_data_version()
+
+        old_values = {field: row[field] for field in changes}
+        row.update(changes)
+        for listener in self._listeners:
+            for field, old_value in old_values.items():
+                listener.on_update(row, field, old_value)
+            listener.on_commit()
+        return row, old_values
+
+    def delete(self, sn):
+        # Returns the deleted row, or None if there is no asset with that SN
+        with _transaction(self.conn):
+            row = self.get(sn)
+            if row is None:
+                return None
+            self.conn.execute("DELETE FROM assets WHERE ID = ?", (int(row['ID']),))
+        self._data_version = self._current_data_version()
+
+        for listener in self._listeners:
+            listener.on_delete(row)
+            listener.on_commit()
+        return row
+
+    def update_many(self, serial_numbers, changes):
+        # Same as AssetStore.update_many, in one transaction
+        if 'SN' in changes or 'ID' in changes:
+            raise ValueError("SN and ID cannot be changed in a batch update")
+        for field in changes:
+            _check_field(field)
+
+        serial_numbers = list(dict.fromkeys(serial_numbers))
+        assignments = ", ".join(f"{field} = ?" for field in changes)
+        with _transaction(self.conn):
+            rows = self._rows_for(serial_numbers)
+            self.conn.executemany(f"UPDATE assets SET {assignments} WHERE ID = ?",
+                                  (list(changes.values()) + [int(row['ID'])] for row in rows))
+        self._data_version = self._current_data_version()
+
+        updated = []
+        for row in rows:
+            old_values = {field: row[field] for field in changes}
+            row.update(changes)
+            for listener in self._listeners:
+                for field, old_value in old_values.items():
+                    listener.on_update(row, field, old_value)
+            updated.append((row, old_values))
+        for listener in self._listeners:
+            listener.on_commit()
+        return updated
+
+    def delete_many(self, serial_numbers):
+        # Same as AssetStore.delete_many, in one transaction
+        serial_numbers = list(dict.fromkeys(serial_numbers))
+        with _transaction(self.conn):
+            rows = self._rows_for(serial_numbers)
+            self.conn.executemany("DELETE FROM assets WHERE ID = ?", ([int(row['ID'])] for row in rows))
+        self._data_version = self._current_data_version()
+
+        for row in rows:
+            for listener in self._listeners:
+                listener.on_delete(row)
+        for listener in self._listeners:
+            listener.on_commit()
+        return rows
+
+    def _rows_for(self, serial_numbers):
+        by_sn = {}
+        for start in range(0, len(serial_numbers), 500):
+            batch = serial_numbers[start:start + 500]
+            for row in self.select(f"SN IN ({', '.join('?' * len(batch))})", batch):
+                by_sn[row['SN']] = row
+        return [by_sn[sn] for sn in serial_numbers if sn in by_sn]
+
+    def compact(self):
+        return False
+
+    def wait_for_compaction(self):
+        pass
+
+    def export_csv(self, path='assets_export.csv'):
+        # Path of a CSV snapshot of the table, for spreadsheets and other tools
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'w', newline='') as csvfile:
+            writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+            writer.writeheader()
+            writer.writerows(self.iter_rows())
+        os.replace(tmp_path, path)
+        return path
+
+
+class SqliteQueryEngine:
+    # Same interface as query.QueryEngine; predicates become an SQL WHERE
+    # clause answered from the column indexes
+
+    def __init__(self, store):
+        self.store = store
+
+    def search(self, query):
+        return self.store.select(*self._where(query))
+
+    def search_page(self, query, offset, limit):
+        # (number of matches, rows offset..offset+limit of search(query))
+        where, params = self._where(query)
+        sql = "SELECT COUNT(*) FROM assets" + (f" WHERE {where}" if where else "")
+        total = self.store.conn.execute(sql, params).fetchone()[0]
+        return total, self.store.select(where, params, limit=limit, offset=offset)
+
+    def _where(self, query):
+        predicates = parse_query(query) if isinstance(query, str) else list(query)
+        conditions = []
+        params = []
+        for column, op, value in predicates:
+            _check_field(column)
+            if op == 'eq':
+                conditions.append(f"{column} = ?")
+                params.append(int(value) if column == 'ID' and value.isdigit() else value)
+            elif op == 'prefix' and column == 'ID':
+                conditions.append("CAST(ID AS TEXT) LIKE ?")
+                params.append(value + '%')
+            elif op == 'prefix':
+                # A range instead of LIKE so the column index is used
+                conditions.append(f"{column} >= ? AND {column} < ?")
+                params.extend([value, value + '\U0010ffff'])
+            else:
+                values = sorted(value)
+                conditions.append(f"{column} IN ({', '.join('?' * len(values))})")
+                params.extend(int(v) if column == 'ID' and v.isdigit() else v for v in values)
+        return " AND ".join(conditions), params
+
+
+class SqliteSummary:
+    # Same interface as summary.InventorySummary, read from the asset_summary
+    # table the triggers maintain
+
+    def __init__(self, store):
+        self.store = store
+
+    def counts(self):
+        sql = f"SELECT {', '.join(SUMMARY_FIELDS)}, ASSETS FROM asset_summary"
+        return {tuple(record[:-1]): record[-1] for record in self.store.conn.execute(sql)}
+
+    def group_by(self, fields):
+        fields = parse_fields(fields)
+        if not fields:
+            return [((), self.total())] if self.total() else []
+        columns = ', '.join(fields)
+        # Largest groups first, as group_counts orders them
+        sql = (f"SELECT {columns}, SUM(ASSETS) AS count FROM asset_summary GROUP BY {columns} "
+               f"ORDER BY count DESC, {columns}")
+        return [(tuple(record[:-1]), record[-1]) for record in self.store.conn.execute(sql)]
+
+    def total(self):
+        return self.store.conn.execute("SELECT COALESCE(SUM(ASSETS), 0) FROM asset_summary").fetchone()[0]
+
+
+class SqliteChangeFeed:
+    # Same interface as changefeed.ChangeFeed, read from the asset_changes
+    # table the triggers fill
+
+    def __init__(self, store):
+        self.store = store
+
+    def last_seq(self):
+        return self.store.conn.execute("SELECT COALESCE(MAX(SEQ), 0) FROM asset_changes").fetchone()[0]
+
+    def changes(self, since_seq=None, since_time=None, limit=None):
+        # Records with a seq above since_seq and/or a time at or after
+        # since_time (see changefeed.parse_time), oldest first
+        conditions = ["SEQ > ?"]
+        params = [since_seq or 0]
+        if since_time is not None:
+            conditions.append("TIME >= ?")
+            params.append(since_time)
+        sql = (f"SELECT SEQ, TIME, OP, ID, SN, FIELD, OLD, ASSET FROM asset_changes "
+               f"WHERE {' AND '.join(conditions)} ORDER BY SEQ")
+        if limit is not None:
+            sql += f" LIMIT {int(limit)}"
+        for seq, time, op, asset_id, sn, field, old, asset in self.store.conn.execute(sql, params):
+            record = {'seq': seq, 'time': time, 'op': op, 'id': asset_id, 'sn': sn}
+            if op == 'update':
+                record['field'] = field
+                record['old'] = old
+            record['asset'] = json.loads(asset)
+            yield record
+
+
+class SqliteFullText:
+    # Same interface as fulltext.FullTextIndex, answered by the asset_text
+    # FTS5 index and ranked by its bm25()
+
+    def __init__(self, store):
+        self.store = store
+        self._fts = store.conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'asset_text'").fetchone() is not None
+
+    def search(self, text, limit=FULLTEXT_LIMIT):
+        # [(row, score), ...] for the assets best matching the words of text,
+        # best first
+        terms = search_terms(text)
+        if not terms:
+            return []
+        # Trigrams cannot match words shorter than three letters
+        if not self._fts or any(len(term) < 3 for term in terms):
+            return self._scan(terms, limit)
+        columns = ', '.join(f"assets.{field}" for field in FIELDNAMES)
+        sql = (f"SELECT {columns}, -rank FROM asset_text JOIN assets ON assets.ID = asset_text.rowid "
+               f"WHERE asset_text MATCH ? ORDER BY rank, assets.ID LIMIT ?")
+        match = ' OR '.join(f'"{term}"' for term in terms)
+        return [(_as_row(record[:-1]), round(record[-1], 3))
+                for record in self.store.conn.execute(sql, (match, int(limit)))]
+
+    def _scan(self, terms, limit):
+        # Assets containing the most of the terms in any of the TEXT_FIELDS
+        matches = ' + '.join(f"({' OR '.join(f'{field} LIKE ?' for field in TEXT_FIELDS)})" for _ in terms)
+        params = [f"%{term}%" for term in terms for _ in TEXT_FIELDS]
+        sql = (f"SELECT * FROM (SELECT {', '.join(FIELDNAMES)}, {matches} AS score FROM assets) "
+               f"WHERE score > 0 ORDER BY score DESC, ID LIMIT ?")
+        return [(_as_row(record[:-1]), float(record[-1]))
+                for record in self.store.conn.execute(sql, params + [int(limit)])]
+
+
+class SqliteUserStore:
+    # Usernames and password hashes in the users table
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def rows(self):
+        return [dict(record) for record in self.conn.execute("SELECT username, password FROM users")]
+
+    def get(self, username):
+        record = self.conn.execute("SELECT password FROM users WHERE username = ?", (username,)).fetchone()
+        return record[0] if record is not None else None
+
+    def add(self, username, hashed_password):
+        try:
+            with _transaction(self.conn):
+                self.conn.execute("INSERT INTO users (username, password) VALUES (?, ?)", (username, hashed_password))
+        except sqlite3.IntegrityError:
+            return False
+        return True
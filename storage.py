@@ -0,0 +1,143 @@
+import os
+import sys
+
+from changefeed import ChangeFeed
+from fulltext import FullTextIndex
+from store import AssetStore, CsvUserStore
+from summary import InventorySummary
+
+# Which backend the console uses: "csv" (default) or "sqlite"
+BACKEND_ENV = 'AMS_BACKEND'
+# Database file for the sqlite backend
+DB_ENV = 'AMS_DB'
+
+
+class CsvBackend:
+    # assets.csv (+ assets.journal) and user_data.csv, as the system has always used
+
+    name = 'csv'
+
+    def __init__(self, assets_path='assets.csv', users_path='user_data.csv'):
+        self.assets = AssetStore(assets_path)
+        self.users = CsvUserStore(users_path)
+        # Group-by counts, kept up to date by every change made through this backend
+        self.summary = InventorySummary(self.assets)
+        # Numbered record of every change, for downstream syncs
+        self.changes = ChangeFeed(self.assets, os.path.splitext(assets_path)[0] + '.changes.jsonl')
+        # Ranked word search over the free-text columns
+        self.fulltext = FullTextIndex(self.assets, os.path.splitext(assets_path)[0] + '.fulltext')
+        self._query_engine = None
+
+    def query_engine(self):
+        # One engine per backend: it subscribes to the store and keeps its
+        # indexes up to date, so every caller shares the same one
+        if self._query_engine is None:
+            from query import QueryEngine
+            self._query_engine = QueryEngine(self.assets)
+        return self._query_engine
+
+    def close(self):
+        self.assets.wait_for_compaction()
+
+
+class SqliteBackend:
+    # One SQLite database holding the assets and users tables
+
+    name = 'sqlite'
+
+    def __init__(self, db_path='assets.db'):
+        from sqlite_store import (SqliteAssetStore, SqliteChangeFeed, SqliteFullText, SqliteSummary,
+                                  SqliteUserStore, connect)
+        self.db_path = db_path
+        self.conn = connect(db_path)
+        self.assets = SqliteAssetStore(self.conn)
+        self.users = SqliteUserStore(self.conn)
+        self.summary = SqliteSummary(self.assets)
+        # Written by triggers in each write's own transaction, so the feed
+        # follows the commit order across processes
+        self.changes = SqliteChangeFeed(self.assets)
+        self.fulltext = SqliteFullText(self.assets)
+        self._query_engine = None
+
+    def query_engine(self):
+        if self._query_engine is None:
+            from sqlite_store import SqliteQueryEngine
+            self._query_engine = SqliteQueryEngine(self.assets)
+        return self._query_engine
+
+    def close(self):
+        self.conn.close()
+
+
+def open_backend(name=None, db_path=None):
+    name = (name or os.environ.get(BACKEND_ENV) or 'csv').lower()
+    if name == 'csv':
+        return CsvBackend()
+    if name == 'sqlite':
+        return SqliteBackend(db_path or os.environ.get(DB_ENV) or 'assets.db')
+    raise ValueError(f"Unknown storage backend '{name}' (expected csv or sqlite)")
+
+
+_default_backend = None
+
+
+def default_backend():
+    # The backend shared by everything in this process
+    global _default_backend
+    if _default_backend is None:
+        _default_backend = open_backend()
+    return _default_backend
+
+
+def migrate_csv_to_sqlite(db_path='assets.db', assets_path='assets.csv', users_path='user_data.csv'):
+    # Copy assets (with any journalled edits applied) and users into a new
+    # SQLite database in one transaction, so a failed migration leaves the
+    # database empty and can simply be run again. Returns (assets copied,
+    # users copied).
+    source = CsvBackend(assets_path, users_path)
+    target = SqliteBackend(db_path)
+    try:
+        with target.assets.transaction():
+            if len(target.assets) or target.users.rows():
+                raise ValueError(f"'{db_path}' already contains data")
+
+            rows = source.assets.rows()
+            rows.sort(key=lambda row: int(row['ID']))
+            target.assets.add_many(rows)
+            # A copy, not a change: like the CSV feed, which never listed the
+            # assets that existed before it, the new database's feed starts
+            # empty and downstream copies take their baseline from an export
+            target.conn.execute("DELETE FROM asset_changes")
+
+            users = 0
+            for row in source.users.rows():
+                # The first account wins if a username was created twice
+                if target.users.add(row['username'], row['password']):
+                    users += 1
+        return len(rows), users
+    finally:
+        target.close()
+
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Storage backend tools for the Asset Management System.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+    migrate = subparsers.add_parser('migrate', help="copy assets.csv and user_data.csv into an SQLite database")
+    migrate.add_argument('--db', default='assets.db', help="SQLite database to create (default: assets.db)")
+    migrate.add_argument('--assets', default='assets.csv', help="asset CSV to read (default: assets.csv)")
+    migrate.add_argument('--users', default='user_data.csv', help="user CSV to read (default: user_data.csv)")
+    args = parser.parse_args(argv)
+
+    try:
+        assets, users = migrate_csv_to_sqlite(args.db, args.assets, args.users)
+    except ValueError as e:
+        print(f"Migration failed: {e}", file=sys.stderr)
+        return 1
+    print(f"Migrated {assets} assets and {users} users into '{args.db}'.")
+    print(f"Set {BACKEND_ENV}=sqlite (and {DB_ENV}={args.db} if you used another name) to use it.")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,901 @@
+import csv
+import json
+import locale
+import operator
+import os
+import threading
+from array import array
+from bisect import bisect_left
+from collections import Counter
+from itertools import compress, islice
+
+import metrics
+from locking import FileLock
+
+FIELDNAMES = ['ID', 'SN', 'CATEGORY', 'TYPE', 'LOCATION', 'ASSIGNEE', 'DESCRIPTION', 'COLOR', 'STATUS']
+
+# Fold the journal back into the CSV once it grows past this many bytes
+JOURNAL_COMPACT_BYTES = 1024 * 1024
+
+
+class ConflictError(Exception):
+    # A write based on data another process has changed in the meantime
+    pass
+
+
+def _lines_before(binfile, end):
+    # Decoded lines of a file opened in binary mode, stopping at byte offset end
+    encoding = locale.getpreferredencoding(False)
+    while binfile.tell() < end:
+        line = binfile.readline()
+        if not line:
+            break
+        yield line.decode(encoding)
+
+
+class StoreListener:
+    # Base class for things kept in step with the store (indexes, counters, ...).
+    # on_reload is called when the store re-read the files from disk.
+    # before_write is called once per write just before the store writes it,
+    # with [(op, row, field, old value), ...]: op is 'create', 'update' (one
+    # entry per field) or 'delete', row the asset after the change (before
+    # it, for a delete). The other hooks are called after a change made
+    # through this store has been written: on_add, on_update and on_delete
+    # once per asset, then on_commit once per write (also for a compaction,
+    # which changes no asset). An AssetStore calls them all while still
+    # holding its write lock.
+
+    def on_reload(self):
+        pass
+
+    def before_write(self, changes):
+        pass
+
+    def on_add(self, row):
+        pass
+
+    def on_update(self, row, field, old_value):
+        pass
+
+    def on_delete(self, row):
+        pass
+
+    def on_commit(self):
+        pass
+
+
+# Every column but ID and SN is dictionary-encoded (see _Column)
+ENCODED_FIELDS = FIELDNAMES[2:]
+
+# Array typecodes for the codes of a _Column, narrowest first, with the largest
+# code each can hold
+_CODE_TYPES = [('B', 0xFF), ('H', 0xFFFF), ('I', 0xFFFFFFFF), ('Q', 0xFFFFFFFFFFFFFFFF)]
+_CODE_LIMITS = dict(_CODE_TYPES)
+
+# CSV records parsed per batch when loading
+LOAD_BATCH = 10000
+
+
+class _Column:
+    # One dictionary-encoded column. Every distinct value is stored once in
+    # values; codes holds one integer per asset pointing into values, in the
+    # narrowest array type that fits (one byte per asset up to 255 values).
+    # Code 0 is reserved for deleted assets and never matches anything.
+
+    __slots__ = ('values', 'lookup', 'codes')
+
+    def __init__(self, values=None, lookup=None, codes=None):
+        self.values = [None] if values is None else values
+        self.lookup = {} if lookup is None else lookup
+        self.codes = array('B') if codes is None else codes
+
+    def encode(self, value):
+        code = self.lookup.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.lookup[value] = code
+            if code > _CODE_LIMITS[self.codes.typecode]:
+                typecode = next(typecode for typecode, limit in _CODE_TYPES if code <= limit)
+                self.codes = array(typecode, self.codes)
+        return code
+
+    def extend(self, values):
+        codes = list(map(self.lookup.get, values))
+        if None in codes:
+            # Some values are new
+            codes = [self.encode(value) if code is None else code for code, value in zip(codes, values)]
+        if self.codes.typecode == 'B':
+            # Several times faster than extending the array from the list
+            self.codes.frombytes(bytes(codes))
+        else:
+            self.codes.extend(codes)
+
+
+class _Table:
+    # The loaded assets, column by column, in ascending ID order: IDs in a
+    # 64-bit integer array, serial numbers as plain strings (they are unique,
+    # so there is nothing to share) and the other fields as _Columns. A row
+    # dict is only built when a caller asks for one.
+    #
+    # A deleted asset keeps its slot, with SN None and code 0 in every column,
+    # until the table is rebuilt by compacted(). Appends fill in the ID last,
+    # so a lookup never finds a half-added asset.
+
+    __slots__ = ('ids', 'sns', 'columns', 'by_sn', 'deleted')
+
+    def __init__(self, columns=None):
+        self.ids = array('q')
+        self.sns = []
+        self.columns = columns or {field: _Column() for field in ENCODED_FIELDS}
+        # SN -> slot
+        self.by_sn = {}
+        self.deleted = 0
+
+    def __len__(self):
+        return len(self.ids) - self.deleted
+
+    def load(self, reader):
+        # Append the records of a csv.reader over an assets CSV, header first.
+        # Short records are padded with empty fields, unknown columns ignored.
+        header = next(reader, None)
+        if header is None:
+            return
+        positions = {field: header.index(field) for field in FIELDNAMES if field in header}
+        width = len(header)
+        while True:
+            batch = list(islice(reader, LOAD_BATCH))
+            if not batch:
+                break
+            if min(map(len, batch)) < width:
+                batch = [(record + [''] * width)[:width] for record in batch if record]
+                if not batch:
+                    continue
+            columns = list(zip(*batch))
+            missing = ('',) * len(batch)
+            self.append({field: columns[positions[field]] if field in positions else missing for field in FIELDNAMES})
+
+    def append(self, values):
+        # Append assets given column by column: values maps each of FIELDNAMES
+        # to a sequence of strings
+        sns = values['SN']
+        start = len(self.sns)
+        for field, column in self.columns.items():
+            column.extend(values[field])
+        self.sns.extend(sns)
+        self.by_sn.update(zip(sns, range(start, start + len(sns))))
+        self.ids.extend(map(int, values['ID']))
+
+    def in_order(self, start=0):
+        # True if the IDs from slot start on are strictly increasing
+        ids = self.ids[max(0, start - 1):]
+        return all(map(operator.lt, ids, ids[1:]))
+
+    def compacted(self):
+        # A copy without the deleted slots, in ascending ID order. Of two
+        # assets with the same ID the later one wins, as when reading the CSV
+        # into a dict. The dictionaries are shared, only the codes are copied.
+        latest = dict(zip(self.ids, range(len(self.ids))))
+        slots = [latest[asset_id] for asset_id in sorted(latest) if self.sns[latest[asset_id]] is not None]
+
+        table = _Table({field: _Column(column.values, column.lookup,
+                                       array(column.codes.typecode, map(column.codes.__getitem__, slots)))
+                        for field, column in self.columns.items()})
+        table.sns = list(map(self.sns.__getitem__, slots))
+        table.by_sn = dict(zip(table.sns, range(len(slots))))
+        table.ids = array('q', map(self.ids.__getitem__, slots))
+        return table
+
+    def slot(self, asset_id):
+        # Slot of the asset with this ID, or None
+        slot = bisect_left(self.ids, asset_id)
+        if slot < len(self.ids) and self.ids[slot] == asset_id and self.sns[slot] is not None:
+            return slot
+        return None
+
+    def row(self, slot):
+        row = {'ID': str(self.ids[slot]), 'SN': self.sns[slot]}
+        for field, column in self.columns.items():
+            row[field] = column.values[column.codes[slot]]
+        return row
+
+    def live_slots(self):
+        if not self.deleted:
+            return range(len(self.ids))
+        return [slot for slot, sn in enumerate(self.sns) if sn is not None]
+
+    def records(self):
+        # Every asset as a tuple of strings in FIELDNAMES order, decoded a
+        # column at a time
+        columns = [map(column.values.__getitem__, column.codes) for column in self.columns.values()]
+        for record in zip(map(str, self.ids), self.sns, *columns):
+            if record[1] is not None:
+                yield record
+
+    def value(self, slot, field):
+        if field == 'ID':
+            return str(self.ids[slot])
+        if field == 'SN':
+            return self.sns[slot]
+        column = self.columns[field]
+        return column.values[column.codes[slot]]
+
+    def set(self, slot, field, value):
+        if field == 'SN':
+            if self.by_sn.get(self.sns[slot]) == slot:
+                del self.by_sn[self.sns[slot]]
+            self.by_sn[value] = slot
+            self.sns[slot] = value
+        else:
+            column = self.columns[field]
+            code = column.encode(value)
+            column.codes[slot] = code
+
+    def delete(self, slot):
+        sn = self.sns[slot]
+        if self.by_sn.get(sn) == slot:
+            del self.by_sn[sn]
+        self.sns[slot] = None
+        for column in self.columns.values():
+            column.codes[slot] = 0
+        self.deleted += 1
+
+
+class AssetStore:
+    # Session-scoped copy of assets.csv.
+    # The file is parsed once and kept in memory as a compact _Table (IDs as
+    # integers, the repetitive columns dictionary-encoded) with an index on
+    # SN and a running max-ID counter; row dicts are built only for the rows
+    # a caller asks for. It is reloaded only when the file's mtime or size
+    # changes on disk (e.g. another operator edited it).
+    #
+    # New assets are appended to the CSV. Updates and deletes are appended as
+    # small JSON records to a journal next to it (assets.journal) and replayed
+    # over the CSV on load. Once the journal passes JOURNAL_COMPACT_BYTES it is
+    # folded back into a fresh CSV in a background thread and swapped in with an
+    # atomic rename, so a crash never leaves a half-written inventory behind.
+    #
+    # Several processes (consoles, CLI runs, the server) may share the files.
+    # Reads hold a shared lock on assets.csv.lock and writes an exclusive one;
+    # every write first catches up with the files on disk, so nothing written
+    # by another process is overwritten. New IDs are handed out under the
+    # exclusive lock, and a write whose premise no longer holds (the serial
+    # number was taken, the value being replaced has changed) raises
+    # ConflictError instead of going through.
+
+    def __init__(self, path='assets.csv', compact_threshold=JOURNAL_COMPACT_BYTES):
+        self.path = path
+        self.journal_path = os.path.splitext(path)[0] + '.journal'
+        self.lock_path = path + '.lock'
+        self.compact_threshold = compact_threshold
+        self._table = _Table()
+        self._max_id = 0
+        self._stamp = None
+        self._journal_size = 0
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(self.lock_path)
+        self._compactor = None
+        self._listeners = []
+        self.loaded = False
+
+    def subscribe(self, listener):
+        self._listeners.append(listener)
+
+    def _file_stamp(self, path):
+        try:
+            st = os.stat(path)
+        except FileNotFoundError:
+            return None
+        # The inode changes when a compaction replaces the file
+        return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+    def _disk_stamp(self):
+        return (self._file_stamp(self.path), self._file_stamp(self.journal_path))
+
+    def refresh(self):
+        # Reload only if the files changed since we last read or wrote them
+        with self._lock, self._file_lock.shared():
+            stamp = self._disk_stamp()
+            if self.loaded and stamp == self._stamp:
+                return False
+            self._load()
+            self._stamp = stamp
+            self.loaded = True
+            for listener in self._listeners:
+                listener.on_reload()
+            return True
+
+    def _load(self):
+        table = _Table()
+        self._max_id = 0
+        self._journal_size = 0
+        try:
+            with metrics.phase('read_csv'), open(self.path, 'r', newline='') as csvfile:
+                table.load(csv.reader(csvfile))
+                metrics.bytes_read(os.fstat(csvfile.fileno()).st_size)
+                metrics.rows_scanned(len(table.ids))
+        except FileNotFoundError:
+            pass
+        if not table.in_order():
+            table = table.compacted()
+        if table.ids:
+            self._max_id = table.ids[-1]
+        self._table = table
+
+        try:
+            with metrics.phase('replay_journal'), open(self.journal_path, 'r') as journal:
+                for line in journal:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-append
+                        self._journal_size += len(line)
+                        continue
+                    # The marker a compaction leaves is not an edit to fold
+                    if record['op'] != 'max_id':
+                        self._journal_size += len(line)
+                    self._replay(record)
+        except FileNotFoundError:
+            pass
+        metrics.bytes_read(self._journal_size)
+        self._vacuum()
+
+    def _replay(self, record):
+        asset_id = record['id']
+        # IDs mentioned in the journal are never handed out again, even if the
+        # asset was deleted; a compaction keeps the highest one in a max_id
+        # record, which changes nothing else
+        if asset_id > self._max_id:
+            self._max_id = asset_id
+
+        slot = self._table.slot(asset_id)
+        if slot is None:
+            return
+        if record['op'] == 'update':
+            self._table.set(slot, record['field'], record['value'])
+        elif record['op'] == 'delete':
+            self._table.delete(slot)
+
+    def version(self):
+        # Identifies the state of the files the loaded assets reflect; any
+        # write, by this process or another, gives a new version
+        self.refresh()
+        return self._stamp
+
+    def disk_version(self):
+        # The version of the files on disk, without loading them
+        with self._lock, self._file_lock.shared():
+            return self._disk_stamp()
+
+    def _vacuum(self):
+        # Drop the slots of deleted assets once they outnumber the live ones
+        if self._table.deleted > len(self._table):
+            self._table = self._table.compacted()
+
+    def __len__(self):
+        self.refresh()
+        return len(self._table)
+
+    def rows(self):
+        self.refresh()
+        metrics.rows_scanned(len(self._table))
+        return list(map(self._table.row, self._table.live_slots()))
+
+    def iter_rows(self):
+        # Rows one at a time. If the store has not been loaded yet the CSV is
+        # streamed with the journal applied on the fly, so the first rows are
+        # available without parsing the whole file.
+        if self.loaded:
+            self.refresh()
+            table = self._table
+            count = 0
+            try:
+                for slot in range(len(table.ids)):
+                    # Skip assets deleted while the caller was paging
+                    if table.sns[slot] is not None:
+                        count += 1
+                        yield table.row(slot)
+            finally:
+                metrics.rows_scanned(count)
+            return
+
+        updates = {}
+        deleted = set()
+        with self._lock, self._file_lock.shared():
+            try:
+                with open(self.journal_path, 'r') as journal:
+                    for line in journal:
+                        try:
+                            record = json.loads(line)
+                        except ValueError:
+                            continue
+                        if record['op'] == 'update':
+                            updates.setdefault(record['id'], []).append((record['field'], record['value']))
+                        elif record['op'] == 'delete':
+                            deleted.add(record['id'])
+            except FileNotFoundError:
+                pass
+
+            # Writers are not held up while the caller pages through the rows:
+            # the open file survives a compaction's rename, and rows appended
+            # after this point are not read
+            try:
+                csvfile = open(self.path, 'rb')
+            except FileNotFoundError:
+                return
+            end = os.fstat(csvfile.fileno()).st_size
+
+        count = 0
+        with csvfile:
+            try:
+                for row in csv.DictReader(_lines_before(csvfile, end)):
+                    count += 1
+                    asset_id = int(row['ID'])
+                    if asset_id in deleted:
+                        continue
+                    for field, value in updates.get(asset_id, ()):
+                        row[field] = value
+                    yield row
+            finally:
+                metrics.rows_scanned(count)
+                metrics.bytes_read(csvfile.tell())
+
+    def get(self, sn):
+        self.refresh()
+        slot = self._table.by_sn.get(sn)
+        return None if slot is None else self._table.row(slot)
+
+    def get_by_id(self, asset_id):
+        self.refresh()
+        slot = self._table.slot(int(asset_id))
+        return None if slot is None else self._table.row(slot)
+
+    def get_many_by_id(self, asset_ids):
+        # Rows for the given IDs in the order given, skipping unknown IDs
+        self.refresh()
+        table = self._table
+        return [table.row(slot) for slot in map(table.slot, asset_ids) if slot is not None]
+
+    def page(self, offset, limit):
+        # rows()[offset:offset + limit] without building the other rows
+        self.refresh()
+        return list(map(self._table.row, self._table.live_slots()[offset:offset + limit]))
+
+    def is_serial_number_unique(self, sn):
+        self.refresh()
+        return sn not in self._table.by_sn
+
+    def last_id(self):
+        self.refresh()
+        return self._max_id
+
+    def next_id(self):
+        return self.last_id() + 1
+
+    def existing_serials(self, serial_numbers):
+        # The subset of serial_numbers that are already in the store
+        self.refresh()
+        by_sn = self._table.by_sn
+        return {sn for sn in serial_numbers if sn in by_sn}
+
+    def match_ids(self, column, match):
+        # IDs of the assets whose value in column satisfies match(value). For
+        # the encoded columns match is called once per distinct value, and the
+        # scan over the assets only compares integer codes.
+        self.refresh()
+        table = self._table
+        metrics.rows_scanned(len(table))
+        if column == 'ID':
+            return {asset_id for asset_id, sn in zip(table.ids, table.sns) if sn is not None and match(str(asset_id))}
+        if column == 'SN':
+            return {asset_id for asset_id, sn in zip(table.ids, table.sns) if sn is not None and match(sn)}
+
+        encoded = table.columns[column]
+        codes = {code for code, value in enumerate(encoded.values) if code and match(value)}
+        if not codes:
+            return set()
+        if len(codes) == 1:
+            return set(compress(table.ids, map(codes.pop().__eq__, encoded.codes)))
+        return set(compress(table.ids, map(codes.__contains__, encoded.codes)))
+
+    def group_counts(self, fields):
+        # {(value, ...): number of assets} over the given encoded columns,
+        # counted on the codes
+        self.refresh()
+        table = self._table
+        metrics.rows_scanned(len(table))
+        columns = [table.columns[field] for field in fields]
+        counts = Counter(zip(*[column.codes for column in columns]))
+        # Deleted assets have code 0 everywhere
+        return {tuple(column.values[code] for column, code in zip(columns, key)): count
+                for key, count in counts.items() if key[0]}
+
+    def column_index(self, column, values=None):
+        # {value: set of IDs} for one of the encoded columns, built from the
+        # codes; with values, only for those values
+        self.refresh()
+        table = self._table
+        metrics.rows_scanned(len(table))
+        encoded = table.columns[column]
+        if values is None:
+            postings = [[] for _ in encoded.values]
+            for asset_id, code in zip(table.ids, encoded.codes):
+                postings[code].append(asset_id)
+            return {encoded.values[code]: set(ids) for code, ids in enumerate(postings) if code and ids}
+
+        postings = {encoded.lookup[value]: [] for value in values if value in encoded.lookup}
+        postings.pop(0, None)
+        for asset_id, code in compress(zip(table.ids, encoded.codes), map(postings.__contains__, encoded.codes)):
+            postings[code].append(asset_id)
+        return {encoded.values[code]: set(ids) for code, ids in postings.items() if ids}
+
+    def add(self, row):
+        return self.add_many([row])[0]
+
+    def add_many(self, rows):
+        # Append rows to the CSV in one buffered write. Rows without an ID get
+        # the next free ones; a given ID must be above every ID handed out so
+        # far, deleted or not. Raises ConflictError if a serial number or ID is
+        # already taken, e.g. by another process since the caller checked.
+        with self._lock, self._file_lock.exclusive():
+            self.refresh()
+            table = self._table
+            rows = [{field: str(row.get(field, '')) for field in FIELDNAMES} for row in rows]
+
+            serials = set()
+            given_ids = set()
+            for row in rows:
+                if row['SN'] in table.by_sn or row['SN'] in serials:
+                    raise ConflictError(f"Serial number '{row['SN']}' already exists")
+                serials.add(row['SN'])
+                if row['ID'] not in ('', 'None'):
+                    asset_id = int(row['ID'])
+                    # _max_id covers deleted assets too: the journal still
+                    # deletes their IDs on every load
+                    if asset_id <= self._max_id or asset_id in given_ids:
+                        raise ConflictError(f"ID {row['ID']} is already taken")
+                    given_ids.add(asset_id)
+                    # As it is kept in memory
+                    row['ID'] = str(asset_id)
+
+            next_id = max([self._max_id] + list(given_ids)) + 1
+            for row in rows:
+                if row['ID'] in ('', 'None'):
+                    row['ID'] = str(next_id)
+                    next_id += 1
+
+            self._before_write([('create', row, None, None) for row in rows])
+            with open(self.path, 'a', newline='') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=FIELDNAMES)
+                start = csvfile.tell()
+
+                # Check if the file is empty, and write the header only if it is
+                if os.stat(self.path).st_size == 0:
+                    writer.writeheader()
+
+                writer.writerows(rows)
+                metrics.bytes_written(csvfile.tell() - start)
+
+            start = len(table.ids)
+            table.append({field: [row[field] for row in rows] for field in FIELDNAMES})
+            if not table.in_order(start):
+                # Rows given with their own IDs, out of order
+                self._table = table.compacted()
+            self._max_id = max([self._max_id] + [int(row['ID']) for row in rows])
+            self._stamp = self._disk_stamp()
+            for listener in self._listeners:
+                for row in rows:
+                    listener.on_add(row)
+                listener.on_commit()
+            return rows
+
+    def update(self, sn, field, value, expected=None):
+        # Returns the old value, or None if there is no asset with that SN.
+        # With expected, raises ConflictError unless the field still holds
+        # that value (the one the caller based the change on).
+        if field == 'ID':
+            raise ValueError("ID cannot be changed")
+        if field not in FIELDNAMES:
+            raise KeyError(field)
+
+        with self._lock, self._file_lock.exclusive():
+            self.refresh()
+            table = self._table
+            slot = table.by_sn.get(sn)
+            if slot is None:
+                return None
+
+            old_value = table.value(slot, field)
+            if expected is not None and old_value != expected:
+                raise ConflictError(f"Asset '{sn}' {field} was changed to '{old_value}' in the meantime")
+            if field == 'SN' and value != sn and value in table.by_sn:
+                raise ConflictError(f"Serial number '{value}' already exists")
+
+            self._before_write([('update', dict(table.row(slot), **{field: value}), field, old_value)])
+            self._append_journal([{'op': 'update', 'id': table.ids[slot], 'field': field, 'value': value}])
+            table.set(slot, field, value)
+            row = table.row(slot)
+            for listener in self._listeners:
+                listener.on_update(row, field, old_value)
+                listener.on_commit()
+            return old_value
+
+    def update_fields(self, sn, changes, expected=None):
+        # Change several {field: value} of one asset with one journal write.
+        # Returns (row, {field: old value}) like update_many, or None if there
+        # is no asset with that SN. With expected ({field: value}), raises ConflictError and writes
+        # nothing unless every one of those fields still holds its value.
+        if 'ID' in changes:
+            raise ValueError("ID cannot be changed")
+        for field in list(changes) + list(expected or {}):
+            if field not in FIELDNAMES:
+                raise KeyError(field)
+
+        with self._lock, self._file_lock.exclusive():
+            self.refresh()
+            table = self._table
+            slot = table.by_sn.get(sn)
+            if slot is None:
+                return None
+
+            for field, value in (expected or {}).items():
+                current = table.value(slot, field)
+                if current != value:
+                    raise ConflictError(f"Asset '{sn}' {field} was changed to '{current}' in the meantime")
+            new_sn = changes.get('SN', sn)
+            if new_sn != sn and new_sn in table.by_sn:
+                raise ConflictError(f"Serial number '{new_sn}' already exists")
+
+            old_values = {field: table.value(slot, field) for field in changes}
+            row = dict(table.row(slot), **changes)
+            self._before_write([('update', row, field, old_value) for field, old_value in old_values.items()])
+            self._append_journal([{'op': 'update', 'id': table.ids[slot], 'field': field, 'value': value}
+                                  for field, value in changes.items()])
+            for field, value in changes.items():
+                table.set(slot, field, value)
+            row = table.row(slot)
+            for listener in self._listeners:
+                for field, old_value in old_values.items():
+                    listener.on_update(row, field, old_value)
+                listener.on_commit()
+            return row, old_values
+
+    def delete(self, sn):
+        # Returns the deleted row, or None if there is no asset with that SN
+        with self._lock, self._file_lock.exclusive():
+            self.refresh()
+            table = self._table
+            slot = table.by_sn.get(sn)
+            if slot is None:
+                return None
+
+            row = table.row(slot)
+            self._before_write([('delete', row, None, None)])
+            self._append_journal([{'op': 'delete', 'id': table.ids[slot]}])
+            table.delete(slot)
+            self._vacuum()
+            for listener in self._listeners:
+                listener.on_delete(row)
+                listener.on_commit()
+            return row
+
+    def update_many(self, serial_numbers, changes):
+        # Apply the same {field: value} changes to every asset in serial_numbers
+        # with one journal write. Returns [(row, {field: old value}), ...] for
+        # the assets found. SN cannot be batch-updated as it must stay unique.
+        if 'SN' in changes or 'ID' in changes:
+            raise ValueError("SN and ID cannot be changed in a batch update")
+        for field in changes:
+            if field not in FIELDNAMES:
+                raise KeyError(field)
+
+        with self._lock, self._file_lock.exclusive():
+            self.refresh()
+            table = self._table
+            slots = self._slots_for(serial_numbers)
+            old_rows = [{field: table.value(slot, field) for field in changes} for slot in slots]
+            self._before_write([('update', dict(table.row(slot), **changes), field, old_value)
+                                for slot, olds in zip(slots, old_rows) for field, old_value in olds.items()])
+            self._append_journal([{'op': 'update', 'id': table.ids[slot], 'field': field, 'value': value}
+                                  for slot in slots for field, value in changes.items()])
+
+            updated = []
+            for slot, old_values in zip(slots, old_rows):
+                for field, value in changes.items():
+                    table.set(slot, field, value)
+                row = table.row(slot)
+                for listener in self._listeners:
+                    for field, old_value in old_values.items():
+                        listener.on_update(row, field, old_value)
+                updated.append((row, old_values))
+            for listener in self._listeners:
+                listener.on_commit()
+            return updated
+
+    def delete_many(self, serial_numbers):
+        # Delete every asset in serial_numbers with one journal write.
+        # Returns the deleted rows.
+        with self._lock, self._file_lock.exclusive():
+            self.refresh()
+            table = self._table
+            slots = self._slots_for(serial_numbers)
+            rows = [table.row(slot) for slot in slots]
+            self._before_write([('delete', row, None, None) for row in rows])
+            self._append_journal([{'op': 'delete', 'id': table.ids[slot]} for slot in slots])
+
+            for slot, row in zip(slots, rows):
+                table.delete(slot)
+                for listener in self._listeners:
+                    listener.on_delete(row)
+            self._vacuum()
+            for listener in self._listeners:
+                listener.on_commit()
+            return rows
+
+    def _slots_for(self, serial_numbers):
+        by_sn = self._table.by_sn
+        slots = []
+        seen = set()
+        for sn in serial_numbers:
+            slot = by_sn.get(sn)
+            if slot is not None and sn not in seen:
+                seen.add(sn)
+                slots.append(slot)
+        return slots
+
+    def _before_write(self, changes):
+        if changes:
+            for listener in self._listeners:
+                listener.before_write(changes)
+
+    def _append_journal(self, records):
+        if not records:
+            return
+        lines = ''.join(json.dumps(record) + '\n' for record in records)
+        with open(self.journal_path, 'a') as journal:
+            journal.write(lines)
+        metrics.bytes_written(len(lines))
+        self._journal_size += len(lines)
+        self._stamp = self._disk_stamp()
+
+        if self._journal_size >= self.compact_threshold:
+            self._compact_in_background()
+
+    def _compact_in_background(self):
+        if self._compactor is not None and self._compactor.is_alive():
+            return
+        self._compactor = threading.Thread(target=self._compact_quietly, name='journal-compactor')
+        self._compactor.start()
+
+    def _compact_quietly(self):
+        try:
+            self.compact()
+        except OSError:
+            # e.g. the CSV is open in a spreadsheet; the journal stays and the
+            # next edit past the threshold tries again
+            pass
+
+    def compact(self):
+        # Fold the journal into a fresh CSV so assets.csv on disk is current
+        with self._lock, self._file_lock.exclusive():
+            self.refresh()
+            if self._journal_size == 0:
+                return False
+
+            tmp_path = self.path + '.tmp'
+            try:
+                with metrics.phase('compact'), open(tmp_path, 'w', newline='') as csvfile:
+                    writer = csv.writer(csvfile)
+                    writer.writerow(FIELDNAMES)
+                    writer.writerows(self._table.records())
+                    csvfile.flush()
+                    os.fsync(csvfile.fileno())
+                    metrics.bytes_written(csvfile.tell())
+                os.replace(tmp_path, self.path)
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+            # Replaying a journal over its own compacted CSV is harmless, so a
+            # crash between the rename and this replacement loses nothing. If
+            # the highest ID ever handed out belonged to a deleted asset, the
+            # new CSV no longer shows it, so a max_id record keeps it.
+            table = self._table
+            live_max = next((asset_id for asset_id, sn in zip(reversed(table.ids), reversed(table.sns))
+                             if sn is not None), 0)
+            if self._max_id > live_max:
+                tmp_path = self.journal_path + '.tmp'
+                with open(tmp_path, 'w') as journal:
+                    journal.write(json.dumps({'op': 'max_id', 'id': self._max_id}) + '\n')
+                    journal.flush()
+                    os.fsync(journal.fileno())
+                os.replace(tmp_path, self.journal_path)
+            else:
+                os.remove(self.journal_path)
+            self._journal_size = 0
+            self._stamp = self._disk_stamp()
+            for listener in self._listeners:
+                listener.on_commit()
+            return True
+
+    def wait_for_compaction(self):
+        if self._compactor is not None:
+            self._compactor.join()
+
+    def export_csv(self):
+        # Path of a CSV file that is current, for spreadsheets and other tools
+        self.compact()
+        return self.path
+
+
+class CsvUserStore:
+    # Usernames and password hashes in user_data.csv.
+    # The file is loaded once into a dict keyed by username and reloaded only
+    # when its mtime or size changes, so a login is a single dict lookup.
+    # Accounts are added under an exclusive lock on user_data.csv.lock so two
+    # processes cannot create the same username.
+
+    FIELDNAMES = ['username', 'password']
+
+    def __init__(self, path='user_data.csv'):
+        self.path = path
+        self._passwords = {}
+        self._stamp = None
+        self._lock = threading.RLock()
+        self._file_lock = FileLock(path + '.lock')
+        self.loaded = False
+
+    def _disk_stamp(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        return (st.st_mtime_ns, st.st_size)
+
+    def refresh(self):
+        with self._lock, self._file_lock.shared():
+            stamp = self._disk_stamp()
+            if self.loaded and stamp == self._stamp:
+                return False
+
+            passwords = {}
+            if stamp is not None:
+                metrics.bytes_read(stamp[1])
+                with open(self.path, 'r', newline='') as csvfile:
+                    for row in csv.DictReader(csvfile):
+                        # Files written before duplicates were rejected may
+                        # repeat a username; the first account wins
+                        passwords.setdefault(row['username'], row['password'])
+            self._passwords = passwords
+            self._stamp = stamp
+            self.loaded = True
+            return True
+
+    def rows(self):
+        self.refresh()
+        return [{'username': username, 'password': password} for username, password in self._passwords.items()]
+
+    def get(self, username):
+        # Stored password hash for username, or None
+        self.refresh()
+        return self._passwords.get(username)
+
+    def add(self, username, hashed_password):
+        # Returns False if the username is already taken
+        with self._lock, self._file_lock.exclusive():
+            self.refresh()
+            if username in self._passwords:
+                return False
+
+            new_file = not os.path.exists(self.path)
+            with open(self.path, 'a', newline='') as csvfile:
+                writer = csv.DictWriter(csvfile, fieldnames=self.FIELDNAMES, quoting=csv.QUOTE_MINIMAL)
+                start = csvfile.tell()
+                if new_file:
+                    writer.writeheader()
+                writer.writerow({'username': username, 'password': hashed_password})
+                metrics.bytes_written(csvfile.tell() - start)
+
+            self._passwords[username] = hashed_password
+            self._stamp = self._disk_stamp()
+            return True
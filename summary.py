@@ -0,0 +1,248 @@
+import json
+import os
+
+from query import QueryError
+from store import StoreListener
+
+# Columns the inventory is counted by; a report can group by any of them
+SUMMARY_FIELDS = ['CATEGORY', 'TYPE', 'LOCATION', 'ASSIGNEE', 'STATUS']
+
+# Fold the change log into the snapshot once it grows past this many bytes
+SUMMARY_LOG_BYTES = 256 * 1024
+
+
+def parse_fields(fields):
+    # ['category', 'location'] or "CATEGORY, LOCATION" -> ['CATEGORY', 'LOCATION']
+    if isinstance(fields, str):
+        fields = fields.replace(',', ' ').split()
+    parsed = []
+    for field in fields:
+        field = field.strip().upper()
+        if field not in SUMMARY_FIELDS:
+            raise QueryError(f"Cannot group by '{field}' (choose from {', '.join(SUMMARY_FIELDS)})")
+        if field not in parsed:
+            parsed.append(field)
+    return parsed
+
+
+def group_counts(counts, fields):
+    # Add up {(CATEGORY, TYPE, LOCATION, ASSIGNEE, STATUS): n} by some of
+    # those columns. Returns [((value, ...), n), ...], largest groups first.
+    positions = [SUMMARY_FIELDS.index(field) for field in fields]
+    groups = {}
+    for key, count in counts.items():
+        group = tuple(key[position] for position in positions)
+        groups[group] = groups.get(group, 0) + count
+    return sorted(groups.items(), key=lambda item: (-item[1], item[0]))
+
+
+def group_records(groups, fields):
+    # group_counts output as [{'CATEGORY': ..., 'COUNT': n}, ...]
+    return [dict(zip(fields, values), COUNT=count) for values, count in groups]
+
+
+def _add(counts, key, delta):
+    count = counts.get(key, 0) + delta
+    if count:
+        counts[key] = count
+    else:
+        counts.pop(key, None)
+
+
+def _jsonable(version):
+    # The store's version as it reads back from JSON (tuples become lists)
+    return json.loads(json.dumps(version))
+
+
+class InventorySummary(StoreListener):
+    # Asset counts per (CATEGORY, TYPE, LOCATION, ASSIGNEE, STATUS), kept in
+    # step with an AssetStore. A group-by over any of those columns adds up
+    # these counts, so it costs as much as the number of distinct combinations,
+    # not the number of assets.
+    #
+    # The counts are kept next to the CSV, like the assets themselves: a
+    # snapshot (assets.summary.json) and a log of the changes since
+    # (assets.summary.log), folded into a new snapshot once it passes
+    # SUMMARY_LOG_BYTES. Every entry records the store version it brings the
+    # counts to and the one it starts from, so a reader only trusts them if
+    # they form an unbroken chain to the version it has loaded. If a process
+    # changed the assets without keeping the summary (or the files are
+    # missing), the counts are rebuilt with one pass over the store's encoded
+    # columns and saved again.
+
+    def __init__(self, store):
+        self.store = store
+        base = os.path.splitext(store.path)[0]
+        self.path = base + '.summary.json'
+        self.log_path = base + '.summary.log'
+        self._counts = None
+        # Store version the counts (or, before they are read, the loaded assets) reflect
+        self._version = None
+        # Version the counts were last rebuilt at by scanning the store
+        self._scanned = None
+        # (file stamp, parsed snapshot) of the last snapshot read, as the log
+        # usually grows many times before the snapshot is rewritten
+        self._snapshot = None
+        # Changes of the write in progress, logged together by on_commit
+        self._pending = []
+        store.subscribe(self)
+
+    def counts(self):
+        # {(CATEGORY, TYPE, LOCATION, ASSIGNEE, STATUS): number of assets}
+        if not self.store.loaded:
+            # A report is all this process wants so far (e.g. cli.py summary):
+            # if the files reach the version on disk, answer from them without
+            # loading the assets at all
+            counts = self._read(self.store.disk_version())
+            if counts is not None:
+                return counts
+        self.store.refresh()
+        if self._counts is None:
+            self._load(self.store.version())
+        return self._counts
+
+    def group_by(self, fields):
+        return group_counts(self.counts(), parse_fields(fields))
+
+    def total(self):
+        return sum(self.counts().values())
+
+    def on_reload(self):
+        # Read lazily, when a report or the next change needs them
+        self._counts = None
+        self._version = self.store.version()
+
+    def on_add(self, row):
+        self._pending.append(self._key(row) + [1])
+
+    def on_update(self, row, field, old_value):
+        if field in SUMMARY_FIELDS:
+            new_key = self._key(row)
+            old_key = list(new_key)
+            old_key[SUMMARY_FIELDS.index(field)] = old_value
+            self._pending.append(old_key + [-1])
+            self._pending.append(new_key + [1])
+
+    def on_delete(self, row):
+        self._pending.append(self._key(row) + [-1])
+
+    def on_commit(self):
+        # Called with the store's write lock held. Every write, even one that
+        # changes no count (or a compaction), gives the store a new version,
+        # so it is logged to keep the chain unbroken.
+        changes, self._pending = self._pending, []
+        version = self.store.version()
+        if self._counts is None:
+            self._load(self._version)
+        if version == self._scanned:
+            # The scan already counted this write
+            return
+        for *key, delta in changes:
+            _add(self._counts, tuple(key), delta)
+        if changes or version != self._version:
+            self._append_log(changes, version)
+
+    def _key(self, row):
+        return [row[field] for field in SUMMARY_FIELDS]
+
+    def _load(self, version):
+        # Counts as of version from the files, else from a scan of the store
+        counts = self._read(version) if version is not None else None
+        if counts is None:
+            version, counts = self._scan()
+            self._scanned = version
+            try:
+                log_offset = os.path.getsize(self.log_path)
+            except FileNotFoundError:
+                log_offset = 0
+            self._write_snapshot(counts, version, log_offset)
+        self._counts = counts
+        self._version = version
+
+    def _scan(self):
+        # (version, counts) from the store, retried if another process
+        # changed the assets in between
+        while True:
+            version = self.store.version()
+            counts = self.store.group_counts(SUMMARY_FIELDS)
+            if self.store.version() == version:
+                return version, counts
+
+    def _read(self, version):
+        target = _jsonable(version)
+        snapshot = self._read_snapshot()
+        if snapshot is None:
+            return None
+
+        counts = dict(snapshot['counts'])
+        current = snapshot['version']
+        try:
+            with open(self.log_path, 'rb') as log:
+                # Entries before the offset are already in the snapshot
+                log.seek(snapshot['log_offset'])
+                for line in log:
+                    try:
+                        record = json.loads(line)
+                    except ValueError:
+                        # A torn last line from a crash mid-append
+                        break
+                    # A batch writes several entries at the same version;
+                    # stop before the first change past the target
+                    if record['base'] != current or (current == target and record['version'] != target):
+                        break
+                    for *key, delta in record['changes']:
+                        _add(counts, tuple(key), delta)
+                    current = record['version']
+        except FileNotFoundError:
+            pass
+        return counts if current == target else None
+
+    def _read_snapshot(self):
+        try:
+            st = os.stat(self.path)
+        except FileNotFoundError:
+            return None
+        stamp = (st.st_ino, st.st_mtime_ns, st.st_size)
+        if self._snapshot is not None and self._snapshot[0] == stamp:
+            return self._snapshot[1]
+
+        try:
+            with open(self.path, 'r') as snapshot_file:
+                snapshot = json.load(snapshot_file)
+        except (FileNotFoundError, ValueError):
+            return None
+        if snapshot.get('fields') != SUMMARY_FIELDS:
+            return None
+        snapshot['counts'] = {tuple(key): count for *key, count in snapshot['counts']}
+        self._snapshot = (stamp, snapshot)
+        return snapshot
+
+    def _append_log(self, changes, version):
+        line = json.dumps({'base': _jsonable(self._version), 'version': _jsonable(version), 'changes': changes})
+        with open(self.log_path, 'ab') as log:
+            log.write(line.encode() + b'\n')
+            size = log.tell()
+        self._version = version
+
+        if size >= SUMMARY_LOG_BYTES and self._counts is not None:
+            # Only done under the store's write lock, so no entry is lost. The
+            # log goes first: until the new snapshot is in place readers find
+            # no chain and rebuild, rather than apply an entry twice.
+            os.remove(self.log_path)
+            self._write_snapshot(self._counts, version, 0)
+
+    def _write_snapshot(self, counts, version, log_offset):
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'w') as snapshot_file:
+                # No total: the snapshot alone lags behind the log, so readers
+                # go through InventorySummary (e.g. cli.py summary)
+                json.dump({'fields': SUMMARY_FIELDS, 'version': version, 'log_offset': log_offset,
+                           'counts': [list(key) + [count] for key, count in counts.items()]}, snapshot_file)
+            os.replace(tmp_path, self.path)
+        except PermissionError:
+            # Only a cache; the next reader rebuilds it
+            pass
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
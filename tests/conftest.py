@@ -0,0 +1,35 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the top of the repository, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from store import AssetStore  # noqa: E402
+
+
+def asset(sn, category='LAPTOP', type='DELL LATITUDE 5440', location='HQ', assignee='',
+          description='', color='BLACK', status='ACTIVE'):
+    return {'SN': sn, 'CATEGORY': category, 'TYPE': type, 'LOCATION': location, 'ASSIGNEE': assignee,
+            'DESCRIPTION': description, 'COLOR': color, 'STATUS': status}
+
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    # Every test gets its own assets.csv, journal, lock and summary files
+    monkeypatch.chdir(tmp_path)
+    return tmp_path
+
+
+@pytest.fixture
+def store(workdir):
+    store = AssetStore()
+    store.add_many([
+        asset('SN-1'),
+        asset('SN-2', location='BRANCH', assignee='ESTHER MENSAH'),
+        asset('SN-3', category='MONITOR', type='DELL P2422H'),
+        asset('SN-4', category='MONITOR', type='HP E24', location='BRANCH', status='SPARE'),
+        asset('SN-5', category='PHONE', type='IPHONE 13', status='RETIRED'),
+    ])
+    return store
@@ -0,0 +1,52 @@
+import json
+
+import pytest
+
+import audit
+
+
+@pytest.fixture
+def log_dir(workdir):
+    # The writer opens its files on first use, in the current directory
+    audit.shutdown()
+    yield workdir
+    audit.shutdown()
+
+
+def lines(path):
+    with open(path) as log:
+        return [json.loads(line) for line in log]
+
+
+def test_events_are_written_as_json_lines(log_dir):
+    audit.asset_event('update', "Asset updated", sn='SN-1', id=1, field='LOCATION', old='HQ', new='ANNEX')
+    audit.user_event('login', "User logged in", user='admin')
+    audit.shutdown()
+
+    [entry] = lines(log_dir / audit.ASSETS_LOG)
+    assert entry['event'] == 'update' and entry['message'] == "Asset updated"
+    assert (entry['sn'], entry['id'], entry['field'], entry['old'], entry['new']) == ('SN-1', 1, 'LOCATION', 'HQ', 'ANNEX')
+    assert 'query' not in entry
+    [entry] = lines(log_dir / audit.USERS_LOG)
+    assert entry['event'] == 'login' and entry['user'] == 'admin'
+
+
+def test_everything_queued_is_written_on_shutdown(log_dir):
+    for number in range(3 * audit.BATCH_SIZE):
+        audit.asset_event('create', "Asset added", sn=f'SN-{number}')
+    audit.shutdown()
+    assert [entry['sn'] for entry in lines(log_dir / audit.ASSETS_LOG)] == [f'SN-{n}' for n in range(3 * audit.BATCH_SIZE)]
+
+
+def test_files_rotate_by_size(log_dir, monkeypatch):
+    monkeypatch.setattr(audit, 'MAX_BYTES', 2000)
+    for number in range(300):
+        audit.asset_event('create', "Asset added", sn=f'SN-{number}')
+    audit.shutdown()
+
+    paths = [log_dir / audit.ASSETS_LOG] + [log_dir / f'{audit.ASSETS_LOG}.{n}' for n in range(1, audit.BACKUP_COUNT + 1)]
+    assert all(path.exists() for path in paths)
+    assert all(path.stat().st_size <= 2000 for path in paths)
+    # The newest records are in the current file, the oldest were dropped
+    assert lines(paths[0])[-1]['sn'] == 'SN-299'
+    assert sum(len(lines(path)) for path in paths) < 300
@@ -0,0 +1,153 @@
+import csv
+import io
+import json
+
+import pytest
+
+import store as store_module
+from changefeed import SCAN_BYTES, export_changes
+from conftest import asset
+from storage import CsvBackend, SqliteBackend
+
+
+@pytest.fixture(params=['csv', 'sqlite'])
+def backend(request, workdir):
+    backend = CsvBackend() if request.param == 'csv' else SqliteBackend()
+    backend.assets.add_many([asset('SN-1'), asset('SN-2', location='BRANCH')])
+    yield backend
+    backend.close()
+
+
+def ops(feed, since_seq=None):
+    return [(record['seq'], record['op'], record['sn'], record.get('field'), record.get('old'))
+            for record in feed.changes(since_seq)]
+
+
+def test_every_write_is_numbered_in_order(backend):
+    backend.assets.update('SN-1', 'LOCATION', 'ANNEX')
+    backend.assets.update_fields('SN-2', {'STATUS': 'SPARE', 'ASSIGNEE': 'KOFI'})
+    backend.assets.delete('SN-1')
+
+    assert ops(backend.changes) == [
+        (1, 'create', 'SN-1', None, None),
+        (2, 'create', 'SN-2', None, None),
+        (3, 'update', 'SN-1', 'LOCATION', 'HQ'),
+        (4, 'update', 'SN-2', 'STATUS', 'ACTIVE'),
+        (5, 'update', 'SN-2', 'ASSIGNEE', ''),
+        (6, 'delete', 'SN-1', None, None),
+    ]
+    records = list(backend.changes.changes(since_seq=3))
+    assert records[0]['asset']['STATUS'] == 'SPARE' and records[0]['asset']['ASSIGNEE'] == 'KOFI'
+    assert records[-1]['asset']['LOCATION'] == 'ANNEX'
+    assert backend.changes.last_seq() == 6
+    times = [record['time'] for record in backend.changes.changes()]
+    assert times == sorted(times)
+
+
+def test_processes_share_one_sequence(workdir):
+    first, second = CsvBackend(), CsvBackend()
+    first.assets.add(asset('SN-1'))
+    second.assets.update('SN-1', 'STATUS', 'SPARE')
+    first.assets.add(asset('SN-2'))
+
+    assert [seq for seq, *_ in ops(second.changes)] == [1, 2, 3]
+
+
+def test_since_seq_and_since_time_on_a_long_feed(workdir):
+    backend = CsvBackend()
+    for number in range(200):
+        backend.assets.add(asset(f'SN-{number}', description='X' * 40))
+    with open(backend.changes.path, 'rb') as feed:
+        assert len(feed.read()) > 10 * SCAN_BYTES
+
+    feed = backend.changes
+    assert [record['seq'] for record in feed.changes(since_seq=195)] == [196, 197, 198, 199, 200]
+    assert [record['seq'] for record in feed.changes(since_seq=100, limit=3)] == [101, 102, 103]
+    time = list(feed.changes(since_seq=149))[0]['time']
+    first = list(feed.changes(since_time=time))[0]
+    assert first['time'] == time and first['seq'] <= 150
+    assert list(feed.changes(since_seq=200)) == []
+
+
+def test_a_torn_last_line_is_skipped(workdir):
+    backend = CsvBackend()
+    backend.assets.add(asset('SN-1'))
+    with open(backend.changes.path, 'ab') as feed:
+        feed.write(b'{"seq": 2, "ti')
+
+    backend.assets.update('SN-1', 'STATUS', 'SPARE')
+    assert [seq for seq, *_ in ops(backend.changes)] == [1, 2]
+
+
+def test_a_failed_write_is_undone_in_the_feed(workdir, monkeypatch):
+    backend = CsvBackend()
+    backend.assets.add_many([asset('SN-1'), asset('SN-2')])
+
+    def fail(records):
+        raise OSError("disk full")
+    with monkeypatch.context() as patch:
+        patch.setattr(backend.assets, '_append_journal', fail)
+        with pytest.raises(OSError):
+            backend.assets.update('SN-1', 'LOCATION', 'ANNEX')
+    # Not confirmed, so readers do not see it yet
+    assert backend.changes.last_seq() == 2
+    assert len(list(backend.changes.changes())) == 2
+
+    backend.assets.update('SN-2', 'STATUS', 'SPARE')
+    assert ops(backend.changes, since_seq=2) == [
+        (3, 'update', 'SN-1', 'LOCATION', 'HQ'),
+        (4, 'update', 'SN-1', 'LOCATION', 'ANNEX'),
+        (5, 'update', 'SN-2', 'STATUS', 'ACTIVE'),
+    ]
+    assert [record['asset']['LOCATION'] for record in backend.changes.changes(since_seq=2)] == ['ANNEX', 'HQ', 'HQ']
+
+
+def test_a_failed_create_is_deleted_again(workdir, monkeypatch):
+    backend = CsvBackend()
+    backend.assets.add(asset('SN-1'))
+    backend.assets.update('SN-1', 'STATUS', 'SPARE')
+
+    def fail(*args, **kwargs):
+        raise PermissionError("assets.csv is open in another program")
+    with monkeypatch.context() as patch:
+        patch.setattr(store_module.csv, 'DictWriter', fail)
+        with pytest.raises(PermissionError):
+            backend.assets.add(asset('SN-2'))
+
+    # A compaction writes no records of its own: it must not confirm these
+    assert backend.assets.compact()
+    assert ops(backend.changes) == [
+        (1, 'create', 'SN-1', None, None),
+        (2, 'update', 'SN-1', 'STATUS', 'ACTIVE'),
+        (3, 'create', 'SN-2', None, None),
+        (4, 'delete', 'SN-2', None, None),
+    ]
+
+
+def test_a_crash_after_the_store_write_keeps_the_records(workdir, monkeypatch):
+    backend = CsvBackend()
+    backend.assets.add(asset('SN-1'))
+    # The process dies after writing the journal, before confirming
+    monkeypatch.setattr(backend.changes, 'on_commit', lambda: None)
+    backend.assets.update('SN-1', 'STATUS', 'SPARE')
+    assert backend.changes.last_seq() == 1
+
+    # The next process to load the assets settles the feed
+    restarted = CsvBackend()
+    assert len(restarted.assets) == 1
+    assert ops(restarted.changes) == [(1, 'create', 'SN-1', None, None), (2, 'update', 'SN-1', 'STATUS', 'ACTIVE')]
+
+
+def test_export_as_csv_and_jsonl(backend):
+    backend.assets.update('SN-1', 'LOCATION', 'ANNEX')
+
+    out = io.StringIO()
+    assert export_changes(backend.changes.changes(since_seq=2), out, 'csv') == (1, 3)
+    rows = list(csv.DictReader(io.StringIO(out.getvalue())))
+    assert len(rows) == 1
+    assert rows[0]['OP'] == 'update' and rows[0]['FIELD'] == 'LOCATION' and rows[0]['OLD'] == 'HQ'
+    assert rows[0]['LOCATION'] == 'ANNEX' and rows[0]['SN'] == 'SN-1'
+
+    out = io.StringIO()
+    assert export_changes(backend.changes.changes(), out, 'jsonl') == (3, 3)
+    assert [json.loads(line)['op'] for line in out.getvalue().splitlines()] == ['create', 'create', 'update']
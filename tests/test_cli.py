@@ -0,0 +1,74 @@
+import csv
+import io
+import json
+import shlex
+
+import pytest
+
+import cli
+from store import AssetStore
+
+
+def run(capsys, command):
+    status = cli.main(shlex.split(command))
+    out, err = capsys.readouterr()
+    return status, out, err
+
+
+def test_the_usage_examples_parse():
+    parser = cli.build_parser()
+    with open(cli.__file__) as source:
+        examples = [line[len('#   python cli.py '):].strip() for line in source if line.startswith('#   python cli.py ')]
+    assert len(examples) == 10
+    for example in examples:
+        parser.parse_args(shlex.split(example))
+
+
+def test_create_search_and_list(store, capsys):
+    status, out, _ = run(capsys, 'create --sn abc123 --category laptop --location hq')
+    assert status == 0
+    assert AssetStore().get('ABC123')['ID'] == '6'
+
+    status, out, _ = run(capsys, '--format json search "CATEGORY=LAPTOP AND LOCATION=HQ"')
+    assert [(row['ID'], row['SN']) for row in json.loads(out)] == [(1, 'SN-1'), (6, 'ABC123')]
+
+    status, out, _ = run(capsys, '--format csv list --page 2 --page-size 2 --sort=-ID')
+    assert [row['SN'] for row in csv.DictReader(io.StringIO(out))] == ['SN-4', 'SN-3']
+
+
+def test_search_results_and_errors(store, capsys):
+    status, out, _ = run(capsys, '--format json search "LOCATION=MOON"')
+    assert json.loads(out) == []
+    assert run(capsys, 'search "COLOUR=RED"')[0] == 1
+
+
+def test_update_sn_and_other_fields_together(store, capsys):
+    status, _, _ = run(capsys, 'update SN-1 --set SN=SN-1A --set LOCATION=ANNEX')
+    assert status == 0
+    row = AssetStore().get('SN-1A')
+    assert (row['ID'], row['LOCATION']) == ('1', 'ANNEX')
+    assert AssetStore().get('SN-1') is None
+
+
+def test_a_taken_sn_changes_nothing(store, capsys):
+    status, _, err = run(capsys, 'update SN-1 --set LOCATION=ANNEX --set SN=SN-2')
+    assert status == 1
+    assert 'already exists' in err
+    assert AssetStore().get('SN-1')['LOCATION'] == 'HQ'
+
+
+def test_update_and_delete_by_query(store, capsys):
+    assert run(capsys, 'update --query "CATEGORY=MONITOR" --set STATUS=RETIRED')[0] == 0
+    assert run(capsys, 'delete --query "STATUS=RETIRED"')[0] == 0
+    assert [row['SN'] for row in AssetStore().rows()] == ['SN-1', 'SN-2']
+    with pytest.raises(SystemExit):
+        cli.main(['delete'])
+
+
+def test_summary_csv(store, capsys):
+    status, out, _ = run(capsys, '--format csv summary CATEGORY LOCATION')
+    assert list(csv.reader(io.StringIO(out))) == [
+        ['CATEGORY', 'LOCATION', 'COUNT'],
+        ['LAPTOP', 'BRANCH', '1'], ['LAPTOP', 'HQ', '1'], ['MONITOR', 'BRANCH', '1'],
+        ['MONITOR', 'HQ', '1'], ['PHONE', 'HQ', '1'],
+    ]
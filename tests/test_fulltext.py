@@ -0,0 +1,92 @@
+import pytest
+
+import fulltext
+from conftest import asset
+from fulltext import FullTextIndex, search_terms
+from store import AssetStore
+
+
+@pytest.fixture
+def index(store):
+    store.update('SN-1', 'DESCRIPTION', 'SPARE CHARGER INCLUDED')
+    store.update('SN-3', 'ASSIGNEE', 'KWAME ASANTE')
+    return FullTextIndex(store)
+
+
+def found(index, text, limit=20):
+    return [row['SN'] for row, score in index.search(text, limit)]
+
+
+def test_rarer_words_and_more_matches_rank_higher(index):
+    # DELL is in three TYPEs, LATITUDE in one
+    assert found(index, 'dell latitude') == ['SN-1', 'SN-2', 'SN-3']
+    assert found(index, 'dell latitude', limit=1) == ['SN-1']
+    scores = [score for row, score in index.search('dell latitude')]
+    assert scores == sorted(scores, reverse=True)
+
+
+def test_prefix_substring_and_misspelling(index):
+    assert found(index, 'latit') == ['SN-1', 'SN-2']
+    assert found(index, 'harge') == ['SN-1']
+    assert found(index, 'latitde') == ['SN-1', 'SN-2']
+    # Words with digits only match whole or by prefix
+    assert found(index, '544') == ['SN-1', 'SN-2']
+    assert found(index, '440') == []
+
+
+def test_stop_words_are_dropped(index):
+    assert search_terms('the charger of esther') == ['CHARGER', 'ESTHER']
+    assert index.search('the of') == []
+
+
+def test_the_index_follows_writes(index, store):
+    assert found(index, 'kwame') == ['SN-3']
+    store.update('SN-3', 'ASSIGNEE', 'ABENA')
+    store.delete('SN-2')
+    store.add(asset('SN-6', category='KEYBOARD', type='LOGITECH K120', description='KWAME SPARE KEYBOARD'))
+
+    assert found(index, 'kwame') == ['SN-6']
+    assert found(index, 'abena') == ['SN-3']
+    assert found(index, 'esther') == []
+    assert found(index, 'latitude') == ['SN-1']
+
+
+def test_another_process_writes_are_picked_up(index, store):
+    assert found(index, 'kwame') == ['SN-3']
+    AssetStore(store.path).update('SN-3', 'ASSIGNEE', 'ABENA')
+    assert found(index, 'kwame') == []
+    assert found(index, 'abena') == ['SN-3']
+
+
+def test_the_snapshot_keeps_the_ids_at_its_version(index, store, monkeypatch):
+    monkeypatch.setattr(fulltext, 'SAVE_AFTER_VALUES', 1)
+    expected = index.search('dell spare')
+    assert expected
+
+    def scan(*args, **kwargs):
+        raise AssertionError("read from the snapshot instead")
+    reopened = AssetStore(store.path)
+    monkeypatch.setattr(reopened, 'column_index', scan)
+    assert FullTextIndex(reopened).search('dell spare') == expected
+
+
+def test_a_stale_snapshot_is_counted_again(index, store):
+    index.search('dell')
+    AssetStore(store.path).delete('SN-1')
+
+    reopened = FullTextIndex(AssetStore(store.path))
+    assert found(reopened, 'latitude') == ['SN-2']
+    assert found(reopened, 'charger') == []
+
+
+def test_values_no_asset_has_are_dropped_on_save(index, store, monkeypatch):
+    monkeypatch.setattr(fulltext, 'SAVE_AFTER_VALUES', 1)
+    index.search('dell')
+    store.update('SN-1', 'DESCRIPTION', 'NEW KEYBOARD')
+
+    assert (2, 'SPARE CHARGER INCLUDED') not in index._docs
+    assert 'CHARGER' not in index._words
+    assert found(index, 'keyboard') == ['SN-1']
+    assert found(index, 'latitude') == ['SN-1', 'SN-2']
+    # Read back with the new numbering
+    assert found(FullTextIndex(AssetStore(store.path)), 'keyboard latitude') == ['SN-1', 'SN-2']
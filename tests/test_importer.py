@@ -0,0 +1,78 @@
+import json
+
+from conftest import asset
+from importer import import_assets
+from store import AssetStore
+
+
+def write(path, text):
+    path.write_text(text)
+    return str(path)
+
+
+def test_import_csv_normalizes_and_reports_rejects(store, workdir):
+    path = write(workdir / 'new.csv',
+                 "sn,Category,TYPE,location,assignee,description,color,status\n"
+                 " sn-10 ,laptop,hp elitebook,hq,,spare unit,silver,active\n"
+                 "SN-1,laptop,dell,hq,,,black,active\n"
+                 ",laptop,dell,hq,,,black,active\n"
+                 "SN-11,phone,pixel 7,branch,ama,,black,active\n"
+                 "sn-11,phone,pixel 7,branch,ama,,black,active\n")
+
+    added, rejected = import_assets(store, path)
+
+    assert added == 2
+    assert rejected == [(3, 'SN-1', "serial number already exists"),
+                        (4, '', "missing serial number"),
+                        (6, 'SN-11', "duplicate serial number in file")]
+    row = store.get('SN-10')
+    assert (row['ID'], row['CATEGORY'], row['TYPE'], row['ASSIGNEE']) == ('6', 'LAPTOP', 'HP ELITEBOOK', 'NOT ASSIGNED')
+    assert AssetStore(store.path).get('SN-11')['ID'] == '7'
+
+
+def test_import_jsonl_skips_bad_lines(store, workdir):
+    lines = [json.dumps({'sn': 'SN-20', 'category': 'monitor', 'status': 'spare'}),
+             '',
+             '{"sn": "SN-21"',
+             json.dumps(['SN-22']),
+             json.dumps({'SN': 'SN-23', 'LOCATION': None, 'COLOR': 7})]
+    path = write(workdir / 'new.jsonl', '\n'.join(lines) + '\n')
+
+    added, rejected = import_assets(store, path)
+
+    assert added == 2
+    assert rejected == [(3, '', "invalid JSON"), (4, '', "not a JSON object")]
+    assert store.get('SN-20')['STATUS'] == 'SPARE'
+    assert (store.get('SN-23')['LOCATION'], store.get('SN-23')['COLOR']) == ('', '7')
+
+
+def test_import_in_chunks_hands_out_contiguous_ids(workdir):
+    store = AssetStore()
+    store.add(asset('SN-0'))
+    path = write(workdir / 'many.csv', "SN,CATEGORY\n" + ''.join(f"SN-{n},LAPTOP\n" for n in range(1, 26)))
+    batches = []
+
+    added, rejected = import_assets(store, path, chunk_size=10, on_added=batches.append)
+
+    assert (added, rejected) == (25, [])
+    assert [len(batch) for batch in batches] == [10, 10, 5]
+    assert [row['ID'] for row in AssetStore().rows()] == [str(n) for n in range(1, 27)]
+
+
+def test_a_serial_number_taken_while_importing_is_rejected(store, workdir):
+    # Another process adds SN-31 after the chunk was checked
+    path = write(workdir / 'race.csv', "SN\nSN-30\nSN-31\n")
+    existing_serials = store.existing_serials
+
+    def checked_then_taken(serial_numbers):
+        existing = existing_serials(serial_numbers)
+        if not existing:
+            AssetStore(store.path).add(asset('SN-31'))
+        return existing
+
+    store.existing_serials = checked_then_taken
+    added, rejected = import_assets(store, path)
+
+    assert added == 1
+    assert rejected == [(3, 'SN-31', "serial number already exists")]
+    assert [row['SN'] for row in AssetStore(store.path).rows()][-2:] == ['SN-31', 'SN-30']
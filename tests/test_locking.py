@@ -0,0 +1,117 @@
+import os
+import subprocess
+import sys
+import threading
+
+import pytest
+
+from conftest import asset
+from locking import FileLock, fcntl
+from store import AssetStore, ConflictError
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def reopened(store):
+    return AssetStore(store.path).rows()
+
+
+def test_adding_a_taken_serial_number_conflicts(store):
+    with pytest.raises(ConflictError):
+        store.add(asset('SN-1'))
+    with pytest.raises(ConflictError):
+        store.add_many([asset('SN-6'), asset('SN-6')])
+    assert len(reopened(store)) == 5
+
+
+def test_the_id_of_a_deleted_asset_is_taken(store):
+    # The journal deletes ID 5 again on every load, so a new row with it
+    # would vanish from the next session
+    store.delete('SN-5')
+    with pytest.raises(ConflictError):
+        store.add(dict(asset('SN-NEW'), ID='5'))
+    with pytest.raises(ConflictError):
+        store.add(dict(asset('SN-NEW'), ID='1'))
+
+    row = store.add(dict(asset('SN-NEW'), ID='9'))
+    assert row['ID'] == '9'
+    assert store.add(asset('SN-NEXT'))['ID'] == '10'
+    assert [row['ID'] for row in reopened(store)] == ['1', '2', '3', '4', '9', '10']
+
+
+def test_given_ids_in_one_batch_must_differ(store):
+    with pytest.raises(ConflictError):
+        store.add_many([dict(asset('SN-6'), ID='8'), dict(asset('SN-7'), ID='8')])
+    rows = store.add_many([asset('SN-6'), dict(asset('SN-7'), ID='8')])
+    assert [row['ID'] for row in rows] == ['9', '8']
+    assert [row['ID'] for row in reopened(store)] == ['1', '2', '3', '4', '5', '8', '9']
+
+
+def test_renaming_to_a_taken_serial_number_conflicts(store):
+    with pytest.raises(ConflictError):
+        store.update('SN-1', 'SN', 'SN-2')
+    with pytest.raises(ConflictError):
+        store.update_fields('SN-1', {'LOCATION': 'ANNEX', 'SN': 'SN-2'})
+    assert not os.path.exists(store.journal_path)
+
+
+def test_a_stale_expected_value_conflicts(store):
+    # Another process changed the asset after this one loaded it
+    other = AssetStore(store.path)
+    other.update('SN-1', 'LOCATION', 'ANNEX')
+
+    with pytest.raises(ConflictError):
+        store.update('SN-1', 'LOCATION', 'BRANCH', expected='HQ')
+    assert store.update('SN-1', 'LOCATION', 'BRANCH', expected='ANNEX') == 'ANNEX'
+
+
+def acquired_while_held(held_mode, wanted_mode, path):
+    # Whether another holder gets wanted_mode while the lock is held in held_mode
+    holder, other = FileLock(path), FileLock(path)
+    got = threading.Event()
+
+    def take():
+        with getattr(other, wanted_mode)():
+            got.set()
+
+    with getattr(holder, held_mode)():
+        thread = threading.Thread(target=take)
+        thread.start()
+        result = got.wait(0.2)
+    thread.join()
+    assert got.is_set()
+    return result
+
+
+def test_an_exclusive_lock_waits_for_every_other_holder(workdir):
+    assert not acquired_while_held('exclusive', 'exclusive', 'x.lock')
+    assert not acquired_while_held('shared', 'exclusive', 'x.lock')
+    assert not acquired_while_held('exclusive', 'shared', 'x.lock')
+
+
+@pytest.mark.skipif(fcntl is None, reason="msvcrt locks are always exclusive")
+def test_shared_locks_do_not_wait_for_each_other(workdir):
+    assert acquired_while_held('shared', 'shared', 'x.lock')
+
+
+def test_nested_acquisitions_keep_the_outer_lock(workdir):
+    lock = FileLock('x.lock')
+    with lock.exclusive():
+        with lock.shared():
+            pass
+        # Leaving the inner block did not release the outer lock
+        assert lock._fd is not None
+    assert lock._fd is None
+
+
+def test_processes_adding_at_once_get_distinct_ids(workdir):
+    AssetStore().add(asset('SN-0'))
+    script = ("import sys; sys.path.insert(0, sys.argv[1]); from store import AssetStore; "
+              "store = AssetStore(); "
+              "[store.add({'SN': f'{sys.argv[2]}-{n}', 'CATEGORY': 'LAPTOP'}) for n in range(25)]")
+    workers = [subprocess.Popen([sys.executable, '-c', script, REPO, f'P{n}']) for n in range(4)]
+    assert [worker.wait() for worker in workers] == [0] * 4
+
+    rows = AssetStore().rows()
+    assert len(rows) == 101
+    assert sorted(int(row['ID']) for row in rows) == list(range(1, 102))
@@ -0,0 +1,70 @@
+import builtins
+import re
+import time
+
+import pytest
+
+import metrics
+
+
+@pytest.fixture(autouse=True)
+def fresh(monkeypatch):
+    monkeypatch.setattr(metrics, '_metrics', {name: {} for name in metrics.HELP})
+    monkeypatch.setattr(metrics, '_path', None)
+
+
+def sample(text, line_start):
+    [value] = [line.rsplit(' ', 1)[1] for line in text.splitlines() if line.startswith(line_start)]
+    return float(value)
+
+
+def test_counters_go_to_the_running_operation():
+    with metrics.operation('search'):
+        metrics.rows_scanned(10)
+        metrics.bytes_read(100)
+    metrics.rows_scanned(5)
+
+    text = metrics.render()
+    assert sample(text, 'ams_rows_scanned_total{operation="search"}') == 10
+    assert sample(text, 'ams_rows_scanned_total{operation="background"}') == 5
+    assert sample(text, 'ams_bytes_read_total{operation="search"}') == 100
+    assert 'ams_bytes_written_total' not in text
+
+
+def test_histograms_render_cumulative_buckets():
+    for seconds in (0.0001, 0.003, 0.003, 100):
+        metrics._observe('ams_phase_seconds', 'load', seconds)
+
+    text = metrics.render()
+    assert '# TYPE ams_phase_seconds histogram' in text
+    buckets = re.findall(r'ams_phase_seconds_bucket\{phase="load",le="([^"]+)"\} (\d+)', text)
+    assert len(buckets) == len(metrics.BUCKETS) + 1
+    counts = [int(count) for bound, count in buckets]
+    assert counts == sorted(counts)
+    assert dict(buckets)['0.0005'] == '1' and dict(buckets)['0.005'] == '3'
+    assert buckets[-1] == ('+Inf', '4')
+    assert sample(text, 'ams_phase_seconds_count{phase="load"}') == 4
+    assert sample(text, 'ams_phase_seconds_sum{phase="load"}') == pytest.approx(100.0061)
+
+
+def test_errors_are_counted_and_labels_escaped():
+    with pytest.raises(ValueError):
+        with metrics.operation('say "hi"'):
+            raise ValueError
+    text = metrics.render()
+    assert sample(text, 'ams_operation_errors_total{operation="say \\"hi\\""}') == 1
+
+
+def test_prompts_are_left_out_of_the_latency(monkeypatch):
+    monkeypatch.setattr(builtins, 'input', lambda prompt='': time.sleep(0.2) or 'y')
+    with metrics.operation('delete'):
+        assert metrics.user_input("Sure? ") == 'y'
+    assert sample(metrics.render(), 'ams_operation_seconds_sum{operation="delete"}') < 0.1
+
+
+def test_write_replaces_the_file(workdir):
+    with metrics.operation('list'):
+        pass
+    metrics.write(str(workdir / 'metrics.prom'))
+    assert (workdir / 'metrics.prom').read_text() == metrics.render()
+    assert [path.name for path in workdir.iterdir()] == ['metrics.prom']
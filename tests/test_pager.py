@@ -0,0 +1,49 @@
+from conftest import asset
+from pager import MAX_COLUMN_WIDTH, Pager
+
+
+def rows(count):
+    return [dict(asset(f'SN-{number}'), ID=str(number)) for number in range(1, count + 1)]
+
+
+def counted(source, pulled):
+    for row in source:
+        pulled.append(row)
+        yield row
+
+
+def test_rows_are_read_only_as_far_as_the_page(workdir):
+    pulled = []
+    pager = Pager(counted(rows(100), pulled), page_size=10)
+    number, page = pager.page(1)
+    assert number == 1 and [row['ID'] for row in page] == [str(n) for n in range(11, 21)]
+    # One row past the page, to know whether there is another
+    assert len(pulled) == 21
+    assert pager.page_count() is None
+
+
+def test_pages_past_the_end_show_the_last_one(workdir):
+    pager = Pager(rows(25), page_size=10)
+    number, page = pager.page(7)
+    assert number == 2 and len(page) == 5
+    assert pager.page_count() == 3
+    assert Pager([], page_size=10).page(0) == (0, [])
+
+
+def test_sorting_reads_every_row(workdir):
+    pager = Pager(iter(rows(12)), page_size=5)
+    pager.sort('ID', reverse=True)
+    assert pager.page_count() == 3
+    # IDs sort as numbers, not text
+    assert [row['ID'] for row in pager.page(0)[1]] == ['12', '11', '10', '9', '8']
+
+
+def test_long_values_are_cut_short(workdir):
+    source = rows(2)
+    source[0]['DESCRIPTION'] = 'X' * 100
+    pager = Pager(source, page_size=5)
+    table = pager.render(pager.page(0)[1])
+    assert 'X' * (MAX_COLUMN_WIDTH - 1) + '…' in table
+    assert 'X' * MAX_COLUMN_WIDTH not in table
+    lines = table.splitlines()
+    assert len(lines) == 6 and len({len(line) for line in lines}) == 1
@@ -0,0 +1,84 @@
+import pytest
+
+from query import QueryEngine, QueryError, parse_query
+
+
+def test_parse_conditions():
+    assert parse_query("category=laptop AND location=HQ AND status IN (ACTIVE, 'SPARE')") == [
+        ('CATEGORY', 'eq', 'LAPTOP'),
+        ('LOCATION', 'eq', 'HQ'),
+        ('STATUS', 'in', {'ACTIVE', 'SPARE'}),
+    ]
+
+
+def test_parse_prefix_and_quoted_values():
+    assert parse_query('TYPE=DELL*') == [('TYPE', 'prefix', 'DELL')]
+    assert parse_query('DESCRIPTION="SALT AND PEPPER" AND ASSIGNEE=') == [
+        ('DESCRIPTION', 'eq', 'SALT AND PEPPER'),
+        ('ASSIGNEE', 'eq', ''),
+    ]
+    assert parse_query("LOCATION='HQ OR ANNEX'") == [('LOCATION', 'eq', 'HQ OR ANNEX')]
+
+
+@pytest.mark.parametrize('query', [
+    '',
+    'COLOUR=RED',
+    'LOCATION',
+    'LOCATION=HQ OR LOCATION=ANNEX',
+    'LOCATION=HQ AND',
+    'AND',
+    'STATUS IN ()',
+    'STATUS IN ( )',
+])
+def test_parse_errors(query):
+    with pytest.raises(QueryError):
+        parse_query(query)
+
+
+def test_plan_uses_indexes_and_leaves_the_rest_as_residual(store):
+    engine = QueryEngine(store)
+    ids, residual = engine._plan(parse_query('CATEGORY=MONITOR AND LOCATION=BRANCH AND DESCRIPTION=X'))
+    assert ids == {4}
+    assert residual == [('DESCRIPTION', 'eq', 'X')]
+
+    ids, residual = engine._plan(parse_query('SN IN (SN-1, SN-9, SN-5)'))
+    assert ids == {1, 5}
+    assert residual == []
+
+
+def test_plan_without_an_indexed_column_scans_the_first_predicate(store):
+    engine = QueryEngine(store)
+    ids, residual = engine._plan(parse_query('DESCRIPTION= AND SN=SN-*'))
+    assert ids == {1, 2, 3, 4, 5}
+    assert residual == [('SN', 'prefix', 'SN-')]
+    assert engine._plan([]) == (None, [])
+
+
+@pytest.mark.parametrize('query', [
+    'CATEGORY=MONITOR',
+    'TYPE=DELL*',
+    'LOCATION=BRANCH AND STATUS IN (ACTIVE, SPARE)',
+    'CATEGORY=LAPTOP AND ASSIGNEE=ESTHER MENSAH',
+    'SN=SN-3 AND CATEGORY=LAPTOP',
+    'ID=5 AND TYPE=IPHONE*',
+    'DESCRIPTION=',
+])
+def test_search_matches_a_row_by_row_scan(store, query):
+    predicates = parse_query(query)
+    expected = [row for row in store.rows()
+                if all(row[column] == value if op == 'eq' else
+                       row[column].startswith(value) if op == 'prefix' else
+                       row[column] in value
+                       for column, op, value in predicates)]
+    engine = QueryEngine(store)
+    assert engine.search(query) == expected
+    assert engine.search_page(query, 1, 2) == (len(expected), expected[1:3])
+
+
+def test_indexes_follow_the_store(store):
+    engine = QueryEngine(store)
+    assert [row['SN'] for row in engine.search('LOCATION=BRANCH')] == ['SN-2', 'SN-4']
+    store.update('SN-1', 'LOCATION', 'BRANCH')
+    store.delete('SN-2')
+    store.add({'SN': 'SN-6', 'LOCATION': 'BRANCH'})
+    assert [row['SN'] for row in engine.search('LOCATION=BRANCH')] == ['SN-1', 'SN-4', 'SN-6']
@@ -0,0 +1,40 @@
+import re
+import zlib
+
+from conftest import asset
+from report import CHUNK_ROWS, ROWS_PER_PAGE, build_report
+
+
+def rows(count):
+    return [dict(asset(f'SN-{number}', description='CHARGER (65W)'), ID=str(number))
+            for number in range(1, count + 1)]
+
+
+def test_one_page_per_rows_per_page(workdir):
+    assert build_report(rows(ROWS_PER_PAGE * 2 + 1), 'report.pdf', title='T') == 3
+    assert build_report([], 'empty.pdf', title='T') == 1
+
+
+def test_the_file_is_a_valid_pdf(workdir):
+    build_report(rows(5), 'report.pdf', title='Assets')
+    with open('report.pdf', 'rb') as pdf_file:
+        data = pdf_file.read()
+
+    assert data.startswith(b'%PDF-1.4') and data.endswith(b'%%EOF\n')
+    # Every xref entry points at its object
+    xref = int(re.search(rb'startxref\n(\d+)', data).group(1))
+    entries = re.findall(rb'(\d{10}) 00000 n', data[xref:])
+    for obj_id, offset in enumerate(entries, start=1):
+        assert data[int(offset):].startswith(b'%d 0 obj' % obj_id)
+    stream = re.search(rb'stream\n(.*?)\nendstream', data, re.S).group(1)
+    text = zlib.decompress(stream).decode('latin-1')
+    # Brackets in values are escaped
+    assert 'CHARGER \\(65W\\)' in text and 'Page 1' in text
+    assert not (workdir / 'report.pdf.tmp').exists()
+
+
+def test_worker_processes_write_the_same_file(workdir):
+    source = rows(CHUNK_ROWS + 10)
+    pages = build_report(source, 'serial.pdf', title='T', workers=1)
+    assert build_report(source, 'parallel.pdf', title='T', workers=2) == pages
+    assert (workdir / 'serial.pdf').read_bytes() == (workdir / 'parallel.pdf').read_bytes()
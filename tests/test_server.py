@@ -0,0 +1,135 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from main import UserManager
+from server import AssetServer
+from storage import CsvBackend
+from store import AssetStore, ConflictError
+
+
+def reopened(store):
+    return AssetStore(store.path).rows()
+
+
+def test_a_multi_field_update_is_all_or_nothing(store):
+    with pytest.raises(ConflictError):
+        store.update_fields('SN-1', {'LOCATION': 'ANNEX', 'STATUS': 'SPARE'},
+                            expected={'LOCATION': 'HQ', 'STATUS': 'RETIRED'})
+    assert reopened(store)[0]['LOCATION'] == 'HQ'
+
+    row, old_values = store.update_fields('SN-1', {'LOCATION': 'ANNEX', 'STATUS': 'SPARE'},
+                                          expected={'LOCATION': 'HQ', 'STATUS': 'ACTIVE'})
+    assert old_values == {'LOCATION': 'HQ', 'STATUS': 'ACTIVE'}
+    assert (row['LOCATION'], row['STATUS']) == ('ANNEX', 'SPARE')
+    assert reopened(store)[0] == row
+
+
+@pytest.fixture
+def server(store):
+    backend = CsvBackend()
+    user_manager = UserManager(backend, hash_iterations=1000)
+    user_manager.create_account('alice', 'secret')
+    server = AssetServer(backend, user_manager)
+    yield server
+    server.close()
+
+
+async def request(port, method, path, body=None, token=None):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    payload = json.dumps(body).encode() if body is not None else b''
+    head = f"{method} {path} HTTP/1.1\r\nContent-Length: {len(payload)}\r\nConnection: close\r\n"
+    if token:
+        head += f"Authorization: Bearer {token}\r\n"
+    writer.write(head.encode() + b"\r\n" + payload)
+    status = int((await reader.readline()).split()[1])
+    response = await reader.read()
+    writer.close()
+    return status, json.loads(response.split(b'\r\n\r\n', 1)[1])
+
+
+def serving(server, client):
+    # Runs client(port, token) against the server on an ephemeral port
+    async def main():
+        listener = await asyncio.start_server(server.handle_connection, '127.0.0.1', 0)
+        port = listener.sockets[0].getsockname()[1]
+        async with listener:
+            status, body = await request(port, 'POST', '/login', {'username': 'alice', 'password': 'secret'})
+            assert status == 200
+            return await client(port, body['token'])
+    return asyncio.run(main())
+
+
+def test_sessions(server):
+    async def client(port, token):
+        assert (await request(port, 'POST', '/login', {'username': 'alice', 'password': 'wrong'}))[0] == 401
+        assert (await request(port, 'POST', '/login', {'username': 'bob', 'password': 'secret'}))[0] == 401
+        assert (await request(port, 'GET', '/assets'))[0] == 401
+        assert (await request(port, 'GET', '/assets', token=token))[1]['total'] == 5
+        assert (await request(port, 'POST', '/logout', token=token))[0] == 200
+        assert (await request(port, 'GET', '/assets', token=token))[0] == 401
+    serving(server, client)
+
+
+def test_asset_operations(server):
+    async def client(port, token):
+        status, body = await request(port, 'POST', '/assets', {'sn': 'abc123', 'location': 'hq'}, token)
+        assert (status, body['ID'], body['ASSIGNEE']) == (201, 6, 'NOT ASSIGNED')
+        assert (await request(port, 'POST', '/assets', {'SN': 'ABC123'}, token))[0] == 409
+
+        status, body = await request(port, 'GET', '/assets?q=LOCATION=BRANCH&sort=-ID&page_size=1', token=token)
+        assert (body['total'], [row['SN'] for row in body['assets']]) == (2, ['SN-4'])
+
+        status, body = await request(port, 'PATCH', '/assets/abc123',
+                                     {'location': 'annex', 'expected': {'LOCATION': 'HQ'}}, token)
+        assert (status, body['LOCATION']) == (200, 'ANNEX')
+        assert (await request(port, 'PATCH', '/assets/ABC123',
+                              {'LOCATION': 'HQ', 'expected': {'LOCATION': 'HQ'}}, token))[0] == 409
+
+        status, body = await request(port, 'GET', '/summary?by=location', token=token)
+        assert body['groups'][0] == {'LOCATION': 'HQ', 'COUNT': 3}
+        assert (await request(port, 'DELETE', '/assets/ABC123', token=token))[0] == 200
+        assert (await request(port, 'GET', '/assets/ABC123', token=token))[0] == 404
+        status, body = await request(port, 'GET', '/changes?since=0', token=token)
+        assert [change['op'] for change in body['changes']] == ['create', 'update', 'delete']
+    serving(server, client)
+    assert AssetStore().get('ABC123') is None
+
+
+@pytest.mark.parametrize('patch', [{'LOCATION': None}, {'LOCATION': 7}, {'SN': ''}, {'SN': '  '},
+                                   {'LOCATION': 'ANNEX', 'expected': {'LOCATION': None}},
+                                   {'ID': '9'}, {'COLOUR': 'RED'}, {}])
+def test_a_bad_patch_changes_nothing(server, patch):
+    async def client(port, token):
+        return await request(port, 'PATCH', '/assets/SN-1', patch, token)
+    status, body = serving(server, client)
+    assert status == 400
+    assert AssetStore().get('SN-1') == server.store.rows()[0]
+    assert AssetStore().get('SN-1')['LOCATION'] == 'HQ'
+
+
+def test_the_event_loop_keeps_serving_while_the_store_is_busy(server):
+    # As when the compactor thread holds the store for a full CSV rewrite
+    held, release = threading.Event(), threading.Event()
+
+    def compactor():
+        with server.store._lock:
+            held.set()
+            release.wait(5)
+
+    async def client(port, token):
+        thread = threading.Thread(target=compactor)
+        thread.start()
+        held.wait(5)
+        try:
+            waiting = asyncio.ensure_future(request(port, 'GET', '/assets/SN-1', token=token))
+            status, _ = await asyncio.wait_for(request(port, 'GET', '/assets'), 5)
+            assert status == 401
+            assert not waiting.done()
+        finally:
+            release.set()
+            thread.join()
+        return await asyncio.wait_for(waiting, 5)
+    assert serving(server, client)[0] == 200
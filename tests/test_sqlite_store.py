@@ -0,0 +1,160 @@
+import sqlite3
+
+import pytest
+
+from conftest import asset
+from sqlite_store import SqliteUserStore
+from storage import CsvBackend, SqliteBackend, migrate_csv_to_sqlite
+from store import ConflictError
+from summary import SUMMARY_FIELDS
+
+
+@pytest.fixture
+def backend(workdir):
+    backend = SqliteBackend('assets.db')
+    backend.assets.add_many([
+        asset('SN-1', description='SPARE CHARGER INCLUDED'),
+        asset('SN-2', location='BRANCH', assignee='ESTHER MENSAH'),
+        asset('SN-3', category='MONITOR', type='DELL P2422H'),
+        asset('SN-4', category='MONITOR', type='HP E24', location='BRANCH', status='SPARE'),
+        asset('SN-5', category='PHONE', type='IPHONE 13', status='RETIRED'),
+    ])
+    yield backend
+    backend.close()
+
+
+def counted(store):
+    counts = {}
+    for row in store.rows():
+        key = tuple(row[field] for field in SUMMARY_FIELDS)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def test_rows_read_like_the_csv_store(backend):
+    store = backend.assets
+    assert len(store) == 5
+    assert store.get('SN-3') == dict(asset('SN-3', category='MONITOR', type='DELL P2422H'), ID='3')
+    assert store.get_by_id('2')['SN'] == 'SN-2'
+    assert [row['SN'] for row in store.get_many_by_id([4, 9, 1])] == ['SN-4', 'SN-1']
+    assert store.existing_serials(['SN-1', 'SN-9']) == {'SN-1'}
+    assert store.next_id() == 6
+
+
+def test_another_connection_sees_every_write(backend):
+    backend.assets.update('SN-1', 'LOCATION', 'ANNEX')
+    backend.assets.delete('SN-2')
+    other = SqliteBackend('assets.db')
+    try:
+        assert other.assets.rows() == backend.assets.rows()
+        assert [row['SN'] for row in other.assets.rows()] == ['SN-1', 'SN-3', 'SN-4', 'SN-5']
+    finally:
+        other.close()
+
+
+def test_conflicts(backend):
+    store = backend.assets
+    with pytest.raises(ConflictError):
+        store.add(asset('SN-1'))
+    with pytest.raises(ConflictError):
+        store.update('SN-1', 'SN', 'SN-2')
+    with pytest.raises(ConflictError):
+        store.update('SN-1', 'LOCATION', 'ANNEX', expected='BRANCH')
+    with pytest.raises(ConflictError):
+        store.update_fields('SN-1', {'LOCATION': 'ANNEX', 'STATUS': 'SPARE'}, expected={'STATUS': 'RETIRED'})
+    assert store.get('SN-1')['LOCATION'] == 'HQ'
+    assert len(store) == 5
+
+
+def test_the_id_cannot_be_changed(backend):
+    with pytest.raises(ValueError):
+        backend.assets.update('SN-1', 'ID', '99')
+    with pytest.raises(ValueError):
+        backend.assets.update_fields('SN-1', {'ID': '99'})
+    with pytest.raises(KeyError):
+        backend.assets.update('SN-1', 'COLOUR', 'RED')
+    assert backend.assets.get_by_id('1')['SN'] == 'SN-1'
+
+
+def test_batch_writes_are_one_transaction(backend):
+    updated = backend.assets.update_many(['SN-1', 'SN-9', 'SN-3', 'SN-1'], {'STATUS': 'SPARE'})
+    assert [(row['SN'], old) for row, old in updated] == [('SN-1', {'STATUS': 'ACTIVE'}),
+                                                         ('SN-3', {'STATUS': 'ACTIVE'})]
+    assert [row['SN'] for row in backend.assets.delete_many(['SN-4', 'SN-9', 'SN-5'])] == ['SN-4', 'SN-5']
+    assert [row['STATUS'] for row in backend.assets.rows()] == ['SPARE', 'ACTIVE', 'SPARE']
+
+
+def test_the_summary_table_follows_every_write(backend):
+    store = backend.assets
+    store.add(asset('SN-6', location='ANNEX'))
+    store.update('SN-1', 'LOCATION', 'ANNEX')
+    store.update_many(['SN-2', 'SN-3'], {'STATUS': 'SPARE'})
+    store.delete('SN-5')
+
+    assert backend.summary.counts() == counted(store)
+    assert backend.summary.total() == 5
+    assert backend.summary.group_by('location') == [(('ANNEX',), 2), (('BRANCH',), 2), (('HQ',), 1)]
+
+
+def test_queries(backend):
+    engine = backend.query_engine()
+    assert engine is backend.query_engine()
+    assert [row['SN'] for row in engine.search('CATEGORY=MONITOR AND LOCATION IN (BRANCH, HQ)')] == ['SN-3', 'SN-4']
+    assert [row['SN'] for row in engine.search('TYPE=DELL*')] == ['SN-1', 'SN-2', 'SN-3']
+    assert [row['SN'] for row in engine.search('ID=1*')] == ['SN-1']
+    assert engine.search_page('STATUS=ACTIVE', 1, 2) == (3, backend.assets.rows()[1:3])
+
+
+def test_fulltext_follows_every_write(backend):
+    def found(text):
+        return [row['SN'] for row, score in backend.fulltext.search(text)]
+
+    assert found('charger') == ['SN-1']
+    assert found('esther') == ['SN-2']
+    backend.assets.update('SN-3', 'DESCRIPTION', 'CHARGER MISSING')
+    backend.assets.delete('SN-1')
+    assert found('charger') == ['SN-3']
+    # Too short for the trigram index: found by a scan instead
+    assert found('hp') == ['SN-4']
+    assert found('the') == []
+
+
+def test_migrate_copies_assets_and_users(store, workdir):
+    store.update('SN-1', 'LOCATION', 'ANNEX')
+    store.delete('SN-2')
+    CsvBackend().users.add('alice', 'hash')
+
+    assert migrate_csv_to_sqlite() == (4, 1)
+    target = SqliteBackend('assets.db')
+    try:
+        assert target.assets.rows() == store.rows()
+        assert target.users.get('alice') == 'hash'
+        assert target.summary.counts() == counted(store)
+        # A copy, not a change
+        assert target.changes.last_seq() == 0
+    finally:
+        target.close()
+
+    with pytest.raises(ValueError):
+        migrate_csv_to_sqlite()
+
+
+def test_a_failed_migration_leaves_the_database_empty(store, workdir, monkeypatch):
+    CsvBackend().users.add('alice', 'hash')
+
+    def fail(self, username, hashed_password):
+        raise sqlite3.OperationalError("disk I/O error")
+
+    with monkeypatch.context() as patch:
+        patch.setattr(SqliteUserStore, 'add', fail)
+        with pytest.raises(sqlite3.OperationalError):
+            migrate_csv_to_sqlite()
+
+    target = SqliteBackend('assets.db')
+    try:
+        assert len(target.assets) == 0
+        assert target.summary.total() == 0
+    finally:
+        target.close()
+    # And it can simply be run again
+    assert migrate_csv_to_sqlite() == (5, 1)
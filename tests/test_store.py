@@ -0,0 +1,92 @@
+import os
+
+from conftest import asset
+from store import AssetStore
+
+
+def reopened(store):
+    # What another process reading the same files sees
+    return AssetStore(store.path).rows()
+
+
+def read(path):
+    with open(path) as f:
+        return f.read()
+
+
+def test_updates_and_deletes_go_to_the_journal(store):
+    csv_before = read(store.path)
+    store.update('SN-1', 'LOCATION', 'ANNEX')
+    store.delete('SN-2')
+
+    assert read(store.path) == csv_before
+    assert os.path.exists(store.journal_path)
+    rows = reopened(store)
+    assert [row['SN'] for row in rows] == ['SN-1', 'SN-3', 'SN-4', 'SN-5']
+    assert rows[0]['LOCATION'] == 'ANNEX'
+    assert rows == store.rows()
+
+
+def test_replay_skips_a_torn_last_line(store):
+    store.update('SN-1', 'STATUS', 'SPARE')
+    with open(store.journal_path, 'a') as journal:
+        journal.write('{"op": "delete", "id"')
+
+    assert reopened(store) == store.rows()
+
+
+def test_compaction_folds_the_journal_into_the_csv(store):
+    store.update('SN-3', 'ASSIGNEE', 'KOFI')
+    store.delete('SN-4')
+    rows = store.rows()
+
+    assert store.compact()
+    assert not os.path.exists(store.journal_path)
+    assert reopened(store) == rows
+    # Nothing left to fold
+    assert not store.compact()
+    assert reopened(store) == rows
+
+
+def test_replaying_a_journal_over_its_compacted_csv_changes_nothing(store):
+    # A crash between the rename and removing the journal
+    store.update('SN-1', 'SN', 'SN-1A')
+    store.update('SN-4', 'STATUS', 'ACTIVE')
+    store.delete('SN-3')
+    journal = read(store.journal_path)
+    rows = store.rows()
+    store.compact()
+
+    with open(store.journal_path, 'w') as f:
+        f.write(journal)
+    assert reopened(store) == rows
+
+
+def test_compaction_past_the_threshold_runs_in_the_background(workdir):
+    store = AssetStore(compact_threshold=1)
+    store.add_many([asset('SN-1'), asset('SN-2')])
+    store.update('SN-1', 'COLOR', 'SILVER')
+    store.wait_for_compaction()
+
+    assert not os.path.exists(store.journal_path)
+    assert reopened(store) == store.rows()
+    assert store.rows()[0]['COLOR'] == 'SILVER'
+
+
+def test_ids_of_deleted_assets_are_not_handed_out_again(store):
+    store.delete('SN-5')
+    store.compact()
+
+    # A fresh process agrees with this one straight after the compaction
+    assert AssetStore(store.path).next_id() == store.next_id() == 6
+    assert store.compact() is False
+    assert AssetStore(store.path).next_id() == 6
+    assert AssetStore(store.path).add(asset('SN-6'))['ID'] == '6'
+
+
+def test_compaction_keeps_no_journal_when_the_last_id_is_live(store):
+    store.delete('SN-2')
+    store.compact()
+
+    assert not os.path.exists(store.journal_path)
+    assert AssetStore(store.path).next_id() == 6
@@ -0,0 +1,129 @@
+import json
+import os
+
+import pytest
+
+from conftest import asset
+from store import AssetStore
+from summary import SUMMARY_FIELDS, InventorySummary
+
+
+def counted(store):
+    # The counts InventorySummary should hold, from the rows themselves
+    counts = {}
+    for row in store.rows():
+        key = tuple(row[field] for field in SUMMARY_FIELDS)
+        counts[key] = counts.get(key, 0) + 1
+    return counts
+
+
+def no_scan(summary, monkeypatch):
+    def scan():
+        raise AssertionError("the counts were rebuilt instead of read from the files")
+    monkeypatch.setattr(summary, '_scan', scan)
+
+
+def test_counts_follow_every_write(store):
+    summary = InventorySummary(store)
+    assert summary.counts() == counted(store)
+
+    store.add(asset('SN-6', location='ANNEX'))
+    store.update('SN-1', 'STATUS', 'SPARE')
+    store.update_many(['SN-2', 'SN-3'], {'LOCATION': 'ANNEX'})
+    store.delete('SN-4')
+    assert summary.counts() == counted(store)
+    assert summary.total() == 5
+    assert summary.group_by('location') == [(('ANNEX',), 3), (('HQ',), 2)]
+
+
+def test_another_process_reads_the_snapshot_and_log(store, monkeypatch):
+    InventorySummary(store).counts()
+    store.update('SN-1', 'LOCATION', 'ANNEX')
+    store.delete('SN-5')
+
+    other = InventorySummary(AssetStore(store.path))
+    no_scan(other, monkeypatch)
+    assert other.counts() == counted(store)
+
+
+def test_a_write_without_the_summary_breaks_the_chain(store):
+    summary = InventorySummary(store)
+    summary.counts()
+    # A process that changes the assets without keeping the summary
+    AssetStore(store.path).update('SN-1', 'CATEGORY', 'TABLET')
+
+    other = InventorySummary(AssetStore(store.path))
+    assert other.counts() == counted(store)
+    assert summary.counts() == counted(store)
+
+
+@pytest.mark.parametrize('damage', ['remove', 'garble', 'other fields'])
+def test_a_missing_or_unusable_snapshot_is_rebuilt(store, damage):
+    summary = InventorySummary(store)
+    summary.counts()
+    store.update('SN-2', 'STATUS', 'RETIRED')
+
+    if damage == 'remove':
+        os.remove(summary.path)
+    elif damage == 'garble':
+        with open(summary.path, 'w') as snapshot_file:
+            snapshot_file.write('{"fields": ')
+    else:
+        with open(summary.path) as snapshot_file:
+            snapshot = json.load(snapshot_file)
+        snapshot['fields'] = SUMMARY_FIELDS[:2]
+        with open(summary.path, 'w') as snapshot_file:
+            json.dump(snapshot, snapshot_file)
+
+    other = InventorySummary(AssetStore(store.path))
+    assert other.counts() == counted(store)
+    # The rebuild saved a snapshot the next reader can use
+    with open(other.path) as snapshot_file:
+        assert json.load(snapshot_file)['fields'] == SUMMARY_FIELDS
+
+
+def test_a_torn_log_line_is_not_applied(store):
+    summary = InventorySummary(store)
+    summary.counts()
+    store.update('SN-3', 'LOCATION', 'ANNEX')
+    with open(summary.log_path, 'a') as log:
+        log.write('{"base": ')
+
+    assert InventorySummary(AssetStore(store.path)).counts() == counted(store)
+
+
+def test_compaction_keeps_the_chain(store, monkeypatch):
+    InventorySummary(store).counts()
+    store.update('SN-1', 'ASSIGNEE', 'KOFI')
+    store.compact()
+
+    other = InventorySummary(AssetStore(store.path))
+    no_scan(other, monkeypatch)
+    assert other.counts() == counted(store)
+
+
+def test_a_report_reads_the_files_without_loading_the_store(store):
+    InventorySummary(store).counts()
+    store.update('SN-1', 'LOCATION', 'ANNEX')
+    store.add(asset('SN-6'))
+
+    reader = AssetStore(store.path)
+    assert InventorySummary(reader).counts() == counted(store)
+    assert not reader.loaded
+
+
+def test_a_report_loads_the_store_when_the_files_are_behind(store):
+    InventorySummary(store).counts()
+    # Changed by a process without the summary
+    AssetStore(store.path).update('SN-1', 'LOCATION', 'ANNEX')
+
+    reader = AssetStore(store.path)
+    assert InventorySummary(reader).counts() == counted(store)
+    assert reader.loaded
+
+
+def test_the_snapshot_has_no_total(store):
+    summary = InventorySummary(store)
+    summary.counts()
+    with open(summary.path) as snapshot_file:
+        assert 'total' not in json.load(snapshot_file)
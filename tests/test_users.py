@@ -0,0 +1,49 @@
+import hashlib
+
+import pytest
+
+from main import UserManager
+from storage import CsvBackend
+from store import CsvUserStore
+
+
+@pytest.fixture
+def users(workdir):
+    manager = UserManager(CsvBackend(), hash_iterations=1000)
+    yield manager
+    manager.executor.shutdown()
+
+
+def test_passwords_are_salted_pbkdf2(users):
+    first, second = users.hash_password('secret'), users.hash_password('secret')
+    assert first.startswith('pbkdf2_sha256$1000$')
+    assert first != second
+    assert users.verify_password(first, 'secret')
+    assert not users.verify_password(first, 'Secret')
+
+
+def test_legacy_sha256_hashes_still_verify(users):
+    legacy = hashlib.sha256(b'secret').hexdigest()
+    assert users.verify_password(legacy, 'secret')
+    assert not users.verify_password(legacy, 'wrong')
+
+
+def test_create_account_and_login(users):
+    assert users.create_account('alice', 'secret')
+    assert not users.create_account('alice', 'other')
+    assert users.login('alice', 'secret')
+    assert not users.login('alice', 'other')
+    assert users.login_async('alice', 'secret').result()
+    # Another process reads the same file
+    assert CsvUserStore('user_data.csv').get('alice').startswith('pbkdf2_sha256$1000$')
+
+
+def test_an_unknown_user_costs_a_hash_too(users, monkeypatch):
+    users.create_account('alice', 'secret')
+    hashed = []
+    hash_password = users.hash_password
+    monkeypatch.setattr(users, 'hash_password', lambda *args, **kwargs: hashed.append(kwargs) or hash_password(*args, **kwargs))
+
+    assert not users.login('bob', 'secret')
+    assert not users.login('alice', 'wrong')
+    assert [kwargs['iterations'] for kwargs in hashed] == [1000, 1000]